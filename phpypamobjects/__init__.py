@@ -1,4 +1,15 @@
 from .ipamScanAgent import ipamScanAgent
 from .ipamSubnet import ipamSubnet
 from .ipamAddress import ipamAddress, ipamTags
-from .ipamServer import ipamServer
\ No newline at end of file
+from .ipamFreeSpace import ipamFreeSpace, ipamFreeSpaceArray, ipamFreePoolIndex
+from .ipamSubnetIndex import ipamSubnetIndex
+from .ipamCache import ipamCache
+from .ipamStats import ipamStats, ipamSpan
+from .ipamSnapshot import ipamSnapshot
+from .ipamAddressTable import ipamAddressTable
+from .ipamBatch import ipamWriteBatch
+from .ipamHeartbeat import ipamHeartbeat
+from .ipamReport import ipamReport
+from .ipamServer import ipamServer
+from .ipamSync import ipamSync
+from .ipamAsyncServer import ipamAsyncServer
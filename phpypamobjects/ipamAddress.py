@@ -3,9 +3,39 @@
 
 from .ipamSubnet import ipamSubnet
 
+import socket
 from ipaddress import IPv4Address, IPv6Address, ip_address
 from datetime import datetime
-from typing import Optional, Union, Dict, Any
+from typing import Optional, Union, Dict, Any, Tuple
+
+# Original value of a field that did not exist
+_ABSENT = object()
+
+def _sameValue(current:Any, value:Any) -> bool:
+    """Check if a field already has a value. The service returns numbers as strings and empty fields as null,
+    so values are also compared as text."""
+    if current is _ABSENT or value is _ABSENT:
+        return current is value
+    return current == value or ('' if current is None else str(current)) == ('' if value is None else str(value))
+
+def parseIP(value:Any, canonical:bool = True) -> Optional[Tuple[int, int]]:
+    """Parse an IP address given as a string, without building address objects for IPv4 addresses.
+    :param canonical: Only accept addresses written in canonical form, so the string can be rebuilt from the result.
+    :return: A tuple (version, integer value) or None for other values."""
+    if not isinstance(value, str):
+        return None
+    try:
+        # Fast path for IPv4 addresses
+        packed = socket.inet_pton(socket.AF_INET, value)
+        if not canonical or socket.inet_ntop(socket.AF_INET, packed) == value:
+            return 4, int.from_bytes(packed, 'big')
+    except OSError:
+        pass
+    try:
+        ip = ip_address(value)
+    except ValueError:
+        return None
+    return (ip.version, int(ip)) if not canonical or str(ip) == value else None
 
 class ipamTags:
     TAG_offline = 1
@@ -18,13 +48,24 @@ class ipamTags:
     TAG_notusable = 8
 
 class ipamAddress:
-    """This object wraps a JSON dictionary representing a phpIPAM IP address either returned by phpypam or created to insert a new IP address."""
+    """This object wraps a JSON dictionary representing a phpIPAM IP address either returned by phpypam or created to insert a new IP address.
+    The IP address and the last seen date are parsed on first access and cached until the field changes."""
+    __slots__ = ('_addr', '_orig', '_ipRaw', '_ip', '_ipInt', '_ipVersion', '_seenRaw', '_seen')
+
     def __init__(self, addr:dict = None, ip:Union[IPv4Address, IPv6Address] = None, subnet:ipamSubnet = None) -> None: # type: ignore
         """Creates a new object. The object is initialized either with a dictionary returned by phpypam or with an IP and subnet identifier.
         :param addr: A JSON dictionary returned by phpypam.
         :param ip: An IP address.
         :param subnet: An ipamSubnet object representing a phpIPAM subnet object."""
-        self._updated = set()
+        # Original values of the fields modified since the last write to the service
+        self._orig:Dict[str, Any] = {}
+        # Parsed values of fields and the raw values they were parsed from (version 0 if not parsed yet)
+        self._ipRaw:Optional[str] = None
+        self._ip:Union[IPv4Address, IPv6Address, None] = None
+        self._ipInt:int = 0
+        self._ipVersion:int = 0
+        self._seenRaw:Optional[str] = None
+        self._seen:Optional[datetime] = None
         if addr:
             self._addr:dict = addr
         elif ip:
@@ -41,11 +82,14 @@ class ipamAddress:
         return self._addr.get(field, default)
         
     def getFieldInt(self, field:str, default:int=0) -> int:
-        """Get any field of the JSON object.
+        """Get any field of the JSON object as an integer. The service may return numbers as strings.
         :param field: The identifier of the field to return.
-        :return: The value of the field."""        
+        :return: The value of the field, or the default value if it is empty or not a number."""        
         value = self._addr.get(field,default)
-        return value
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return default
 
     def updateField(self, field:str, value:Any, force:bool=False):
         """Set any field of the JSON object.
@@ -53,6 +97,9 @@ class ipamAddress:
         :param force: Force update ignoring protection rules.
         :return: The value of the field."""        
 
+        # Setting the current value is not a modification, even for protected addresses
+        if _sameValue(self._addr.get(field, _ABSENT), value):
+            return
         if not force:
             # Filter avoid updating fields if address is blocked for api
             if self.getFieldInt('custom_apiblock') == 1:
@@ -61,24 +108,75 @@ class ipamAddress:
             if (self.getFieldInt('tag') > ipamTags.TAG_used or self.getFieldInt('is_gateway') == 1 ) and (field != 'lastSeen' and field != 'custom_tcpports' and field != 'mac'):
                 raise PermissionError(f"Address {self._addr.get('ip')} has type >=2(RESERVED) or isgateway: can't update field {field}")
 
-        if self._addr.get(field) != value:
+        self._setField(field, value)
+
+    def hasValue(self, field:str, value:Any) -> bool:
+        """Check if a field already has a value. Values are also compared as text, so '8' is the same value as 8 and None the same value as ''.
+        :param field: The identifier of the field to check.
+        :param value: The value to compare."""
+        return _sameValue(self._addr.get(field, _ABSENT), value)
+
+    def _setField(self, field:str, value:Any) -> None:
+        """Set a field keeping its original value for computing the changes. Setting the current value is not a change."""
+        if not _sameValue(self._addr.get(field, _ABSENT), value):
+            if field not in self._orig:
+                self._orig[field] = self._addr.get(field, _ABSENT)
             self._addr[field] = value
-            self._updated.add(field)
+
+    def getChanges(self) -> Dict[str, Any]:
+        """Get the fields whose values differ from the values read from or last written to the service.
+        Fields set back to their original values are not included.
+        :return: A dictionary with the new values of the modified fields."""
+        return {field: self._addr.get(field) for field, orig in self._orig.items() if not _sameValue(self._addr.get(field, _ABSENT), orig)}
+
+    def hasChanges(self) -> bool:
+        """Check if any field has been modified since the address was read from or last written to the service."""
+        return bool(self.getChanges())
+
+    def clearChanges(self, written:Optional[Dict[str, Any]] = None) -> None:
+        """Forget the changes after they have been written to the service.
+        :param written: The fields written. If a field has been modified again after being written, it is kept as changed.
+            By default, all the changes are forgotten."""
+        if written is None:
+            self._orig = {}
+            return
+        for field, value in written.items():
+            if _sameValue(self._addr.get(field, _ABSENT), value):
+                self._orig.pop(field, None)
+            elif field in self._orig:
+                self._orig[field] = value
 
     def getId(self) -> Optional[int]:
         return self._addr.get('id')
     
+    def _parseIP(self) -> None:
+        raw = self._addr.get('ip')
+        if self._ipVersion == 0 or raw != self._ipRaw:
+            ip = ip_address(raw) # type: ignore
+            self._ipRaw, self._ip, self._ipInt, self._ipVersion = raw, ip, int(ip), ip.version
+
     def getIP(self) -> Union[IPv4Address, IPv6Address]:
-        return ip_address(self._addr.get('ip')) # type: ignore
+        self._parseIP()
+        return self._ip # type: ignore
+
+    def getIPInt(self) -> int:
+        """Get the integer value of the IP address."""
+        self._parseIP()
+        return self._ipInt
+
+    def getVersion(self) -> int:
+        """Get the version (4 or 6) of the IP address."""
+        self._parseIP()
+        return self._ipVersion
     
     def setIP(self, ip:IPv4Address):
-        self._addr['ip'] = str(ip)
+        self._setField('ip', str(ip))
     
     def getSubnetId(self) -> Optional[int]:
         return self._addr.get('subnetId')
     
     def setSubnetId(self, subnetid):
-        self._addr['subnetId'] = subnetid
+        self._setField('subnetId', subnetid)
     
     def getDictionary(self) -> Dict[str,Any]:
         return self._addr
@@ -101,13 +199,13 @@ class ipamAddress:
         return value if value else ''
 
     def setNote(self, value):
-        self._addr['note'] = value
+        self._setField('note', value)
     
     def setState(self, value, force=False):
         self.updateField('state', value, force=force)
     
     def setAgentId(self, value):
-        self._addr['custom_scanagentid'] = value
+        self._setField('custom_scanagentid', value)
     
     def getMAC(self) -> str:
         return self.getField('mac','') # type: ignore
@@ -147,18 +245,30 @@ class ipamAddress:
 
     def getLastSeen(self) -> Optional[datetime]:
         value = self.getField('lastSeen','')
-        if value:
+        if not value:
+            return None
+        if value != self._seenRaw:
             ts = datetime.fromisoformat(value)
             if not ts.tzname():
                 ts = ts.astimezone()
-            return ts
-        else:
-            return None
+            self._seenRaw, self._seen = value, ts
+        return self._seen
 
-    def updateLastSeen(self, force=False):
-        """Updates the last date in which it answered a ping."""
-        if self.getFieldInt('excludePing') == 0:
-            self.updateField('lastSeen', datetime.now().isoformat(), force=force)
+    def updateLastSeen(self, force=False, minInterval:float = 0.0) -> bool:
+        """Updates the last date in which it answered a ping.
+        :param minInterval: Seconds the last seen date is kept if it is newer than that. Zero always updates it.
+        :return: True if the date has been updated."""
+        if self.getFieldInt('excludePing') != 0:
+            return False
+        if minInterval > 0:
+            try:
+                last = self.getLastSeen()
+            except ValueError:
+                last = None
+            if last is not None and (datetime.now().astimezone() - last).total_seconds() < minInterval:
+                return False
+        self.updateField('lastSeen', datetime.now().isoformat(), force=force)
+        return True
 
     def cleareLastSeen(self, force=False):
         """Updates the last date in which it answered a ping."""
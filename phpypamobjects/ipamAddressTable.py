@@ -0,0 +1,246 @@
+#!/usr/bin/python3
+"""This file provides a columnar container of phpIPAM IP addresses for vectorized filtering, grouping and sorting."""
+
+import socket, warnings
+from datetime import datetime, timedelta
+from ipaddress import IPv4Address, IPv6Address, IPv4Network, IPv6Network
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Union
+
+import numpy as np
+
+from .ipamAddress import ipamAddress, parseIP
+from .ipamQuery import ipamQuery
+
+_LOW64 = (1 << 64) - 1
+_EPOCH = datetime(1970, 1, 1)
+
+# Fields stored as typed columns
+_INT_FIELDS = ('id', 'subnetId', 'tag', 'state')
+
+class ipamAddressTable:
+    """This object stores IP addresses returned by phpIPAM as columns of NumPy arrays:
+        - 'ipHi', 'ipLo' (uint64) and 'version' (uint8, 0 if the address is invalid) for the IP address.
+        - 'id', 'subnetId', 'tag' and 'state' as int64 (-1 if the field is missing or not a number).
+        - 'lastSeen' as float64 POSIX timestamps (NaN if the address has never been seen).
+    Other fields are available as object arrays built on first use. Filters, sorting and grouping return new tables
+    and ipamAddress objects are only created when rows are accessed.
+
+        table = ipam.findIPsbyNet(sn, asTable=True)
+        stale = table.filter((table.column('tag') == ipamTags.TAG_used) & (table.age() > 30*86400))
+        for a in stale:
+            print(a, a.getHostname())
+    """
+    def __init__(self, rows:Iterable[Dict[str, Any]] = ()) -> None:
+        """Creates a table from the dictionaries of the addresses returned by phpypam.
+        :param rows: The dictionaries of the addresses. They are shared with the ipamAddress objects created from the table."""
+        self._rows:List[Dict[str, Any]] = list(rows)
+        # Fill the values of every typed column in a single pass over the rows
+        versions:List[int] = []
+        values:List[int] = []
+        ids:List[int] = []
+        subnetIds:List[int] = []
+        tags:List[int] = []
+        states:List[int] = []
+        lastSeen:List[int] = []
+        parseInt = self._parseInt
+        pton, AF_INET, fromBytes = socket.inet_pton, socket.AF_INET, int.from_bytes
+        # Dates repeat a lot (e.g. all the addresses seen in the same scan): every distinct value is parsed once
+        dates:Dict[Any, int] = {}
+        ipv6 = False
+        for row in self._rows:
+            try:
+                # Fast path for IPv4 addresses
+                version, value = 4, fromBytes(pton(AF_INET, row.get('ip')), 'big')
+            except (OSError, TypeError):
+                version, value = parseIP(row.get('ip'), canonical=False) or (0, 0)
+                ipv6 = ipv6 or version == 6
+            versions.append(version)
+            values.append(value)
+            # Numbers are ints on PHP 8.1 or newer and strings on older versions
+            value = row.get('id')
+            ids.append(value if type(value) is int else parseInt(value))
+            value = row.get('subnetId')
+            subnetIds.append(value if type(value) is int else parseInt(value))
+            value = row.get('tag')
+            tags.append(value if type(value) is int else parseInt(value))
+            value = row.get('state')
+            states.append(value if type(value) is int else parseInt(value))
+            date = row.get('lastSeen')
+            seen = dates.get(date)
+            if seen is None:
+                seen = dates[date] = len(dates)
+            lastSeen.append(seen)
+        self._columns:Dict[str, np.ndarray] = {'version': np.array(versions, dtype=np.uint8)}
+        if ipv6:
+            self._columns['ipHi'] = np.array([v >> 64 for v in values], dtype=np.uint64)
+            self._columns['ipLo'] = np.array([v & _LOW64 for v in values], dtype=np.uint64)
+        else:
+            # IPv4 addresses fit in the low 64 bits
+            self._columns['ipHi'] = np.zeros(len(values), dtype=np.uint64)
+            self._columns['ipLo'] = np.array(values, dtype=np.uint64)
+        for field, column in zip(_INT_FIELDS, (ids, subnetIds, tags, states)):
+            self._columns[field] = np.array(column, dtype=np.int64)
+        self._columns['lastSeen'] = self._parseDates(list(dates))[np.array(lastSeen, dtype=np.int64)]
+
+    @staticmethod
+    def _parseInt(value:Any) -> int:
+        if value is None:
+            return -1
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return -1
+
+    @staticmethod
+    def _parseDates(values:List[Any]) -> np.ndarray:
+        """Get the POSIX timestamps of many dates (NaN if empty or invalid). Dates are parsed in bulk by NumPy and
+        converted from local time with the offset of their hour, as offsets of time zones change at the start of an hour."""
+        try:
+            with warnings.catch_warnings():
+                # NumPy converts dates with time zone to UTC with a warning instead of failing
+                warnings.simplefilter('error', UserWarning)
+                local = np.array([v or None for v in values], dtype='datetime64[s]')
+        except (TypeError, ValueError, UserWarning):
+            # Dates with time zone or in other formats
+            return np.array([ipamAddressTable._parseDate(v) for v in values], dtype=np.float64)
+        valid = ~np.isnat(local)
+        seconds = local[valid].astype(np.int64)
+        hours, index = np.unique(seconds // 3600, return_inverse=True)
+        offsets = np.array([h * 3600 - (_EPOCH + timedelta(hours=h)).timestamp() for h in hours.tolist()], dtype=np.float64)
+        result = np.full(len(values), np.nan)
+        result[valid] = seconds - offsets[index.reshape(-1)]
+        return result
+
+    @staticmethod
+    def _parseDate(value:Any) -> float:
+        if not value:
+            return np.nan
+        try:
+            ts = datetime.fromisoformat(value)
+        except (TypeError, ValueError):
+            return np.nan
+        # Dates without time zone are local dates, as timestamp() assumes
+        return ts.timestamp()
+
+    @staticmethod
+    def fromAddresses(addresses:Iterable[ipamAddress]) -> "ipamAddressTable":
+        """Create a table from ipamAddress objects. The table shares their dictionaries."""
+        return ipamAddressTable(a.getDictionary() for a in addresses)
+
+    @staticmethod
+    def concat(tables:Iterable["ipamAddressTable"]) -> "ipamAddressTable":
+        """Join several tables in a single one."""
+        tables = list(tables)
+        table = ipamAddressTable.__new__(ipamAddressTable)
+        table._rows = [row for t in tables for row in t._rows]
+        table._columns = {}
+        for name in ('version', 'ipHi', 'ipLo', 'lastSeen') + _INT_FIELDS:
+            table._columns[name] = np.concatenate([t._columns[name] for t in tables]) if tables else ipamAddressTable()._columns[name]
+        return table
+
+    ################################################
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __iter__(self) -> Iterator[ipamAddress]:
+        for row in self._rows:
+            yield ipamAddress(addr=row)
+
+    def __getitem__(self, key:Any) -> Any:
+        """Get the ipamAddress object of a row, or a new table with the rows selected by a slice, an array of indexes or a boolean array."""
+        if isinstance(key, (int, np.integer)):
+            return ipamAddress(addr=self._rows[key])
+        return self.take(np.arange(len(self._rows))[key])
+
+    def take(self, indexes:Union[Sequence[int], np.ndarray]) -> "ipamAddressTable":
+        """Create a new table with the given rows in the given order."""
+        indexes = np.asarray(indexes, dtype=np.int64)
+        table = ipamAddressTable.__new__(ipamAddressTable)
+        table._rows = [self._rows[i] for i in indexes.tolist()]
+        table._columns = {name: column[indexes] for name, column in self._columns.items()}
+        return table
+
+    def filter(self, mask:np.ndarray) -> "ipamAddressTable":
+        """Create a new table with the rows where a boolean array is True."""
+        return self.take(np.flatnonzero(mask))
+
+    def toAddresses(self) -> List[ipamAddress]:
+        """Create the ipamAddress objects of all the rows."""
+        return list(self)
+
+    def getDictionaries(self) -> List[Dict[str, Any]]:
+        """Get the dictionaries of all the rows."""
+        return list(self._rows)
+
+    ################################################
+
+    def column(self, field:str) -> np.ndarray:
+        """Get the values of a field in all the rows. Typed columns are returned as they are stored, other fields as object arrays.
+        The 'ip' field is returned as an object array of IPv4Address and IPv6Address objects (None for invalid addresses)."""
+        if field not in self._columns:
+            if field == 'ip':
+                values = [None if v == 0 else (IPv4Address(lo) if v == 4 else IPv6Address((hi << 64) | lo))
+                          for v, hi, lo in zip(self._columns['version'].tolist(), self._columns['ipHi'].tolist(), self._columns['ipLo'].tolist())]
+            else:
+                values = [row.get(field) for row in self._rows]
+            array = np.empty(len(values), dtype=object)
+            array[:] = values
+            self._columns[field] = array
+        return self._columns[field]
+
+    def match(self, field:str, pattern:str) -> np.ndarray:
+        """Get a boolean array with the rows whose value of 'field' matches a regular expression (as re.match).
+        Values are matched as ipamServer.findIPsbyField() does: missing and null values are matched as empty strings
+        and other values as their text."""
+        matches = ipamQuery(field, pattern).matches
+        return np.fromiter((matches(row) for row in self._rows), dtype=bool, count=len(self))
+
+    def isIn(self, field:str, values:Iterable[Any]) -> np.ndarray:
+        """Get a boolean array with the rows whose value of 'field' is one of the given values."""
+        column = self.column(field)
+        if column.dtype != object:
+            return np.isin(column, list(values))
+        accepted = set(values)
+        return np.fromiter((v in accepted for v in column), dtype=bool, count=len(column))
+
+    def inNetwork(self, network:Union[IPv4Network, IPv6Network]) -> np.ndarray:
+        """Get a boolean array with the rows whose IP address is inside a network."""
+        first, last = int(network.network_address), int(network.broadcast_address)
+        key = self._columns['ipHi'].astype(object) * (1 << 64) + self._columns['ipLo'].astype(object) if network.version == 6 else self._columns['ipLo']
+        return (self._columns['version'] == network.version) & (key >= first) & (key <= last)
+
+    def age(self, now:Optional[datetime] = None) -> np.ndarray:
+        """Get the seconds since every address was last seen (NaN if it has never been seen).
+        :param now: The reference date. Default is the current date."""
+        reference = (now or datetime.now().astimezone()).timestamp()
+        return reference - self._columns['lastSeen']
+
+    ################################################
+
+    def sortBy(self, field:str = 'ip', descending:bool = False) -> "ipamAddressTable":
+        """Create a new table sorted by a field. IP addresses are sorted by version and then by value.
+        In ascending order the sort is stable and addresses never seen are sorted last by 'lastSeen'."""
+        if field == 'ip':
+            order = np.lexsort((self._columns['ipLo'], self._columns['ipHi'], self._columns['version']))
+        else:
+            values = self.column(field)
+            if values.dtype == object:
+                # Sort mixed or missing values by their text
+                values = np.array(['' if v is None else str(v) for v in values])
+            order = np.argsort(values, kind='stable')
+        if descending:
+            order = order[::-1]
+        return self.take(order)
+
+    def groupBySubnet(self) -> Dict[int, "ipamAddressTable"]:
+        """Split the table by the subnet of the addresses.
+        :return: A dictionary with a table for every subnet id (-1 for addresses without subnet)."""
+        subnetIds = self._columns['subnetId']
+        order = np.argsort(subnetIds, kind='stable')
+        keys, starts = np.unique(subnetIds[order], return_index=True)
+        bounds = list(starts.tolist()) + [len(order)]
+        return {int(key): self.take(order[bounds[i]:bounds[i + 1]]) for i, key in enumerate(keys.tolist())}
+
+    def __repr__(self) -> str:
+        return f"ipamAddressTable({len(self)} addresses)"
@@ -0,0 +1,299 @@
+#!/usr/bin/python3
+"""This file provides an asyncio client for a phpIPAM service with the same high level operations as ipamServer."""
+
+# Initialize logger
+import logging
+
+mylogger = logging.getLogger()
+
+import os, asyncio, json, base64
+from ipaddress import IPv4Address, IPv6Address
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Sequence, Union
+from urllib.parse import quote
+
+try:
+    import aiohttp
+except ImportError:
+    # Optional dependency: only needed by ipamAsyncServer
+    aiohttp = None
+
+from phpypam.core.exceptions import PHPyPAMException, PHPyPAMEntityNotFoundException, PHPyPAMInvalidSyntax
+
+from .ipamSubnet import ipamSubnet
+from .ipamAddress import ipamAddress
+from .ipamScanAgent import ipamScanAgent
+from .ipamVLAN import ipamVLAN
+from .ipamFreeSpace import ipamFreeSpace
+from .ipamServer import ipamServer
+from .ipamQuery import ipamQuery
+from .ipamTransport import ipamTokenStore, readPassword, isAuthError, parseExpires, raiseError
+
+class ipamAsyncServer:
+    """Manages an asyncio connection to a phpIPAM service. Methods are coroutines returning the same objects as ipamServer.
+    Many requests can be run concurrently (e.g. with asyncio.gather) and the number of requests in flight is bounded.
+
+    The object must be used as an async context manager or connect() and close() must be awaited:
+
+        async with ipamAsyncServer(url=...) as ipam:
+            subnets = await ipam.getAllSubnets()
+            lists = await asyncio.gather(*[ipam.findIPsbyNet(sn) for sn in subnets])
+    """
+    def __init__(self, url:str = "", app_id:str = "", token:str = "", user:str = "", password:str = "", cacert:str = "", maxConcurrency:int = 16, timeout:float = 60.0,
+                 tokenCache:str = "", refreshMargin:float = 300.0) -> None:
+        """Prepares the connection to the service. Parameters not given are taken from the same environment variables used by ipamServer.
+        :param url: The URL of the phpIPAM service.
+        :param app_id: This is the identifier string of the client application operating at the phpIPAM service.
+        :param token: When defining an application at the service, an exclusive access token is created to identify the client.
+        :param user: The client authenticates using an username and a password.
+        :param password: This is the password of the user. If it is not given nor found in the environment, it is read from console.
+        :param cacert: Path to the CA certificate file in PEM format or 'NONE' for not verifying the server certificate.
+        :param maxConcurrency: Maximum number of requests in flight.
+        :param timeout: Total timeout of every request in seconds.
+        :param tokenCache: Path of a file used to share the authentication token with other processes (see ipamServer).
+        :param refreshMargin: Seconds before the expiration of the token when it is renewed.
+        """
+        if aiohttp is None:
+            raise ImportError("ipamAsyncServer needs the aiohttp module: install it with 'pip3 install aiohttp'")
+
+        self.url = url or os.getenv("MYIPAM_URL","")
+        self.app_id = app_id or os.getenv("MYIPAM_APPID","")
+        self.token = token or os.getenv("MYIPAM_TOKEN","")
+        self.user = user or os.getenv("MYIPAM_USER","")
+        self.cacert = cacert or os.getenv("MYIPAM_CACERT","")
+        self._password = password or os.getenv("MYIPAM_PASSWD","")
+        if not self._password:
+            self._password = readPassword()
+        if not self._password:
+            raise Exception("Empty password. Can't connect to any server.")
+
+        self.maxConcurrency = maxConcurrency
+        self.timeout = timeout
+        self._session:Optional["aiohttp.ClientSession"] = None
+        self._semaphore:Optional[asyncio.Semaphore] = None
+        self._apiToken:str = ""
+        self._tokens = ipamTokenStore(tokenCache, key=ipamTokenStore.keyOf(self.url, self.app_id, self.user))
+        self._refreshMargin = refreshMargin
+        self._loginLock:Optional[asyncio.Lock] = None
+        # Labels of the search filters rejected by the service, searched without them from then on
+        self._rejectedSearches:set = set()
+
+    async def connect(self) -> None:
+        """Opens the HTTP session and authenticates at the service."""
+        context = ipamServer._sslContext(self.cacert)
+        connector = aiohttp.TCPConnector(ssl=context, limit=self.maxConcurrency) # type: ignore
+        self._session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout)) # type: ignore
+        self._semaphore = asyncio.Semaphore(self.maxConcurrency)
+        self._loginLock = asyncio.Lock()
+        try:
+            await self.refreshToken(staleToken='')
+        except Exception as e:
+            await self.close()
+            raise Exception(f"Error connecting to IPAM server {self.url}:") from e
+
+    async def close(self) -> None:
+        """Closes the HTTP session."""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self) -> "ipamAsyncServer":
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    async def _newToken(self) -> None:
+        """Login to the service and store the new token. The store is only locked while the token is written, so it is
+        not held by this thread while waiting for the service."""
+        credentials = base64.b64encode(f"{self.user}:{self._password}".encode()).decode()
+        result = await self._query('POST', 'user/', auth=f"Basic {credentials}")
+        self._apiToken = result['token']
+        with self._tokens.locked():
+            self._tokens.save(result['token'], parseExpires(result.get('expires')))
+        mylogger.debug(f"Logged in phpIPAM service {self.url}")
+
+    async def refreshToken(self, staleToken:Optional[str] = None) -> None:
+        """Renew the token unless another task, thread or process has already renewed it. Tasks renewing it wait for
+        the first one, and the shared token file is only locked while it is read and written.
+        :param staleToken: The token known to be expired. By default, the token currently used by this object."""
+        staleToken = staleToken if staleToken is not None else self._apiToken
+        async with self._loginLock: # type: ignore
+            with self._tokens.locked():
+                self._tokens.reload()
+                renewed = self._tokens.token != staleToken and self._tokens.isValid(self._refreshMargin)
+            if renewed:
+                self._apiToken = self._tokens.token
+            else:
+                await self._newToken()
+
+    async def _send(self, method:str, url:str, headers:Dict[str, str], data:Optional[dict], params:Optional[dict]) -> Dict[str, Any]:
+        async with self._semaphore: # type: ignore
+            async with self._session.request(method, url, headers=headers, params=params, data=json.dumps(data) if data is not None else None) as resp: # type: ignore
+                return await resp.json(content_type=None)
+
+    async def _query(self, method:str, path:str, data:Optional[dict] = None, params:Optional[dict] = None, auth:Optional[str] = None) -> Any:
+        """Send a request to the service and return its data. If the token has expired it is renewed and the request is sent again.
+        Errors are raised with the same exceptions raised by phpypam.
+        :param auth: The value of the Authorization header of login requests."""
+        if self._session is None or self._semaphore is None:
+            raise Exception("ipamAsyncServer is not connected")
+        # Use the token renewed by other processes
+        if auth is None and self._tokens.token:
+            self._apiToken = self._tokens.token
+        headers = {'content-type': 'application/json'}
+        # Login with the application token, not with the expired session token
+        token = self.token if auth is not None else self._apiToken
+        if token:
+            headers['token'] = token
+        if auth is not None:
+            headers['Authorization'] = auth
+        url = f"{self.url}/api/{self.app_id}/{path}"
+        if params and not url.endswith('/'):
+            url = url + '/'
+        result = await self._send(method, url, headers, data, params)
+        if auth is None and isAuthError(result):
+            # Renew the token and retry once
+            await self.refreshToken(headers.get('token', ''))
+            headers['token'] = self._apiToken
+            result = await self._send(method, url, headers, data, params)
+        if result['code'] not in (200, 201) or not result['success']:
+            raiseError(result['code'], result.get('message'))
+        return result.get('data')
+
+    async def _get(self, controller:str, controller_path:str = '') -> Any:
+        path = f"{controller}/{controller_path}" if controller_path else controller
+        return await self._query('GET', path)
+
+    async def _getList(self, wrapper:Callable[[dict], Any], controller:str, controller_path:str = '') -> List[Any]:
+        """Get a list of entities wrapped with the given class or an empty list if nothing is found."""
+        try:
+            result = await self._get(controller, controller_path)
+        except PHPyPAMEntityNotFoundException:
+            return []
+        if isinstance(result, dict):
+            result = [result]
+        return [wrapper(e) for e in result or []]
+
+    async def gather(self, func:Callable[[Any], Awaitable[Any]], items:Iterable[Any]) -> List[Any]:
+        """Run a coroutine function on many items concurrently (bounded by maxConcurrency).
+        :param func: A coroutine function of this object (e.g. ipam.findIPsbyNet).
+        :param items: The arguments of every call.
+        :return: The list of results in the same order as the items."""
+        return await asyncio.gather(*[func(item) for item in items])
+
+    ################################################
+
+    async def getAllSections(self) -> Sequence[Any]:
+        return await self._getList(lambda s: s, 'sections')
+
+    async def getAllSubnets(self) -> Sequence[ipamSubnet]:
+        """Get all the subnets defined at the phpIPAM service."""
+        return await self._getList(ipamSubnet, 'subnets')
+
+    async def getAllAddresses(self) -> Sequence[ipamAddress]:
+        """Get all the IP addresses defined at the phpIPAM service."""
+        return await self._getList(lambda a: ipamAddress(addr=a), 'addresses')
+
+    async def getAllVLANs(self) -> Sequence[ipamVLAN]:
+        """Get all the VLANs defined at the phpIPAM service."""
+        return await self._getList(ipamVLAN, 'vlan')
+
+    async def getAllScanAgents(self) -> Sequence[ipamScanAgent]:
+        """Get all the Scan Agents defined at the phpIPAM service."""
+        return await self._getList(ipamScanAgent, 'tools/scanagents')
+
+    ################################################
+
+    async def findSubnetsbyIPMask(self, base_ip:Union[IPv4Address, IPv6Address], mask:int) -> Sequence[ipamSubnet]:
+        """Find one or more subnets defined by base_ip/mask at the phpIPAM service."""
+        return await self._getList(ipamSubnet, 'subnets', f'search/{str(base_ip)}/{str(mask)}')
+
+    async def findVLANbyId(self, id:int) -> Sequence[ipamVLAN]:
+        """Find the VLAN with given database ID."""
+        return await self._getList(ipamVLAN, 'vlan', f'{id}')
+
+    async def findIPs(self, ip:Union[IPv4Address, IPv6Address]) -> Sequence[ipamAddress]:
+        """Find the IP addresses registered at the phpIPAM service matching a given IP address."""
+        return await self._getList(lambda a: ipamAddress(addr=a), 'addresses', f'search/{str(ip)}')
+
+    async def findIPsbyHostName(self, hostname:str) -> Sequence[ipamAddress]:
+        """Find the IP addresses registered at the phpIPAM service matching the given hostname."""
+        return await self._getList(lambda a: ipamAddress(addr=a), 'addresses', f'search_hostname/{quote(hostname, safe="")}')
+
+    async def findIPsbyNet(self, subnet:ipamSubnet) -> Sequence[ipamAddress]:
+        """Find all the IP addresses registered inside a subnet at the phpIPAM service."""
+        return await self._getList(lambda a: ipamAddress(addr=a), 'subnets', f'{subnet.getId()}/addresses')
+
+    async def findIPsbyField(self, subnet:ipamSubnet, field:str, pattern:str) -> Sequence[ipamAddress]:
+        """Find all the IP addresses registered inside a subnet whose value of 'field' matches the given pattern.
+        The filters the service supports are sent with the request and the whole pattern is checked locally, as ipamServer.findIPsbyField() does."""
+        query = ipamQuery(field, pattern)
+        for label, controller, path, params in query.getSearches(subnetId=subnet.getId()):
+            if label in self._rejectedSearches:
+                continue
+            try:
+                rows = await self._query('GET', f"{controller}/{path}" if path else controller, params=params)
+            except PHPyPAMEntityNotFoundException:
+                return []
+            except (PHPyPAMException, PHPyPAMInvalidSyntax) as e:
+                if label is None:
+                    raise
+                mylogger.warning(f"Search {label} rejected by the service, filtering locally: {str(e) or type(e).__name__}")
+                self._rejectedSearches.add(label)
+                continue
+            if isinstance(rows, dict):
+                rows = [rows]
+            return [ipamAddress(addr=row) for row in rows or [] if query.matches(row)]
+        return []
+
+    async def findFree(self, subnet:ipamSubnet, num:int, fitAlg:str = 'FirstFit', align:int = 1, vectorized:Optional[bool] = None) -> Sequence[ipamAddress]:
+        """Finds a block of exactly 'num' contiguous free IP addresses inside given subnet. See ipamServer.findFree()."""
+        used = await self.findIPsbyNet(subnet)
+        netRange = subnet.getSubnet()
+        space = ipamFreeSpace.fromUsed(netRange, [u.getIPInt() for u in used if u.getVersion() == netRange.version], vectorized=vectorized)
+        startIP = space.find(num, fitAlg, align)
+        if startIP is not None:
+            return [ipamAddress(ip=startIP + offset, subnet=subnet) for offset in range(num)] # type: ignore
+        else:
+            return []
+
+    async def registerIP(self, addr:ipamAddress) -> Optional[ipamAddress]:
+        """Register a free IP address at phpIPAM service."""
+        newAddr = await self._query('POST', 'addresses', data=addr.getDictionary())
+        addr.clearChanges()
+        if newAddr:
+            return ipamAddress(newAddr)
+        else:
+            return None
+
+    async def unregisterIP(self, addr:ipamAddress, force:bool = False) -> None:
+        """Release the registration of an IP address at the phpIPAM service."""
+        if not force:
+            ipamServer._checkRemovable(addr)
+        await self._query('DELETE', f'addresses/{addr.getId()}')
+
+    ################################################
+
+    async def updateScanAgent(self, agent:ipamScanAgent) -> None:
+        """Update the last access date of a scan agent."""
+        params = agent.updateLastAccess()
+        await self._query('PATCH', f'tools/scanagents/{agent.getId()}/', params=params)
+
+    async def updateSubnetLastScan(self, subnet:ipamSubnet) -> None:
+        """Update the last scan date of a subnet."""
+        params = subnet.updateLastScan()
+        await self._query('PATCH', f'subnets/{subnet.getId()}/', params=params)
+
+    async def updateSubnetLastDiscovery(self, subnet:ipamSubnet) -> None:
+        """Update the last discovery date of a subnet."""
+        params = subnet.updateLastDiscovery()
+        await self._query('PATCH', f'subnets/{subnet.getId()}/', params=params)
+
+    async def updateAddress(self, address:ipamAddress) -> None:
+        """Update the fields of an address modified since it was read from the service. Nothing is sent if no field has changed."""
+        params = address.getChanges()
+        if not params:
+            return
+        await self._query('PATCH', f'addresses/{address.getId()}/', params=params)
+        address.clearChanges(params)
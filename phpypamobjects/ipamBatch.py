@@ -0,0 +1,143 @@
+#!/usr/bin/python3
+"""This file provides a pipeline for batching writes of IP addresses to a phpIPAM service."""
+
+# Initialize logger
+import logging
+
+mylogger = logging.getLogger()
+
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from .ipamAddress import ipamAddress
+
+class ipamWriteBatch:
+    """This object collects registrations, updates and removals of addresses and sends them to the phpIPAM service
+    with bounded concurrency. Repeated updates of the same address are merged into a single request.
+    When the number of pending writes reaches a limit, they are flushed before accepting more (backpressure).
+
+    It is used as a context manager returned by ipamServer.writeBatch(). Pending writes are flushed on exit, unless
+    the block raises an exception: then nothing is sent and the pending writes are kept until flush() is called.
+
+        with ipam.writeBatch() as batch:
+            for a in addresses:
+                a.updateLastSeen()
+                batch.update(a)
+        errors = batch.getErrors()
+    """
+    def __init__(self, server:Any, maxWorkers:int = 8, maxPending:int = 1000) -> None:
+        """Creates a new empty batch.
+        :param server: The ipamServer object used to send the writes.
+        :param maxWorkers: The maximum number of concurrent requests.
+        :param maxPending: The number of pending writes that triggers a flush."""
+        self._server = server
+        self.maxWorkers = maxWorkers
+        self.maxPending = maxPending
+        self._lock = threading.RLock()
+        # Pending updates by address id: objects of the address in the order they were queued
+        self._updates:Dict[Any, List[ipamAddress]] = {}
+        self._registers:List[ipamAddress] = []
+        self._unregisters:List[Tuple[ipamAddress, bool]] = []
+        self._results:List[Tuple[str, ipamAddress, Optional[Exception]]] = []
+
+    def __enter__(self) -> "ipamWriteBatch":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        if exc_info[0] is not None:
+            mylogger.warning(f"Batch interrupted by an exception: {self.pending()} pending writes not sent")
+            return
+        self.flush()
+
+    def pending(self) -> int:
+        """Get the number of pending writes."""
+        with self._lock:
+            return len(self._updates) + len(self._registers) + len(self._unregisters)
+
+    def _added(self) -> None:
+        if self.pending() >= self.maxPending:
+            self.flush()
+
+    def update(self, address:ipamAddress) -> None:
+        """Queue the update of the fields of an address modified since it was read from the service.
+        Changes are read when the batch is flushed, so repeated updates of the same address are merged.
+        Addresses without changes are ignored. Addresses not registered yet (without id) must be queued with register()."""
+        if not address.hasChanges():
+            return
+        if address.getId() is None:
+            raise ValueError(f"Address {address} is not registered and can't be updated")
+        with self._lock:
+            queued = self._updates.setdefault(address.getId(), [])
+            if not any(a is address for a in queued):
+                queued.append(address)
+        self._added()
+
+    @staticmethod
+    def _mergeChanges(addresses:List[ipamAddress]) -> Dict[str, Any]:
+        """Merge the changes of several objects of the same address. Later objects override earlier ones."""
+        params:Dict[str, Any] = {}
+        for a in addresses:
+            params.update(a.getChanges())
+        return params
+
+    def register(self, address:ipamAddress) -> None:
+        """Queue the registration of a free address."""
+        with self._lock:
+            self._registers.append(address)
+        self._added()
+
+    def unregister(self, address:ipamAddress, force:bool = False) -> None:
+        """Queue the removal of an address. Protected addresses are checked when the batch is flushed."""
+        with self._lock:
+            self._unregisters.append((address, force))
+        self._added()
+
+    def _run(self, operation:str, address:ipamAddress, arg:Any) -> Tuple[str, ipamAddress, Optional[Exception]]:
+        worker = self._server._workerServer()
+        try:
+            if operation == 'update':
+                queued, params = arg
+                worker._updateAddressFields(address, params)
+                for a in queued:
+                    a.clearChanges(params)
+            elif operation == 'register':
+                worker.registerIP(address)
+            else:
+                worker.unregisterIP(address, force=arg)
+            return operation, address, None
+        except Exception as e:
+            mylogger.error(f"Error in {operation} of address {address}: {str(e)}")
+            return operation, address, e
+
+    def flush(self) -> List[Tuple[str, ipamAddress, Optional[Exception]]]:
+        """Send all the pending writes. Removals are sent first, then registrations and then updates.
+        Writes queued by other threads while the batch is flushed are kept for the next flush.
+        :return: The results of the writes sent by this call as tuples (operation, address, exception).
+            'exception' is None if the write succeeded."""
+        # Take the pending writes and release the lock before sending them
+        with self._lock:
+            unregisters, registers, updates = self._unregisters, self._registers, self._updates
+            self._unregisters = []
+            self._registers = []
+            self._updates = {}
+        phases = [
+            [('unregister', a, force) for a, force in unregisters],
+            [('register', a, None) for a in registers],
+            [('update', queued[-1], (queued, params)) for queued, params in
+             ((queued, self._mergeChanges(queued)) for queued in updates.values()) if params],
+        ]
+        results:List[Tuple[str, ipamAddress, Optional[Exception]]] = []
+        with self._server._pool(self.maxWorkers) as executor:
+            for phase in phases:
+                results.extend(executor.map(lambda op: self._run(*op), phase))
+        with self._lock:
+            self._results.extend(results)
+        return results
+
+    def getResults(self) -> List[Tuple[str, ipamAddress, Optional[Exception]]]:
+        """Get the results of all the writes sent by this batch as tuples (operation, address, exception)."""
+        return list(self._results)
+
+    def getErrors(self) -> List[Tuple[str, ipamAddress, Exception]]:
+        """Get the results of the writes that failed."""
+        return [r for r in self._results if r[2] is not None] # type: ignore
@@ -0,0 +1,69 @@
+#!/usr/bin/python3
+"""This file provides a small read-through cache with TTL and LRU eviction for the results of the phpIPAM service."""
+
+import threading, time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Tuple
+
+class ipamCache:
+    """This object stores results of queries to the phpIPAM service for a limited time.
+    When the cache is full, the least recently used entry is evicted. Access is thread safe."""
+    def __init__(self, ttl:float = 60.0, maxSize:int = 1024) -> None:
+        """Creates a new empty cache.
+        :param ttl: Seconds an entry is valid after it is stored.
+        :param maxSize: Maximum number of entries. Zero means no limit."""
+        self.ttl:float = ttl
+        self.maxSize:int = maxSize
+        self._entries:"OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+
+    def get(self, key:Hashable) -> Tuple[bool, Any]:
+        """Get the value stored for a key.
+        :param key: The key of the entry.
+        :return: A tuple (found, value). 'found' is False if the key is not cached or its entry has expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if time.monotonic() - entry[1] <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+                    return True, entry[0]
+                del self._entries[key]
+                self._expirations += 1
+            self._misses += 1
+            return False, None
+
+    def put(self, key:Hashable, value:Any) -> None:
+        """Store a value for a key evicting the least recently used entry if the cache is full.
+        :param key: The key of the entry.
+        :param value: The value to store."""
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while self.maxSize > 0 and len(self._entries) > self.maxSize:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def invalidate(self, key:Hashable = None) -> None:
+        """Discard the entry of a key or, if no key is given, all the entries."""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def getStats(self) -> Dict[str, int]:
+        """Get the statistics of use of the cache.
+        :return: A dictionary with the number of hits, misses, evictions, expirations and the current size."""
+        with self._lock:
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+                'expirations': self._expirations,
+                'size': len(self._entries),
+            }
@@ -0,0 +1,320 @@
+#!/usr/bin/python3
+"""This file provides a model of the free address space of a subnet as a sorted list of intervals of free addresses."""
+
+import threading, time
+from bisect import bisect_left, bisect_right
+from ipaddress import IPv4Address, IPv6Address, IPv4Network, IPv6Network
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+class ipamFreeSpace:
+    """This object represents the free addresses of a subnet as sorted intervals [start, end] of integers.
+    The cost of building and querying the model depends on the number of used addresses and not on the size of the subnet,
+    so it can be used with large IPv4 and IPv6 subnets alike."""
+    def __init__(self, netRange:Union[IPv4Network, IPv6Network], used_ips:Iterable[Union[IPv4Address, IPv6Address, int]] = ()) -> None:
+        """Creates a new object from the range of the subnet and the addresses already used in it.
+        :param netRange: The range of the subnet. Only the host addresses of the range (as returned by hosts()) are considered.
+        :param used_ips: The addresses registered in the subnet. Addresses out of the range are ignored."""
+        self._version:int = netRange.version
+        self._first, self._last = self.hostRange(netRange)
+        # Intervals of free addresses sorted by start address
+        self._starts:List[int] = []
+        self._ends:List[int] = []
+        self._build(used_ips)
+
+    @staticmethod
+    def hostRange(netRange:Union[IPv4Network, IPv6Network]) -> Tuple[int, int]:
+        """Get the first and last host addresses of a subnet with the same semantic as hosts() in the ipaddress module.
+        :param netRange: The range of the subnet.
+        :return: A tuple with the integer values of the first and last host addresses."""
+        first = int(netRange.network_address)
+        last = int(netRange.broadcast_address)
+        if netRange.version == 4 and netRange.prefixlen < 31:
+            # Skip base and broadcast addresses
+            first += 1
+            last -= 1
+        elif netRange.version == 6 and netRange.prefixlen < 127:
+            # Skip Subnet-Router anycast address
+            first += 1
+        return first, last
+
+    def _usedInts(self, used_ips:Iterable[Union[IPv4Address, IPv6Address, int]]) -> List[int]:
+        """Get the sorted list of integer values of the used addresses inside the host range."""
+        used = set()
+        for ip in used_ips:
+            if getattr(ip, 'version', self._version) != self._version:
+                continue
+            value = int(ip)
+            if self._first <= value <= self._last:
+                used.add(value)
+        return sorted(used)
+
+    def _build(self, used_ips:Iterable[Union[IPv4Address, IPv6Address, int]]) -> None:
+        """Compute the gaps between used addresses."""
+        start = self._first
+        for value in self._usedInts(used_ips):
+            if value > start:
+                self._starts.append(start)
+                self._ends.append(value - 1)
+            start = value + 1
+        if start <= self._last:
+            self._starts.append(start)
+            self._ends.append(self._last)
+
+    def _address(self, value:int) -> Union[IPv4Address, IPv6Address]:
+        return IPv4Address(value) if self._version == 4 else IPv6Address(value)
+
+    def getVersion(self) -> int:
+        return self._version
+
+    def intervals(self) -> List[Tuple[int, int]]:
+        """Get the intervals of free addresses.
+        :return: A list of tuples (start, end) with the integer values of the first and last free addresses of every interval."""
+        return list(zip(self._starts, self._ends))
+
+    def pools(self) -> List[Tuple[Union[IPv4Address, IPv6Address], int]]:
+        """Get the pools of contiguous free addresses.
+        :return: A list of tuples (startIP, count) sorted by address."""
+        return [(self._address(s), e - s + 1) for s, e in zip(self._starts, self._ends)]
+
+    def countFree(self) -> int:
+        """Get the total number of free addresses."""
+        return sum(e - s + 1 for s, e in zip(self._starts, self._ends))
+
+    def isFree(self, ip:Union[IPv4Address, IPv6Address, int]) -> bool:
+        """Check if an address is free in this model."""
+        value = int(ip)
+        idx = bisect_right(self._starts, value) - 1
+        return idx >= 0 and value <= self._ends[idx]
+
+    def _replace(self, lo:int, hi:int, pieces:List[Tuple[int, int]]) -> None:
+        """Replace the intervals in positions [lo, hi) with the given pieces."""
+        self._starts[lo:hi] = [s for s, e in pieces]
+        self._ends[lo:hi] = [e for s, e in pieces]
+
+    def markUsed(self, ip:Union[IPv4Address, IPv6Address, int], num:int = 1) -> None:
+        """Remove a block of addresses from the free space. Addresses already used are ignored.
+        :param ip: The first address of the block.
+        :param num: The number of contiguous addresses of the block."""
+        low = max(int(ip), self._first)
+        high = min(int(ip) + num - 1, self._last)
+        if low > high:
+            return
+        # Intervals overlapping the block are in positions [lo, hi)
+        lo = bisect_left(self._ends, low)
+        hi = bisect_right(self._starts, high)
+        if lo >= hi:
+            return
+        pieces = []
+        if self._starts[lo] < low:
+            pieces.append((int(self._starts[lo]), low - 1))
+        if self._ends[hi - 1] > high:
+            pieces.append((high + 1, int(self._ends[hi - 1])))
+        self._replace(lo, hi, pieces)
+
+    def markFree(self, ip:Union[IPv4Address, IPv6Address, int]) -> None:
+        """Return an address to the free space merging it with the adjacent intervals.
+        :param ip: The address to release."""
+        value = int(ip)
+        if value < self._first or value > self._last or self.isFree(value):
+            return
+        lo = hi = bisect_right(self._starts, value)
+        start = end = value
+        if lo > 0 and self._ends[lo - 1] == value - 1:
+            lo -= 1
+            start = int(self._starts[lo])
+        if hi < len(self._starts) and self._starts[hi] == value + 1:
+            end = int(self._ends[hi])
+            hi += 1
+        self._replace(lo, hi, [(start, end)])
+
+    def _candidates(self, num:int, align:int):
+        """Generate the pools that can hold an aligned block of 'num' addresses.
+        :return: Tuples (start, length) with the start of the aligned block and the length of the pool."""
+        for s, e in zip(self._starts, self._ends):
+            start = -(-s // align) * align
+            if start + num - 1 <= e:
+                yield start, e - s + 1
+
+    def _firstFit(self, num:int, align:int = 1) -> Optional[int]:
+        for start, length in self._candidates(num, align):
+            return start
+        return None
+
+    def _bestFit(self, num:int, align:int = 1) -> Optional[int]:
+        best = None
+        bestLen = 0
+        for start, length in self._candidates(num, align):
+            # On ties the last pool is selected
+            if best is None or length <= bestLen:
+                best = start
+                bestLen = length
+        return best
+
+    def _worstFit(self, num:int, align:int = 1) -> Optional[int]:
+        worst = None
+        worstLen = 0
+        for start, length in self._candidates(num, align):
+            # On ties the last pool is selected
+            if length >= worstLen:
+                worst = start
+                worstLen = length
+        return worst
+
+    def findInt(self, num:int, fitAlg:str = 'FirstFit', align:int = 1) -> Optional[int]:
+        """Find the start of a block of 'num' contiguous free addresses.
+        :param num: The number of contiguous addresses.
+        :param fitAlg: The name of the algorithm to use. Default is 'FirstFit'. 'WorstFit' and 'BestFit' are also available.
+        :param align: The first address of the block must be a multiple of this number. Default is 1 (no alignment).
+        :return: The integer value of the first address of the block or None if no block is big enough."""
+        if align < 1:
+            raise ValueError(f"Invalid alignment {align}")
+        if num <= 0:
+            return None
+        if fitAlg == 'BestFit':
+            return self._bestFit(num, align)
+        elif fitAlg == 'WorstFit':
+            return self._worstFit(num, align)
+        else:
+            return self._firstFit(num, align)
+
+    def find(self, num:int, fitAlg:str = 'FirstFit', align:int = 1) -> Union[IPv4Address, IPv6Address, None]:
+        """Find the start of a block of 'num' contiguous free addresses.
+        :param num: The number of contiguous addresses.
+        :param fitAlg: The name of the algorithm to use. Default is 'FirstFit'. 'WorstFit' and 'BestFit' are also available.
+        :param align: The first address of the block must be a multiple of this number. Default is 1 (no alignment).
+        :return: The first address of the block or None if no block is big enough."""
+        start = self.findInt(num, fitAlg, align)
+        return self._address(start) if start is not None else None
+
+    @staticmethod
+    def fromUsed(netRange:Union[IPv4Network, IPv6Network], used_ips:Sequence[Union[IPv4Address, IPv6Address, int]], vectorized:Optional[bool] = None) -> 'ipamFreeSpace':
+        """Create the free space model most suitable for a subnet.
+        :param netRange: The range of the subnet.
+        :param used_ips: The addresses registered in the subnet.
+        :param vectorized: Use the NumPy model (IPv4 only). By default it is used for IPv4 subnets with many used addresses.
+        :return: An ipamFreeSpace object."""
+        if vectorized is None:
+            vectorized = netRange.version == 4 and len(used_ips) >= ipamFreeSpaceArray.THRESHOLD
+        if vectorized and netRange.version == 4:
+            return ipamFreeSpaceArray(netRange, used_ips)
+        return ipamFreeSpace(netRange, used_ips)
+
+
+class ipamFreeSpaceArray(ipamFreeSpace):
+    """This object is a vectorized version of ipamFreeSpace for dense IPv4 subnets.
+    Used addresses are loaded into an uint32 array and the free runs are computed and searched with NumPy operations."""
+    # Minimum number of used addresses to select this model automatically
+    THRESHOLD = 256
+
+    def __init__(self, netRange:IPv4Network, used_ips:Iterable[Union[IPv4Address, int]] = ()) -> None:
+        if netRange.version != 4:
+            raise ValueError(f"Vectorized free space is only available for IPv4 subnets: {netRange}")
+        super().__init__(netRange, used_ips)
+
+    def _build(self, used_ips:Iterable[Union[IPv4Address, int]]) -> None:
+        """Compute the gaps between used addresses with run-length operations."""
+        used = np.unique(np.fromiter((int(ip) for ip in used_ips if getattr(ip, 'version', 4) == 4), dtype=np.uint32))
+        used = used[(used >= self._first) & (used <= self._last)].astype(np.int64)
+        # Boundaries are the used addresses plus sentinels just outside the host range
+        bounds = np.concatenate(([self._first - 1], used, [self._last + 1]))
+        gaps = np.diff(bounds) > 1
+        self._starts = bounds[:-1][gaps] + 1 # type: ignore
+        self._ends = bounds[1:][gaps] - 1 # type: ignore
+
+    def _replace(self, lo:int, hi:int, pieces:List[Tuple[int, int]]) -> None:
+        self._starts = np.concatenate((self._starts[:lo], np.array([s for s, e in pieces], dtype=np.int64), self._starts[hi:])) # type: ignore
+        self._ends = np.concatenate((self._ends[:lo], np.array([e for s, e in pieces], dtype=np.int64), self._ends[hi:])) # type: ignore
+
+    def intervals(self) -> List[Tuple[int, int]]:
+        return list(zip(self._starts.tolist(), self._ends.tolist())) # type: ignore
+
+    def pools(self) -> List[Tuple[Union[IPv4Address, IPv6Address], int]]:
+        return [(self._address(s), e - s + 1) for s, e in self.intervals()]
+
+    def countFree(self) -> int:
+        return int(np.sum(self._ends - self._starts + 1)) # type: ignore
+
+    def isFree(self, ip:Union[IPv4Address, int]) -> bool:
+        value = int(ip)
+        idx = int(np.searchsorted(self._starts, value, side='right')) - 1
+        return idx >= 0 and value <= int(self._ends[idx])
+
+    def findInt(self, num:int, fitAlg:str = 'FirstFit', align:int = 1) -> Optional[int]:
+        if align < 1:
+            raise ValueError(f"Invalid alignment {align}")
+        if num <= 0:
+            return None
+        starts = self._starts
+        if align > 1:
+            starts = -(-starts // align) * align
+        # Pools that can hold the aligned block
+        suitable = np.flatnonzero(starts + num - 1 <= self._ends)
+        if not suitable.size:
+            return None
+        if fitAlg == 'BestFit' or fitAlg == 'WorstFit':
+            lengths = (self._ends - self._starts + 1)[suitable][::-1] # type: ignore
+            # Search reversed arrays so that the last pool is selected on ties
+            pos = np.argmin(lengths) if fitAlg == 'BestFit' else np.argmax(lengths)
+            idx = suitable[len(suitable) - 1 - pos]
+        else:
+            idx = suitable[0]
+        return int(starts[idx]) # type: ignore
+
+
+class ipamFreePoolIndex:
+    """This object keeps the free space models of subnets between calls, keyed by subnet id.
+    Models are updated incrementally when addresses are registered or released by this client. A model is discarded
+    when its age exceeds the TTL or when the 'editDate' of the subnet differs from the one it was built with."""
+    def __init__(self, ttl:float = 30.0) -> None:
+        """Creates a new empty index.
+        :param ttl: Seconds a model is kept before fetching the addresses of the subnet again. Zero disables the index."""
+        self.ttl:float = ttl
+        self._entries:Dict[str, Tuple[ipamFreeSpace, Optional[str], float]] = {}
+        self._lock = threading.RLock()
+
+    def get(self, subnet:Any) -> Optional[ipamFreeSpace]:
+        """Get the model of a subnet if it is still valid.
+        :param subnet: An ipamSubnet object.
+        :return: An ipamFreeSpace object or None if the subnet is not indexed or its model is expired."""
+        with self._lock:
+            entry = self._entries.get(str(subnet.getId()))
+            if entry is None:
+                return None
+            space, editDate, created = entry
+            if time.monotonic() - created > self.ttl or editDate != subnet.getField('editDate'):
+                del self._entries[str(subnet.getId())]
+                return None
+            return space
+
+    def put(self, subnet:Any, space:ipamFreeSpace) -> None:
+        """Store the model of a subnet.
+        :param subnet: An ipamSubnet object.
+        :param space: The ipamFreeSpace object built from the addresses of the subnet."""
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[str(subnet.getId())] = (space, subnet.getField('editDate'), time.monotonic())
+
+    def markUsed(self, subnetId:Any, ip:Union[IPv4Address, IPv6Address, int], num:int = 1) -> None:
+        """Remove a block of addresses from the model of a subnet if it is indexed."""
+        with self._lock:
+            entry = self._entries.get(str(subnetId))
+            if entry is not None:
+                entry[0].markUsed(ip, num)
+
+    def markFree(self, subnetId:Any, ip:Union[IPv4Address, IPv6Address, int]) -> None:
+        """Return an address to the model of a subnet if it is indexed."""
+        with self._lock:
+            entry = self._entries.get(str(subnetId))
+            if entry is not None:
+                entry[0].markFree(ip)
+
+    def invalidate(self, subnetId:Any = None) -> None:
+        """Discard the model of a subnet or, if no subnet is given, all the models."""
+        with self._lock:
+            if subnetId is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(str(subnetId), None)
@@ -0,0 +1,124 @@
+#!/usr/bin/python3
+"""This file provides the aggregation of the last seen dates of addresses found by scanning agents into batched writes."""
+
+# Initialize logger
+import logging
+
+mylogger = logging.getLogger()
+
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from .ipamSubnet import ipamSubnet
+from .ipamAddress import ipamAddress
+from .ipamScanAgent import ipamScanAgent
+
+class ipamHeartbeat:
+    """This object collects the addresses answering a scan and writes their last seen dates in batches.
+    The last seen date of an address is only written when the stored date is older than 'minInterval' seconds, so
+    a sweep of a subnet does at most one write per stale address, plus one write of the last scan date of every
+    scanned subnet and one write of the last access date of the scan agent.
+
+    It is used as a context manager returned by ipamServer.heartbeat(). Pending writes are flushed on exit, unless the
+    block raises an exception: then nothing is sent, as in ipamWriteBatch, and the writes are kept until flush() is called:
+
+        with ipam.heartbeat(minInterval=3600, agent=agent) as hb:
+            for a in ipam.findIPsbyNet(sn):
+                if ping(a.getIP()):
+                    hb.seen(a, sn)
+            hb.scanned(sn)
+    """
+    def __init__(self, server:Any, minInterval:float = 3600.0, agent:Optional[ipamScanAgent] = None, maxWorkers:int = 8, maxPending:int = 1000) -> None:
+        """Creates a new empty aggregator.
+        :param server: The ipamServer object used to send the writes.
+        :param minInterval: Seconds the last seen date of an address is kept if it is newer than that.
+        :param agent: The scan agent whose last access date is updated on every flush. None for not updating any agent.
+        :param maxWorkers: The maximum number of concurrent requests.
+        :param maxPending: The number of pending address writes that triggers a flush of the addresses."""
+        self._server = server
+        self.minInterval = minInterval
+        self.agent = agent
+        self.maxWorkers = maxWorkers
+        self._batch = server.writeBatch(maxWorkers=maxWorkers, maxPending=maxPending)
+        self._lock = threading.Lock()
+        # Scanned subnets pending of updating their last scan date, by subnet id
+        self._subnets:Dict[int, ipamSubnet] = {}
+        self._errors:List[Tuple[str, Any, Exception]] = []
+        self._seen = 0
+        self._skipped = 0
+
+    def __enter__(self) -> "ipamHeartbeat":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        if exc_info[0] is not None:
+            mylogger.warning(f"Heartbeat interrupted by an exception: {self.pending()} pending writes not sent")
+            return
+        self.flush()
+
+    def pending(self) -> int:
+        """Get the number of pending address writes and of scanned subnets whose last scan date is pending."""
+        with self._lock:
+            return self._batch.pending() + len(self._subnets)
+
+    def seen(self, address:ipamAddress, subnet:Optional[ipamSubnet] = None) -> bool:
+        """Record that an address has answered a scan.
+        :param address: The address found.
+        :param subnet: The subnet of the address. Its last scan date is updated on the next flush.
+        :return: True if the last seen date of the address will be written or False if it is recent enough or the address is protected."""
+        try:
+            updated = address.updateLastSeen(minInterval=self.minInterval)
+        except PermissionError as p:
+            mylogger.error(f"Last seen date of address {str(address)} can't be updated: {str(p)}")
+            with self._lock:
+                self._skipped += 1
+                self._errors.append(('seen', address, p))
+                if subnet is not None:
+                    self._subnets[subnet.getId()] = subnet
+            return False
+        with self._lock:
+            if updated:
+                self._seen += 1
+            else:
+                self._skipped += 1
+            if subnet is not None:
+                self._subnets[subnet.getId()] = subnet
+        if updated:
+            self._batch.update(address)
+        return updated
+
+    def scanned(self, subnet:ipamSubnet) -> None:
+        """Record that a subnet has been scanned. Its last scan date is updated on the next flush."""
+        with self._lock:
+            self._subnets[subnet.getId()] = subnet
+
+    def flush(self) -> List[Tuple[str, Any, Exception]]:
+        """Write the pending last seen dates, the last scan dates of the scanned subnets and the last access date of the agent.
+        :return: The writes that failed as tuples (operation, object, exception)."""
+        errors:List[Tuple[str, Any, Exception]] = []
+        errors.extend((op, a, e) for op, a, e in self._batch.flush() if e is not None)
+        with self._lock:
+            subnets = list(self._subnets.values())
+            self._subnets = {}
+        for sn, _, e in self._server.parallelMap('updateSubnetLastScan', subnets, maxWorkers=self.maxWorkers):
+            if e is not None:
+                errors.append(('updateSubnetLastScan', sn, e))
+        if self.agent is not None:
+            try:
+                self._server.updateScanAgent(self.agent)
+            except Exception as e:
+                mylogger.error(f"Error updating scan agent {self.agent.getName()}: {str(e)}")
+                errors.append(('updateScanAgent', self.agent, e))
+        with self._lock:
+            self._errors.extend(errors)
+        return errors
+
+    def getErrors(self) -> List[Tuple[str, Any, Exception]]:
+        """Get the writes that failed as tuples (operation, object, exception)."""
+        with self._lock:
+            return list(self._errors)
+
+    def getStats(self) -> Dict[str, int]:
+        """Get the number of addresses whose last seen date has been queued for writing and of those skipped because it was recent."""
+        with self._lock:
+            return {'seen': self._seen, 'skipped': self._skipped}
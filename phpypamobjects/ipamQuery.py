@@ -0,0 +1,98 @@
+#!/usr/bin/python3
+"""This file provides the planning of searches of addresses by the value of a field, pushing to the phpIPAM service the filters it supports."""
+
+import re
+from urllib.parse import quote
+from typing import Any, Dict, List, Optional, Tuple
+
+# Characters with a special meaning in regular expressions
+_SPECIAL = '.^$*+?{}[]()|\\'
+
+class ipamQuery:
+    """This object plans a search of the addresses whose value of a field matches a regular expression (as re.match).
+    The literal prefix of the pattern is sent to the service, which returns a superset of the matching addresses:
+        - 'search_hostname' and 'search_hostbase' requests for exact and prefix matches of hostnames.
+        - 'search' requests for exact matches of IP addresses.
+        - 'filter_by', 'filter_value' and 'filter_match' parameters for any other field, including custom fields.
+    The whole pattern is always checked locally, so the result does not depend on the filters the service supports.
+    Patterns without a literal prefix (e.g. starting with '.*' or containing '|') can't be pushed to the service.
+    """
+    def __init__(self, field:str, pattern:str) -> None:
+        """Creates the plan of a search.
+        :param field: The name of the field to match.
+        :param pattern: A regular expression defining a pattern for matching values."""
+        self.field = field
+        self.pattern = pattern
+        self.regex = re.compile(pattern)
+        self.prefix, self.exact = self._literalPrefix(pattern)
+
+    @staticmethod
+    def _literalPrefix(pattern:str) -> Tuple[str, bool]:
+        """Get the literal text every value matching the pattern starts with.
+        :return: A tuple (prefix, exact). 'exact' is True if the pattern only matches the prefix itself."""
+        if '|' in pattern:
+            return '', False
+        literal:List[str] = []
+        i = 1 if pattern.startswith('^') else 0
+        while i < len(pattern):
+            c = pattern[i]
+            if c == '\\':
+                escaped = pattern[i+1:i+2]
+                if pattern[i:] == '\\Z':
+                    return ''.join(literal), True
+                if not escaped or escaped.isalnum():
+                    # Character classes (\d, \w, ...) and anchors
+                    break
+                char, step = escaped, 2
+            elif c in _SPECIAL:
+                if c == '$' and i == len(pattern) - 1:
+                    return ''.join(literal), True
+                break
+            else:
+                char, step = c, 1
+            following = pattern[i+step:i+step+1]
+            if following and following in '*?{':
+                # The character is optional or repeated a variable number of times
+                break
+            literal.append(char)
+            if following == '+':
+                break
+            i += step
+        return ''.join(literal), False
+
+    def matches(self, row:Dict[str, Any]) -> bool:
+        """Check if the dictionary of an address matches the pattern. Missing and null values are matched as empty strings."""
+        value = row.get(self.field)
+        return self.regex.match('' if value is None else str(value)) is not None
+
+    def getParams(self) -> Optional[Dict[str, str]]:
+        """Get the filter parameters of a request returning the addresses matching the prefix, or None if there is no prefix."""
+        if not self.prefix:
+            return None
+        return {'filter_by': self.field, 'filter_value': self.prefix, 'filter_match': 'full' if self.exact else 'partial'}
+
+    def getSearches(self, subnetId:Any = None) -> List[Tuple[Optional[str], str, Optional[str], Optional[Dict[str, str]]]]:
+        """Get the requests that return the addresses matching the pattern, from the most selective to the least.
+        The next request is used when the service rejects the previous one. The last request has no filter.
+        :param subnetId: Search only the addresses of this subnet. By default, the addresses of all the subnets.
+        :return: A list of tuples (label, controller, controller_path, params). 'label' identifies the filter used (None for no filter)."""
+        searches:List[Tuple[Optional[str], str, Optional[str], Optional[Dict[str, str]]]] = []
+        params = self.getParams()
+        if subnetId is not None:
+            if params:
+                searches.append((f'filter_by:{self.field}', 'subnets', f'{subnetId}/addresses', params))
+            searches.append((None, 'subnets', f'{subnetId}/addresses', None))
+            return searches
+        if self.field == 'hostname' and self.exact and self.prefix:
+            searches.append(('search_hostname', 'addresses', f'search_hostname/{quote(self.prefix, safe="")}', None))
+        elif self.field == 'hostname' and self.prefix:
+            searches.append(('search_hostbase', 'addresses', f'search_hostbase/{quote(self.prefix, safe="")}', None))
+        elif self.field == 'ip' and self.exact and self.prefix:
+            searches.append(('search', 'addresses', f'search/{quote(self.prefix, safe="")}', None))
+        if params:
+            searches.append((f'filter_by:{self.field}', 'addresses', None, params))
+        searches.append((None, 'addresses', None, None))
+        return searches
+
+    def __repr__(self) -> str:
+        return f"ipamQuery({self.field!r}, {self.pattern!r}, prefix={self.prefix!r}, exact={self.exact})"
@@ -0,0 +1,136 @@
+#!/usr/bin/python3
+"""This file provides a streaming renderer of reports of the subnets and addresses of a phpIPAM service."""
+
+# Initialize logger
+import logging
+
+mylogger = logging.getLogger()
+
+import re, csv, json
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, TextIO, Tuple
+
+from .ipamSubnet import ipamSubnet
+from .ipamAddress import ipamAddress
+
+# Descriptions and notes written by the autodiscovery of phpIPAM are not reported
+_AUTODISCOVER = re.compile(r".*autodiscover.*", flags=re.RegexFlag.IGNORECASE)
+
+# Columns of the CSV and JSON Lines formats
+_COLUMNS = ('subnet', 'vlan', 'ip', 'hostname', 'description', 'note')
+
+_BANNER_LINE = "##################################################################################################\n"
+
+class ipamReport:
+    """This object writes a report of the addresses of many subnets to a file or any object with a write() method
+    (e.g. a socket wrapped with makefile('w')). The addresses of the subnets are fetched in parallel and the report
+    of every subnet is written as soon as it and the previous subnets are available, so the output keeps the order of
+    the subnets and memory use does not grow with the number of subnets. Formats are:
+        - 'plain': The text listing returned by ipamServer.listSubnetPlain() for every subnet.
+        - 'csv': A header and a row per address with the columns subnet, vlan, ip, hostname, description and note.
+        - 'jsonl': A JSON object per line and address with the same fields as the CSV format.
+
+        with open('ipam.txt', 'w') as f:
+            errors = ipamReport(ipam, format='plain', maxWorkers=16).write(f, ipam.getAllSubnets())
+    """
+    FORMATS = ('plain', 'csv', 'jsonl')
+
+    def __init__(self, server:Any, format:str = 'plain', maxWorkers:int = 8) -> None:
+        """Creates a report.
+        :param server: The ipamServer object used to fetch the data.
+        :param format: The format of the report: 'plain', 'csv' or 'jsonl'.
+        :param maxWorkers: The maximum number of subnets fetched in parallel."""
+        if format not in self.FORMATS:
+            raise ValueError(f"Unknown report format {format}. Valid formats are {', '.join(self.FORMATS)}")
+        self._server = server
+        self.format = format
+        self.maxWorkers = maxWorkers
+        # VLAN numbers by VLAN id, loaded once by write()
+        self._vlans:Optional[Dict[str, Any]] = None
+
+    @staticmethod
+    def _clean(value:Optional[str]) -> str:
+        """Get a description or note, or an empty string if it is empty or written by the autodiscovery."""
+        if not value or _AUTODISCOVER.match(value):
+            return ''
+        return value
+
+    def _vlanNumber(self, server:Any, sn:ipamSubnet) -> Any:
+        """Get the number (802.1Q tag) of the VLAN of a subnet, or 0 if it has none."""
+        try:
+            vlanId = int(sn.getvlanId() or 0)
+        except (TypeError, ValueError):
+            return 0
+        if vlanId <= 0:
+            return 0
+        if self._vlans is not None:
+            return self._vlans.get(str(vlanId), 0)
+        try:
+            vList = server.findVLANbyId(id = vlanId)
+            return vList[0].getNumber() if len(vList) == 1 else 0
+        except Exception as e:
+            return 0
+
+    def fetch(self, server:Any, sn:ipamSubnet) -> Tuple[Any, Sequence[ipamAddress]]:
+        """Get the data of the report of a subnet.
+        :param server: The ipamServer object used to fetch the data (a worker copy when fetched in parallel).
+        :return: A tuple (vlan number, addresses)."""
+        return self._vlanNumber(server, sn), server.findIPsbyNet(sn)
+
+    def rows(self, sn:ipamSubnet, vlanid:Any, addresses:Iterable[ipamAddress]) -> Iterator[Dict[str, Any]]:
+        """Get the values of the CSV and JSON Lines formats for the addresses of a subnet."""
+        network = f"{sn.getBaseaddr()}/{sn.getMask()}"
+        for a in addresses:
+            yield {'subnet': network, 'vlan': vlanid, 'ip': str(a.getIP()), 'hostname': a.getField('hostname') or '',
+                   'description': self._clean(a.getField('description')), 'note': self._clean(a.getField('note'))}
+
+    def renderPlain(self, sn:ipamSubnet, vlanid:Any, addresses:Iterable[ipamAddress]) -> str:
+        """Get the plain text report of a subnet."""
+        description = sn.getDescription()
+        routerIP = str(sn.getSubnet()[-2])
+        ipRange = f"{sn.getBaseaddr()}/{sn.getMask()}"
+        routerMask = sn.getMask()
+
+        lines:List[str] = [
+            _BANNER_LINE,
+            f"# vlan: {vlanid:3} red: {ipRange:18} {description:61}#\n",
+            f"# router: {routerIP:18} mask {routerMask:21}                                          #\n",
+            _BANNER_LINE,
+            "\n",
+        ]
+        for a in addresses:
+            description = self._clean(a.getField('description'))
+            note = self._clean(a.getField('note'))
+            host = a.getField('hostname',default='------')
+            if not host:
+                 host = '----------'
+            lines.append(f"{str(a.getIP()):15} {host.split('.')[0]:17} {'# ' + description if description else ''} {'# ' + note if note else ''}\n") # type: ignore
+        lines.append('\n\n')
+        return ''.join(lines)
+
+    def write(self, out:TextIO, subnets:Iterable[ipamSubnet]) -> List[Tuple[ipamSubnet, Exception]]:
+        """Write the report of the given subnets. Subnets whose data can't be fetched are skipped and their errors returned.
+        :param out: The file or object with a write() method receiving the report.
+        :param subnets: The subnets to report, in the order they are written.
+        :return: The subnets that could not be reported with their exceptions."""
+        errors:List[Tuple[ipamSubnet, Exception]] = []
+        try:
+            self._vlans = {str(v.getId()): v.getNumber() for v in self._server.getAllVLANs()}
+        except Exception as e:
+            mylogger.error(f"Error getting VLANs, looking them up by subnet: {str(e)}")
+            self._vlans = None
+        writer = None
+        if self.format == 'csv':
+            writer = csv.DictWriter(out, fieldnames=_COLUMNS, lineterminator='\n')
+            writer.writeheader()
+        for sn, data, error in self._server.parallelMap(self.fetch, subnets, maxWorkers=self.maxWorkers):
+            if error is not None:
+                errors.append((sn, error))
+                continue
+            vlanid, addresses = data
+            if self.format == 'plain':
+                out.write(self.renderPlain(sn, vlanid, addresses))
+            elif writer is not None:
+                writer.writerows(self.rows(sn, vlanid, addresses))
+            else:
+                out.write(''.join(json.dumps(row) + '\n' for row in self.rows(sn, vlanid, addresses)))
+        return errors
@@ -6,6 +6,8 @@ from typing import Optional
 
 class ipamScanAgent:
     """This object wraps a JSON dictionary representing a phpIPAM Scan Agent either returned by phpypam or created to insert a new agent."""
+    __slots__ = ('_agent',)
+
     def __init__(self, agent:dict) -> None:
         """Creates a new object. The object is initialized with a dictionary returned by phpypam.
         :param agent: A JSON dictionary returned by phpypam.
@@ -6,12 +6,14 @@ import logging
 
 mylogger = logging.getLogger()
 
-import sys, os, getpass, ssl
-import re
-import numpy as np
+import sys, os, ssl, copy, threading, weakref
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
 
 try:
     import phpypam
+    from phpypam.core.exceptions import PHPyPAMException, PHPyPAMInvalidSyntax
 except Exception as e:
     mylogger.critical(f"{str(e)}")
     mylogger.critical(f"Install modules: phpypam setuptools \n\twith 'pip3 install <module1> <module2> ...'")
@@ -21,20 +23,56 @@ from .ipamSubnet import ipamSubnet
 from .ipamAddress import ipamAddress, ipamTags
 from .ipamScanAgent import ipamScanAgent
 from .ipamVLAN import ipamVLAN
+from .ipamFreeSpace import ipamFreeSpace, ipamFreePoolIndex
+from .ipamSubnetIndex import ipamSubnetIndex
+from .ipamCache import ipamCache
+from .ipamTransport import ipamApi, ipamTokenStore, readPassword
+from .ipamStats import ipamStats
+from .ipamBatch import ipamWriteBatch
+from .ipamHeartbeat import ipamHeartbeat
+from .ipamSnapshot import ipamSnapshot
+from .ipamAddressTable import ipamAddressTable
+from .ipamQuery import ipamQuery
+from .ipamReport import ipamReport
 
 from ipaddress import IPv4Address, IPv6Address, IPv4Network, IPv6Network, ip_address
 
-from typing import Optional, Union, Sequence, Tuple, Any
+from typing import Optional, Union, Sequence, Tuple, Any, Dict, List, Callable, Iterable, Iterator, TextIO
+
+# Marks the threads of the pools of parallel operations
+_poolThread = threading.local()
+
+def _markPoolThread() -> None:
+    _poolThread.active = True
+
+def _shutdownPools(executors:Dict[int, ThreadPoolExecutor], workers:List[Tuple[threading.Thread, Any]], wait:bool = False) -> None:
+    """Stop the threads of the pools and close the sessions of the per-thread copies of a server."""
+    for executor in list(executors.values()):
+        executor.shutdown(wait=wait)
+    executors.clear()
+    for _, worker in list(workers):
+        worker.pi.close()
+    workers.clear()
 
 class ipamServer:
     """Manages a connection to a phpIPAM service and high level operations on addresses."""
-    def __init__(self, url:str = "", app_id:str = "", token:str= "", user:str = "", password:str = "", cacert:str = "") -> None:
+    def __init__(self, url:str = "", app_id:str = "", token:str= "", user:str = "", password:str = "", cacert:str = "",
+                 poolSize:int = 10, connectTimeout:float = 10.0, readTimeout:float = 60.0, retries:int = 3, backoff:float = 0.5,
+                 tokenCache:str = "", autoRefresh:bool = False) -> None:
         """Opens the connection to the service.
         :param url: The URL of the phpIPAM service.
         :param app_id: This is the identifier string of the client application operating at the phpIPAM service. It must have been registered before at the service and permissions given to access resources.
         :param token: When defining an application at the service, an exclusive access token is created to identify the client.
         :param username: The client can also authenticate using an username and a password.
         :param password: This is the password if a username is provided for authentication.
+        :param cacert: Path to the CA certificate file in PEM format or 'NONE' for not verifying the server certificate.
+        :param poolSize: Maximum number of keep-alive connections kept open to the service.
+        :param connectTimeout: Seconds to wait for a connection to be established.
+        :param readTimeout: Seconds to wait for the response of the service.
+        :param retries: Number of retries of idempotent requests (GET) after connection errors or 5xx responses.
+        :param backoff: Backoff factor in seconds between retries.
+        :param tokenCache: Path of a file used to share the authentication token with other processes. If empty, the token is only shared by the threads of this object.
+        :param autoRefresh: Renew the authentication token in a background timer before it expires.
         """
         
         # Get default parameters from environment
@@ -65,48 +103,214 @@ class ipamServer:
         if not password:
             raise Exception("Empty password. Can't connect to any server.")
 
-        if self.cacert != "NONE":
-            context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
-            context.load_verify_locations(self.cacert)
-            context.check_hostname = True
-            context.verify_mode = ssl.CERT_REQUIRED
-        else:
-            context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
-            context.check_hostname = False
-            context.verify_mode = ssl.CERT_NONE
+        # Free space models of subnets kept between allocations
+        self.freePools = ipamFreePoolIndex()
+        # Read-through caches of lookups by controller (disabled until setCache is called)
+        self._caches:Dict[str, Any] = {}
+        # Per-thread copies of this object used by parallel operations, with their threads so their sessions can be closed
+        self._local = threading.local()
+        self._workers:List[Tuple[threading.Thread, "ipamServer"]] = []
+        # Pools of threads of parallel operations by number of threads, kept between operations
+        self._executors:Dict[int, ThreadPoolExecutor] = {}
+        self._poolLock = threading.Lock()
+        # Labels of the search filters rejected by the service, searched without them from then on
+        self._rejectedSearches:set = set()
+
+        context = self._sslContext(self.cacert)
 
         # Create the API for IPAM service
         try:
-            self.pi:phpypam.api = phpypam.api(
+            self.pi:ipamApi = ipamApi(
                 url=self.url,
                 app_id=self.app_id,
                 token=self.token,
-                encryption=False,
                 username=self.user,
                 password=password,
-                ssl_verify=False
+                sslContext=context,
+                ssl_verify=self.cacert if self.cacert != "NONE" else False,
+                poolSize=poolSize,
+                connectTimeout=connectTimeout,
+                readTimeout=readTimeout,
+                retries=retries,
+                backoff=backoff,
+                tokenStore=ipamTokenStore(tokenCache, key=ipamTokenStore.keyOf(self.url, self.app_id, self.user)),
+                autoRefresh=autoRefresh
             )
             #controllers = pi.controllers()
         except Exception as e:
             raise Exception(f"Error connecting to IPAM server {url}:") from e
+        # Idle threads of the pools are stopped when this object is released without calling close()
+        weakref.finalize(self, _shutdownPools, self._executors, self._workers)
+
+    @staticmethod
+    def _sslContext(cacert:str) -> ssl.SSLContext:
+        """Build the SSL context for connecting to the service.
+        :param cacert: Path to the CA certificate file in PEM format or 'NONE' for not verifying the server certificate."""
+        if cacert != "NONE":
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+            context.load_verify_locations(cacert)
+            context.check_hostname = True
+            context.verify_mode = ssl.CERT_REQUIRED
+        else:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+        return context
 
     def _getpassword(self) -> str:
         """Read a string from console disabling terminal echo for privacy.
         
-            Returns: An string or an exception if CTRL-C is pressed.
+            Returns: An string or an empty string if CTRL-C is pressed.
         """
-        try:
-            # Prompt the user for a password (the default prompt is "Password:")
-            password = getpass.getpass("Password: ")
-        except KeyboardInterrupt:
-            mylogger.error("Operation canceled by user")
-            password = ''
-        except Exception:
-            mylogger.error("Error reading password from console")
-            password = ''
-
-        return password
+        return readPassword()
         
+    ################################################
+
+    def setCache(self, controller:str, ttl:float = 60.0, maxSize:int = 1024, cache:Any = None) -> None:
+        """Enable caching of lookups on a controller of the phpIPAM service.
+        Cached lookups are findVLANbyId ('vlan'), dns_subnet ('tools/nameservers'), findSubnetsbyIPMask ('subnets')
+        and getAllScanAgents ('tools/scanagents').
+        :param controller: The name of the controller.
+        :param ttl: Seconds a result is valid.
+        :param maxSize: Maximum number of results kept. The least recently used result is evicted first.
+        :param cache: A cache object replacing the default ipamCache. It must provide get(), put(), invalidate() and getStats()."""
+        self._caches[controller] = cache if cache is not None else ipamCache(ttl=ttl, maxSize=maxSize)
+
+    def invalidateCache(self, controller:str = '', key:Any = None) -> None:
+        """Discard cached results.
+        :param controller: The name of the controller. If empty, the caches of all the controllers are cleared.
+        :param key: The key of a result in the cache of the controller. If None, all the results of the controller are discarded."""
+        for name, cache in self._caches.items():
+            if not controller or name == controller:
+                cache.invalidate(key)
+
+    def getCacheStats(self) -> Dict[str, Dict[str, int]]:
+        """Get the statistics of use of the caches.
+        :return: A dictionary with the statistics of the cache of every controller."""
+        return {name: cache.getStats() for name, cache in self._caches.items()}
+
+    def _cachedGet(self, controller:str, controller_path:Optional[str] = None) -> Any:
+        """Get an entity through the cache of the controller if it is enabled.
+        A 'not found' result is also cached and raised again as PHPyPAMEntityNotFoundException."""
+        cache = self._caches.get(controller)
+        if cache is None:
+            return self.pi.get_entity(controller=controller, controller_path=controller_path)
+        found, value = cache.get(controller_path)
+        if not found:
+            try:
+                value = self.pi.get_entity(controller=controller, controller_path=controller_path)
+            except phpypam.PHPyPAMEntityNotFoundException:
+                value = None
+            cache.put(controller_path, value)
+        if value is None:
+            raise phpypam.PHPyPAMEntityNotFoundException(f"No {controller} found")
+        # Callers get their own copy as wrappers modify their dictionaries
+        return copy.deepcopy(value)
+
+    ################################################
+
+    def getRequestStats(self) -> ipamStats:
+        """Get the statistics of the requests sent to the phpIPAM service by this object and by its parallel operations.
+        :return: An ipamStats object with the call counts, bytes and latency histograms by controller."""
+        return self.pi.getStats()
+
+    def close(self) -> None:
+        """Stop the threads of the parallel operations and close the sessions of this object and of its per-thread copies.
+        It must not be called from a parallel operation."""
+        with self._poolLock:
+            _shutdownPools(self._executors, self._workers, wait=True)
+        self.pi.close()
+
+    def __enter__(self) -> "ipamServer":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def _workerServer(self) -> "ipamServer":
+        """Get the copy of this object used by the current thread. Copies have their own phpypam session sharing the
+        authentication token, free pools and caches of this object."""
+        worker = getattr(self._local, 'server', None)
+        if worker is None:
+            worker = copy.copy(self)
+            worker.pi = copy.copy(self.pi)
+            self._local.server = worker
+            with self._poolLock:
+                self._workers.append((threading.current_thread(), worker))
+        return worker
+
+    @contextmanager
+    def _pool(self, maxWorkers:int) -> Iterator[ThreadPoolExecutor]:
+        """Get a pool of threads for a parallel operation. Pools are kept between operations, so their threads and the
+        sessions of their copies of this object are reused. Operations started from a thread of a pool (e.g. a write
+        batch flushed by a function of parallelMap) get a temporary pool, as waiting for their own pool could block it.
+        :param maxWorkers: The number of threads."""
+        if not getattr(_poolThread, 'active', False):
+            with self._poolLock:
+                executor = self._executors.get(maxWorkers)
+                if executor is None:
+                    executor = ThreadPoolExecutor(max_workers=maxWorkers, initializer=_markPoolThread)
+                    self._executors[maxWorkers] = executor
+            yield executor
+            return
+        with ThreadPoolExecutor(max_workers=maxWorkers, initializer=_markPoolThread) as executor:
+            yield executor
+        # Close the sessions of the copies used by the threads of the temporary pool
+        with self._poolLock:
+            finished = [(t, w) for t, w in self._workers if not t.is_alive()]
+            self._workers[:] = [(t, w) for t, w in self._workers if t.is_alive()]
+        for _, worker in finished:
+            worker.pi.close()
+
+    def parallelMap(self, method:Union[str, Callable[..., Any]], subnets:Iterable[ipamSubnet], *args, maxWorkers:int = 8, ordered:bool = True, **kwargs) -> Iterator[Tuple[ipamSubnet, Any, Optional[Exception]]]:
+        """Run an operation on many subnets using a bounded pool of threads, each one with its own phpypam session.
+        Results are streamed as they are available and errors are collected per subnet instead of being raised.
+
+        :param method: The name of a method of this class taking a subnet as first argument (e.g. 'findIPsbyNet',
+            'listSubnetPlain' or 'annotate_subnet') or a function taking an ipamServer object and a subnet.
+        :param subnets: The subnets to operate on.
+        :param args: Additional positional arguments of the method.
+        :param maxWorkers: The number of threads.
+        :param ordered: Yield results in the order of the subnets. If False, results are yielded as soon as they are completed.
+        :param kwargs: Additional keyword arguments of the method.
+        :return: An iterator of tuples (subnet, result, exception). 'exception' is None if the operation succeeded."""
+        def _run(sn:ipamSubnet) -> Tuple[ipamSubnet, Any, Optional[Exception]]:
+            worker = self._workerServer()
+            try:
+                if isinstance(method, str):
+                    return sn, getattr(worker, method)(sn, *args, **kwargs), None
+                return sn, method(worker, sn, *args, **kwargs), None
+            except Exception as e:
+                mylogger.error(f"Error in subnet {sn}: {str(e)}")
+                return sn, None, e
+
+        def _completed(pending:"deque[Future]") -> List[Tuple[ipamSubnet, Any, Optional[Exception]]]:
+            """Wait for the next result (or results if unordered) and remove them from the pending operations."""
+            if ordered:
+                return [pending.popleft().result()]
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for f in done:
+                pending.remove(f)
+            return [f.result() for f in done]
+
+        # Keep a bounded window of pending operations for backpressure
+        window = 2 * maxWorkers
+        with self._pool(maxWorkers) as executor:
+            pending:"deque[Future]" = deque()
+            try:
+                for sn in subnets:
+                    pending.append(executor.submit(_run, sn))
+                    while len(pending) >= window:
+                        yield from _completed(pending)
+                while pending:
+                    yield from _completed(pending)
+            finally:
+                # Operations not started are dropped if the caller stops iterating
+                for f in pending:
+                    f.cancel()
+
+    ################################################
+
     def getAllSections(self) -> Sequence[Any]:
         try:
             return self.pi.get_entity(controller='sections') # type: ignore
@@ -121,13 +325,17 @@ class ipamServer:
         except phpypam.PHPyPAMEntityNotFoundException as e:
             return []
     
-    def getAllAddresses(self) -> Sequence[ipamAddress]:
+    def getAllAddresses(self, asTable:bool = False) -> Union[Sequence[ipamAddress], ipamAddressTable]:
         """Get all the IP addresses defined at the phpIPAM service.
+        :param asTable: Return the addresses in an ipamAddressTable object.
         :return: An array with ipamAddress objects representing the addresses."""
         try:
-            return [ipamAddress(addr=a) for a in self.pi.get_entity(controller='addresses')] # type: ignore
+            addresses = self.pi.get_entity(controller='addresses')
         except phpypam.PHPyPAMEntityNotFoundException as e:
-            return []
+            addresses = []
+        if asTable:
+            return ipamAddressTable(addresses) # type: ignore
+        return [ipamAddress(addr=a) for a in addresses] # type: ignore
             
     def getAllVLANs(self) -> Sequence[ipamVLAN]:
         """Get all the VLANs defined at the phpIPAM service.
@@ -141,10 +349,53 @@ class ipamServer:
         """Get all the Scan Agents defined at the phpIPAM service.
         :return: An array with dictionary objects representing the scanners."""
         try:
-            return [ipamScanAgent(agent) for agent in self.pi.get_entity(controller='tools/scanagents')] # type: ignore
+            return [ipamScanAgent(agent) for agent in self._cachedGet(controller='tools/scanagents')] # type: ignore
         except phpypam.PHPyPAMEntityNotFoundException as e:
             return []
 
+    def iterAllSubnets(self) -> Iterator[ipamSubnet]:
+        """Iterate over all the subnets defined at the phpIPAM service. Subnets are yielded while the response is received.
+        :return: An iterator of ipamSubnet objects."""
+        try:
+            for s in self.pi.iter_entity(controller='subnets'):
+                yield ipamSubnet(s)
+        except phpypam.PHPyPAMEntityNotFoundException as e:
+            return
+
+    def iterAllAddresses(self, maxWorkers:int = 1) -> Iterator[ipamAddress]:
+        """Iterate over all the IP addresses defined at the phpIPAM service, fetching them subnet by subnet.
+        Only the addresses of the subnets being fetched are kept in memory.
+        :param maxWorkers: Number of subnets fetched in parallel. With 1, addresses are yielded while they are received.
+        :return: An iterator of ipamAddress objects."""
+        if maxWorkers <= 1:
+            for sn in self.iterAllSubnets():
+                yield from self.iterIPsbyNet(sn)
+            return
+        for sn, addresses, error in self.parallelMap('findIPsbyNet', self.iterAllSubnets(), maxWorkers=maxWorkers):
+            if error is not None:
+                raise error
+            yield from addresses
+
+    def getSubnetIndex(self) -> ipamSubnetIndex:
+        """Get all the subnets defined at the phpIPAM service in a local index for fast lookup of the subnets containing an address.
+        :return: An ipamSubnetIndex object with all the subnets."""
+        return ipamSubnetIndex(self.getAllSubnets())
+
+    def exportSnapshot(self, path:str) -> Dict[str, int]:
+        """Write a snapshot of the sections, subnets, addresses, VLANs, scan agents and nameservers of the service to a file.
+        The snapshot can be queried offline with an ipamSnapshot object.
+        :param path: The path of the snapshot file. It is replaced atomically.
+        :return: A dictionary with the number of rows of every table."""
+        controllers = {'sections': 'sections', 'subnets': 'subnets', 'addresses': 'addresses', 'vlans': 'vlan',
+                       'scanagents': 'tools/scanagents', 'nameservers': 'tools/nameservers'}
+        tables = {}
+        for table, controller in controllers.items():
+            try:
+                tables[table] = self.pi.get_entity(controller=controller) or []
+            except phpypam.PHPyPAMEntityNotFoundException as e:
+                tables[table] = []
+        return ipamSnapshot.write(path, tables, source=self.url)
+
     ################################################
 
     def findSubnetsbyIPMask(self, base_ip:Union[IPv4Address, IPv6Address], mask:int) -> Sequence[ipamSubnet]:
@@ -154,7 +405,7 @@ class ipamServer:
         :return: An array with ipamSubnet objects representing the subnets matching the search criteria."""
         base_addr = str(base_ip)
         try:
-            return [ipamSubnet(s) for s in self.pi.get_entity(controller='subnets', controller_path=f'/search/{base_addr}/{str(mask)}')] # type: ignore
+            return [ipamSubnet(s) for s in self._cachedGet(controller='subnets', controller_path=f'/search/{base_addr}/{str(mask)}')] # type: ignore
         except phpypam.PHPyPAMEntityNotFoundException as e:
             return []
 
@@ -164,7 +415,11 @@ class ipamServer:
         :param id: The database ID of the VLAN.
         :return: An array with ipamVLAN objects containing the desired VLAN ir an empty list."""
         try:
-            return [ipamVLAN(v) for v in self.pi.get_entity(controller='vlan', controller_path=f"/{id}")] # type: ignore
+            vlans = self._cachedGet(controller='vlan', controller_path=f"/{id}")
+            # A single VLAN is returned as a dictionary
+            if isinstance(vlans, dict):
+                vlans = [vlans]
+            return [ipamVLAN(v) for v in vlans] # type: ignore
         except phpypam.PHPyPAMEntityNotFoundException as e:
             return []
 
@@ -191,122 +446,133 @@ class ipamServer:
         except phpypam.PHPyPAMEntityNotFoundException as e:
             return []
 
-    def findIPsbyNet(self, subnet:ipamSubnet) -> Sequence[ipamAddress]:
+    def findIPsbyNet(self, subnet:ipamSubnet, asTable:bool = False) -> Union[Sequence[ipamAddress], ipamAddressTable]:
         """Find all the IP addresses registered inside a subnet at the phpIPAM service.
         :param subnet: An object representing the subnet.
+        :param asTable: Return the addresses in an ipamAddressTable object.
         :return: An array with ipamAddress objects representing the addresses registered in this subnet."""
         try:
-            return [ipamAddress(addr=a) for a in self.pi.get_entity(controller='subnets', controller_path=f'{subnet.getId()}/addresses')] # type: ignore
+            addresses = self.pi.get_entity(controller='subnets', controller_path=f'{subnet.getId()}/addresses')
         except phpypam.PHPyPAMEntityNotFoundException as e:
-            return []
+            addresses = []
+        if asTable:
+            return ipamAddressTable(addresses) # type: ignore
+        return [ipamAddress(addr=a) for a in addresses] # type: ignore
 
-    def findIPsbyField(self, subnet:ipamSubnet, field:str, pattern:str) -> Sequence[ipamAddress]:
+    def findIPsbyField(self, subnet:ipamSubnet, field:str, pattern:str, asTable:bool = False) -> Union[Sequence[ipamAddress], ipamAddressTable]:
         """Find all the IP addresses registered inside a subnet whose value of 'field' matches the given pattern .
         :param subnet: An object representing the subnet.
         :param field: The name of the field to match.
         :param pattern: A regular expression defining a pattern for matching values.
+        :param asTable: Return the addresses in an ipamAddressTable object.
         :return: An array with ipamAddress objects representing the addresses registered in this subnet matching the filter."""
-        addresses = self.findIPsbyNet(subnet)
+        if asTable:
+            query = ipamQuery(field, pattern)
+            return ipamAddressTable(self._iterSearch(query, query.getSearches(subnet.getId())))
+        return list(self.iterIPsbyField(subnet, field, pattern))
+
+    def searchIPs(self, field:str, pattern:str, subnets:Optional[Iterable[ipamSubnet]] = None, asTable:bool = False) -> Union[Sequence[ipamAddress], ipamAddressTable]:
+        """Find the IP addresses of all the subnets whose value of 'field' matches the given pattern with a single query.
+        The literal prefix of the pattern is sent to the service (see ipamQuery) and the whole pattern is checked locally.
+        If the pattern has no literal prefix or the service rejects every filter, all the addresses of the service are
+        downloaded and filtered locally: the cost grows with the size of the whole inventory and it can be tens of times
+        slower than searching the subnets of interest with findIPsbyField. A warning is logged when that happens.
+        :param field: The name of the field to match.
+        :param pattern: A regular expression defining a pattern for matching values.
+        :param subnets: Return only the addresses of these subnets. By default, the addresses of all the subnets.
+        :param asTable: Return the addresses in an ipamAddressTable object.
+        :return: An array with ipamAddress objects representing the addresses matching the filter."""
+        query = ipamQuery(field, pattern)
+        rows = self._iterSearch(query, query.getSearches())
+        if subnets is not None:
+            subnetIds = {str(sn.getId()) for sn in subnets}
+            rows = (row for row in rows if str(row.get('subnetId')) in subnetIds)
+        if asTable:
+            return ipamAddressTable(rows)
+        return [ipamAddress(addr=a) for a in rows]
+
+    def _iterSearch(self, query:ipamQuery, searches:Sequence[Tuple[Any, ...]]) -> Iterator[Dict[str, Any]]:
+        """Iterate over the dictionaries of the addresses returned by the first search not rejected by the service that match the query.
+        :param query: The plan of the search.
+        :param searches: The requests (label, controller, controller_path, params) to try in order."""
+        for label, controller, path, params in searches:
+            if label in self._rejectedSearches:
+                continue
+            if label is None and controller == 'addresses':
+                reason = 'filters rejected by the service' if query.getParams() else 'pattern without literal prefix'
+                mylogger.warning(f"Search of {query.field} matching '{query.pattern}' downloads all the addresses ({reason})")
+            try:
+                for row in self.pi.iter_entity(controller=controller, controller_path=path, params=params):
+                    if query.matches(row):
+                        yield row
+                return
+            except phpypam.PHPyPAMEntityNotFoundException as e:
+                return
+            except (PHPyPAMException, PHPyPAMInvalidSyntax) as e:
+                if label is None:
+                    raise
+                mylogger.warning(f"Search {label} rejected by the service, filtering locally: {str(e) or type(e).__name__}")
+                self._rejectedSearches.add(label)
+
+    def iterIPsbyNet(self, subnet:ipamSubnet) -> Iterator[ipamAddress]:
+        """Iterate over the IP addresses registered inside a subnet. Addresses are yielded while the response is received.
+        :param subnet: An object representing the subnet.
+        :return: An iterator of ipamAddress objects."""
         try:
-            return [a for a in addresses if re.match(pattern, a.getField(field,''))] # type: ignore
+            for a in self.pi.iter_entity(controller='subnets', controller_path=f'{subnet.getId()}/addresses'):
+                yield ipamAddress(addr=a)
         except phpypam.PHPyPAMEntityNotFoundException as e:
-            return []
+            return
+
+    def iterIPsbyField(self, subnet:ipamSubnet, field:str, pattern:str) -> Iterator[ipamAddress]:
+        """Iterate over the IP addresses registered inside a subnet whose value of 'field' matches the given pattern.
+        :param subnet: An object representing the subnet.
+        :param field: The name of the field to match.
+        :param pattern: A regular expression defining a pattern for matching values.
+        :return: An iterator of ipamAddress objects."""
+        query = ipamQuery(field, pattern)
+        for a in self._iterSearch(query, query.getSearches(subnet.getId())):
+            yield ipamAddress(addr=a)
 
     ################################################
 
     def _firstFit2(self, range:Union[IPv4Network, IPv6Network], used_ips:Sequence[Union[IPv4Address, IPv6Address]], num) -> Sequence[Union[IPv4Address, IPv6Address]]:
         # List of contiguous addresses
         freePool:Sequence[Union[IPv4Address, IPv6Address]] = []
-        # Go through the IP range of the subnet
-        for addr in range:
-            if addr in used_ips:
-                # If current address is used, reset our pool
-                freePool = []
-            else:
-                # Add another contiguous address to the pool
-                freePool.append(addr)
-                # If there are enough addresses, return
-                if len(freePool)>= num:
-                    return freePool
-        return []
+        startIP = ipamFreeSpace(range, used_ips).find(num, 'FirstFit')
+        if startIP is not None:
+            while len(freePool) < num:
+                freePool.append(startIP + len(freePool)) # type: ignore
+        return freePool
 
     def _pools(self, netRange:Union[IPv4Network, IPv6Network], used_ips:Sequence[Union[IPv4Address, IPv6Address]]) -> Sequence[Tuple[Union[IPv4Address, IPv6Address], int]]:
-        # List of contiguous addresses
-        pools = []
-        startIP = None
-        count = 0
-        # Go through the IP range of the subnet
-        for addr in netRange.hosts():
-            if addr not in used_ips:
-                if count > 0:
-                    # If current pool not empty add it
-                    count += 1
-                else:
-                    # If current address is used, reset our pool
-                    startIP = addr
-                    count = 1
-            else:
-                if count > 0:
-                    # Add another pool to the list
-                    pools.append((startIP,count))
-                    count = 0
-        if count > 0:
-            # Add last pool to the list
-            pools.append((startIP,count))
-        return pools
+        # Pools of contiguous free addresses computed from the gaps between used addresses
+        return ipamFreeSpace(netRange, used_ips).pools()
 
     def _bestFit(self, netRange:Union[IPv4Network, IPv6Network], used_ips:Sequence[Union[IPv4Address, IPv6Address]], num) -> Union[IPv4Network, IPv6Network, None]:
-        # Get all pools
-        pools = self._pools(netRange, used_ips=used_ips)
-        # Get suitable pools
-        suitable = [(ip,l) for ip,l in pools if l>=num]
-        if not suitable:
-            # No pool has enough size
-            return None
-        
-        # Get best pool
-        best = np.min([l for ip,l in pools if l>=num])
-        bestpool = [(ip,l) for ip,l in pools if l==best].pop()
-        return bestpool[0] # type: ignore
+        # Smallest pool with enough addresses
+        return ipamFreeSpace(netRange, used_ips).find(num, 'BestFit') # type: ignore
 
     def _worstFit(self, netRange:Union[IPv4Network, IPv6Network], used_ips:Sequence[Union[IPv4Address, IPv6Address]], num) -> Union[IPv4Network, IPv6Network, None]:
-        # Get all pools
-        pools = self._pools(netRange, used_ips=used_ips)
-        # Get suitable pools
-        suitable = [(ip,l) for ip,l in pools if l>=num]
-        if not suitable:
-            # No pool has enough size
-            return None
-        
-        # Get worst pool
-        worst = np.max([l for ip,l in pools if l>=num])
-        worstpool = [(ip,l) for ip,l in pools if l==worst].pop()
-        return worstpool[0] # type: ignore
+        # Largest pool with enough addresses
+        return ipamFreeSpace(netRange, used_ips).find(num, 'WorstFit') # type: ignore
 
     def _firstFit(self, range:Union[IPv4Network, IPv6Network], used_ips:Sequence[Union[IPv4Address, IPv6Address]], num) -> Union[IPv4Network, IPv6Network, None]:
-        # List of contiguous addresses
-        startIP = None
-        endIP = None
-        # Go through the IP range of the subnet
-        for addr in range:
-            if addr in used_ips:
-                # If current address is used, reset our pool
-                startIP = None
-                endIP = None
-            else:
-                if startIP:
-                    # Add another contiguous address to the pool
-                    endIP = addr
-                else:
-                    # Start a Pool
-                    startIP = addr
-                    endIP = addr
-                # If there are enough addresses, return
-                if startIP + num - 1 == addr:
-                    return startIP # type: ignore
-        return None
-
-    def findFree(self, subnet:ipamSubnet, num:int, fitAlg:str = 'FirstFit') -> Sequence[ipamAddress]:
+        # First pool with enough addresses
+        return ipamFreeSpace(range, used_ips).find(num, 'FirstFit') # type: ignore
+
+    def _freeSpace(self, subnet:ipamSubnet, vectorized:Optional[bool] = None, refresh:bool = False) -> ipamFreeSpace:
+        """Get the free space model of a subnet from the index or build it from the addresses registered in the subnet."""
+        space = None if refresh else self.freePools.get(subnet)
+        if space is None:
+            netRange = subnet.getSubnet()
+            # Integer values of the addresses avoid building address objects
+            used_ips = [u.getIPInt() for u in self.iterIPsbyNet(subnet) if u.getVersion() == netRange.version]
+            space = ipamFreeSpace.fromUsed(netRange, used_ips, vectorized=vectorized)
+            self.freePools.put(subnet, space)
+        return space
+
+    def findFree(self, subnet:ipamSubnet, num:int, fitAlg:str = 'FirstFit', align:int = 1, vectorized:Optional[bool] = None, refresh:bool = False) -> Sequence[ipamAddress]:
         """Finds a block of exactly 'num' contiguous free IP addresses inside given subnet using the indicated optimization algorithm.
         This function does not reserve or lock the addresses. If there are concurrent clients, you must arbitrate clients so that
         no other client is given the same addresses before registration. Registration will fail if another client has registered
@@ -315,46 +581,111 @@ class ipamServer:
         :param subnet: The subnet in which the address is sought.
         :param num: The number of contiguous addresses to return.
         :param fitAlg: The name of the algorithm to use. Default is 'FirstFit'. 'WorstFit' and 'BestFit' are also available.
+        :param align: The first address of the block must be a multiple of this number. Default is 1 (no alignment).
+        :param vectorized: Use the NumPy free space model (IPv4 only). By default it is used for IPv4 subnets with many registered addresses.
+        :param refresh: Fetch the addresses of the subnet even if its free space model is still valid in the index.
         :return: A list of contiguous free IP addresses. If not enough addresses are found, an empty list is returned."""
-        used = self.findIPsbyNet(subnet)
-        used_ips = [u.getIP() for u in used]
-        netRange = subnet.getSubnet()
-        if fitAlg == 'FirstFit':
-                startIP = self._firstFit(netRange, used_ips, num)
-        elif fitAlg == 'BestFit':
-                startIP = self._bestFit(netRange, used_ips, num)
-        elif fitAlg == 'WorstFit':
-                startIP = self._worstFit(netRange, used_ips, num)
-        else:
-                startIP = self._firstFit(netRange, used_ips, num)
+        # Answer the request from the gaps of the free space model of the subnet
+        space = self._freeSpace(subnet, vectorized=vectorized, refresh=refresh)
+        startIP = space.find(num, fitAlg, align)
 
-        if startIP: # type: ignore
+        if startIP is not None:
             return [ipamAddress(ip=startIP + offset, subnet=subnet) for offset in range(num) ] # type: ignore
         else:
             return []
         
+    def allocateBulk(self, requests:Sequence[Tuple[Any, ...]], register:bool = True, maxWorkers:int = 8) -> Sequence[Sequence[ipamAddress]]:
+        """Allocates many blocks of contiguous free IP addresses across many subnets in one planning pass.
+        The addresses of every subnet are fetched only once and all the blocks are planned against the same free space
+        models, so blocks of the same batch never overlap. Planned addresses are then registered concurrently.
+
+        :param requests: A list of tuples (subnet, num[, fitAlg[, fields]]) where 'fields' is an optional dictionary of
+            fields (description, hostname, ...) set on every address of the block before registration.
+        :param register: Register the planned addresses at the phpIPAM service. If False, addresses are only planned and
+            they are not reserved for later calls.
+        :param maxWorkers: The maximum number of concurrent requests to the phpIPAM service.
+        :return: A list with one list of ipamAddress objects per request. A list is empty if the subnet has not enough
+            free addresses. Addresses whose registration failed are logged and removed from the lists."""
+        # Fetch the free space model of every subnet once
+        subnets:Dict[str, ipamSubnet] = {}
+        for req in requests:
+            subnets.setdefault(str(req[0].getId()), req[0])
+        with self._pool(maxWorkers) as executor:
+            spaces = dict(zip(subnets.keys(), executor.map(lambda sn: self._workerServer()._freeSpace(sn), subnets.values())))
+
+        # Plan all the blocks against the shared models
+        plans:List[List[ipamAddress]] = []
+        for req in requests:
+            subnet, num = req[0], req[1]
+            fitAlg = req[2] if len(req) > 2 else 'FirstFit'
+            fields = req[3] if len(req) > 3 and req[3] else {}
+            space = spaces[str(subnet.getId())]
+            startIP = space.find(num, fitAlg)
+            block:List[ipamAddress] = []
+            if startIP is not None:
+                space.markUsed(startIP, num)
+                for offset in range(num):
+                    newAddr = ipamAddress(ip=startIP + offset, subnet=subnet) # type: ignore
+                    newAddr.getDictionary().update(fields)
+                    block.append(newAddr)
+            else:
+                mylogger.error(f"Not enough free addresses in subnet {subnet} for a block of {num} addresses")
+            plans.append(block)
+
+        if not register:
+            # Planned addresses are not reserved
+            for subnetId in spaces.keys():
+                self.freePools.invalidate(subnetId)
+            return plans
+
+        # Register planned addresses with bounded concurrency
+        def _register(addr:ipamAddress) -> bool:
+            try:
+                self._workerServer().registerIP(addr)
+                return True
+            except Exception as e:
+                mylogger.error(f"Error registering address {addr}: {str(e)}")
+                return False
+
+        with self._pool(maxWorkers) as executor:
+            results = iter(list(executor.map(_register, [a for block in plans for a in block])))
+        return [[a for a in block if next(results)] for block in plans]
+
     def registerIP(self, addr:ipamAddress) -> Optional[ipamAddress]:
         """Register a free IP address at phpIPAM service. If the address has been registered before,
         registration will fail.
         :param addr: The IP address to register."""
-        newAddr = self.pi.create_entity(controller='addresses', data=addr.getDictionary())
+        try:
+            newAddr = self.pi.create_entity(controller='addresses', data=addr.getDictionary())
+        except Exception:
+            # The address may have been registered by another client
+            self.freePools.invalidate(addr.getSubnetId())
+            raise
+        self.freePools.markUsed(addr.getSubnetId(), addr.getIP())
+        addr.clearChanges()
         if newAddr:
             return ipamAddress(newAddr)
         else:
             return None
 
+    @staticmethod
+    def _checkRemovable(addr:ipamAddress) -> None:
+        """Raise PermissionError if the address is protected against removal through the API."""
+        # Block remove  for locked addresses
+        if addr.getFieldInt('custom_apiblock') == 1 or addr.getFieldInt('custom_apinotremovable') == 1:
+            raise PermissionError("API can't remove protected addresses")
+        # Block remove  for special tags and routers
+        if addr.getFieldInt('tag') > ipamTags.TAG_used or addr.getFieldInt('is_gateway') == 1:
+            raise PermissionError("API can't remove addresses marked as special ones")
+
     def unregisterIP(self, addr:ipamAddress, force:bool=False):
         """Release the registration of an IP address at the phpIPAM service.
         :param addr: The IP address to unregister."""
         if not force:
-            # Block remove  for locked addresses
-            if addr.getFieldInt('custom_apiblock') == 1 or addr.getFieldInt('custom_apinotremovable') == 1:
-                raise PermissionError("API can't remove protected addresses")
-            # Block remove  for special tags and routers
-            if addr.getFieldInt('tag') > ipamTags.TAG_used or addr.getFieldInt('is_gateway') == 1:
-                raise PermissionError("API can't remove addresses marked as special ones")
+            self._checkRemovable(addr)
 
         self.pi.delete_entity(controller='addresses', controller_path=f'{addr.getId()}')
+        self.freePools.markFree(addr.getSubnetId(), addr.getIP())
 
     ################################################
 
@@ -363,27 +694,51 @@ class ipamServer:
         :param agent: The scan agent to update."""
         params = agent.updateLastAccess()
         self.pi.update_entity(controller='tools/scanagents', controller_path=f'{agent.getId()}', params=params)
+        self.invalidateCache('tools/scanagents')
 
     def updateSubnetLastScan(self, subnet:ipamSubnet) -> None:
         """Update the last scan date of a subnet.
         :param subnet: The subnet to update."""
         params = subnet.updateLastScan()
         self.pi.update_entity(controller='subnets', controller_path=f'{subnet.getId()}', params=params)
+        self.invalidateCache('subnets')
 
     def updateSubnetLastDiscovery(self, subnet:ipamSubnet) -> None:
         """Update the last scan date of a subnet.
         :param subnet: The subnet to update."""
         params = subnet.updateLastDiscovery()
         self.pi.update_entity(controller='subnets', controller_path=f'{subnet.getId()}', params=params)
+        self.invalidateCache('subnets')
 
     def updateAddress(self, address:ipamAddress) -> None:
-        """Update the last scan date of a subnet.
+        """Update the fields of an address modified since it was read from the service. Nothing is sent if no field has changed.
         :param address: The address to update."""
-        params = {}
-        for key in address._updated:
-            params[key] = address.getField(key)
+        params = address.getChanges()
+        if not params:
+            return
+        self._updateAddressFields(address, params)
+        address.clearChanges(params)
+
+    def _updateAddressFields(self, address:ipamAddress, params:Dict[str, Any]) -> None:
+        """Send the given fields of an address to the service."""
         self.pi.update_entity(controller='addresses', controller_path=f'{address.getId()}', params=params)
 
+    def writeBatch(self, maxWorkers:int = 8, maxPending:int = 1000) -> ipamWriteBatch:
+        """Create a batch of writes of addresses sent with bounded concurrency. Use it as a context manager.
+        :param maxWorkers: The maximum number of concurrent requests.
+        :param maxPending: The number of pending writes that triggers a flush.
+        :return: An ipamWriteBatch object."""
+        return ipamWriteBatch(self, maxWorkers=maxWorkers, maxPending=maxPending)
+
+    def heartbeat(self, minInterval:float = 3600.0, agent:Optional[ipamScanAgent] = None, maxWorkers:int = 8, maxPending:int = 1000) -> ipamHeartbeat:
+        """Create an aggregator of the last seen dates of the addresses found by a scan. Use it as a context manager.
+        :param minInterval: Seconds the last seen date of an address is kept if it is newer than that.
+        :param agent: The scan agent whose last access date is updated when the aggregator is flushed.
+        :param maxWorkers: The maximum number of concurrent requests.
+        :param maxPending: The number of pending address writes that triggers a flush of the addresses.
+        :return: An ipamHeartbeat object."""
+        return ipamHeartbeat(self, minInterval=minInterval, agent=agent, maxWorkers=maxWorkers, maxPending=maxPending)
+
     ################################################
     
     def annotate_address(self, ipAddress:Union[IPv4Address, IPv6Address], sn:ipamSubnet, description:str, tag:int=2, apiblock:int = 0, apinotremovable:int = 0, isrouter:int = 0, hostname:str='', cleanLastseen:bool=False, force:bool = False):
@@ -399,20 +754,11 @@ class ipamServer:
 
         # Set fields        
         try:
-            ipobj.setDescription(description, force=force)
-            ipobj.setState(tag, force=force)
-            ipobj.setAPIBlock(apiblock, force=force)
-            ipobj.setAPINotRemovable(apinotremovable, force=force)
-            ipobj.setisGateway(isrouter, force=force)
-            if hostname:
-                ipobj.setHostname(hostname, force=force)
-            if cleanLastseen:
-                ipobj.cleareLastSeen(force=True)
-
+            modified = self._annotateFields(ipobj, description, tag, apiblock, apinotremovable, isrouter, hostname, cleanLastseen, force)
         except PermissionError as p:
-            mylogger.error(f"Address {str(ipAddress)} has 'custom_apiblock' flag set and can't be updated.")
+            mylogger.error(f"Address {str(ipobj)} can't be annotated: {str(p)}")
             return
-        else:
+        if modified:
             # Create or update address
             if create:
                 self.registerIP(ipobj)
@@ -421,19 +767,80 @@ class ipamServer:
                 self.updateAddress(ipobj)
                 mylogger.debug(f'Annotated existing IP address: {ipobj.getDictionary()}')
 
+    @staticmethod
+    def _annotateFields(ipobj:ipamAddress, description:str, tag:int=2, apiblock:int = 0, apinotremovable:int = 0, isrouter:int = 0, hostname:str='', cleanLastseen:bool=False, force:bool = False) -> bool:
+        """Set the fields of an annotated address. Fields already having the value are skipped before the protection
+        rules are checked, so an address already annotated is never rejected.
+        :return: True if any field has been modified and the address must be written.
+        :raise PermissionError: If the address is protected and some field has a different value."""
+        annotation:List[Tuple[str, Any, Callable[..., Any]]] = [
+            ('description', description, ipobj.setDescription), ('state', tag, ipobj.setState),
+            ('custom_apiblock', apiblock, ipobj.setAPIBlock), ('custom_apinotremovable', apinotremovable, ipobj.setAPINotRemovable)]
+        # The hostname is set first, as routers can't be modified without force
+        if hostname:
+            annotation.append(('hostname', hostname, ipobj.setHostname))
+        annotation.append(('is_gateway', isrouter, ipobj.setisGateway))
+        for field, value, setter in annotation:
+            if not ipobj.hasValue(field, value):
+                setter(value, force=force)
+        if cleanLastseen:
+            ipobj.cleareLastSeen(force=True)
+        return ipobj.hasChanges()
+
+    @staticmethod
+    def _subnetAnnotations(sn:ipamSubnet, hasRouter:bool, routerPos:int=-2, routerHostname:str='') -> List[Tuple[Union[IPv4Address, IPv6Address], Dict[str, Any]]]:
+        """Get the addresses of a subnet annotated by annotate_subnet with the annotation of each one."""
+        subnet = sn.getSubnet()
+        annotations:List[Tuple[Union[IPv4Address, IPv6Address], Dict[str, Any]]] = [
+            (subnet[0], dict(description="NETWORK ADDRESS", tag=ipamTags.TAG_notusable, apiblock=0, apinotremovable=1, cleanLastseen=True)),
+            (subnet.broadcast_address, dict(description="BROADCAST ADDRESS", tag=ipamTags.TAG_notusable, apiblock=0, apinotremovable=1, cleanLastseen=True)),
+        ]
+        if hasRouter:
+            annotations.append((subnet[routerPos], dict(description="DEFAULT ROUTER", tag=ipamTags.TAG_router, apiblock=0, apinotremovable=1, isrouter=1, hostname=routerHostname)))
+        return annotations
+
     # Annotate basic subnet addresses
     def annotate_subnet(self, sn:ipamSubnet, hasRouter:bool, routerPos:int=-2, routerHostname:str='', force:bool=False):
         if sn.getisPool():
             # Annotate addresses
-            subnet = sn.getSubnet()
-            baseaddresIP = subnet[0]
-            broadcastIP = subnet.broadcast_address
-            routerIP = subnet[routerPos]
-            # Get IPAM addresses
-            self.annotate_address(ipAddress=baseaddresIP, sn=sn, description="NETWORK ADDRESS", tag=ipamTags.TAG_notusable, apiblock=0, apinotremovable=1, cleanLastseen=True, force=force)
-            self.annotate_address(ipAddress=broadcastIP, sn=sn, description="BROADCAST ADDRESS", tag=ipamTags.TAG_notusable, apiblock=0, apinotremovable=1, cleanLastseen=True, force=force)
-            if hasRouter:
-                self.annotate_address(ipAddress=routerIP, sn=sn, description="DEFAULT ROUTER", tag=ipamTags.TAG_router, apiblock=0, apinotremovable=1, isrouter=1, hostname=routerHostname, force=force)
+            for ip, annotation in self._subnetAnnotations(sn, hasRouter, routerPos, routerHostname):
+                self.annotate_address(ipAddress=ip, sn=sn, force=force, **annotation)
+
+    def annotate_subnets(self, subnets:Iterable[ipamSubnet], hasRouter:bool, routerPos:int=-2, routerHostname:str='', force:bool=False, maxWorkers:int = 8) -> List[Tuple[str, Any, Exception]]:
+        """Annotate the base, broadcast and router addresses of many subnets as annotate_subnet does.
+        The addresses of every pool subnet are fetched once, in parallel, and the annotated addresses are found locally.
+        Addresses already annotated are not written and the rest are registered or updated in a write batch.
+        Protected addresses whose annotation differs are not modified and are returned as 'annotate' errors.
+        :param subnets: The subnets to annotate. Subnets that are not pools are ignored.
+        :param maxWorkers: The maximum number of concurrent requests.
+        :return: The operations that failed as tuples (operation, object, exception)."""
+        errors:List[Tuple[str, Any, Exception]] = []
+        pools = [sn for sn in subnets if sn.getisPool()]
+        with self.writeBatch(maxWorkers=maxWorkers) as batch:
+            for sn, addresses, error in self.parallelMap('findIPsbyNet', pools, maxWorkers=maxWorkers):
+                if error is not None:
+                    mylogger.error(f"Error fetching addresses of subnet {sn}: {str(error)}")
+                    errors.append(('findIPsbyNet', sn, error))
+                    continue
+                registered = {a.getIP(): a for a in addresses}
+                for ip, annotation in self._subnetAnnotations(sn, hasRouter, routerPos, routerHostname):
+                    ipobj = registered.get(ip)
+                    create = ipobj is None
+                    if create:
+                        ipobj = ipamAddress(ip=ip, subnet=sn)
+                    try:
+                        if not self._annotateFields(ipobj, force=force, **annotation):
+                            continue
+                    except PermissionError as p:
+                        mylogger.error(f"Address {str(ipobj)} can't be annotated: {str(p)}")
+                        errors.append(('annotate', ipobj, p))
+                        continue
+                    if create:
+                        batch.register(ipobj)
+                    else:
+                        batch.update(ipobj)
+        errors.extend(batch.getErrors())
+        return errors
 
     # Get DNS address for subnet
     def dns_subnet(self, sn:ipamSubnet) -> Sequence[Union[IPv4Address, IPv6Address]]:
@@ -441,7 +848,7 @@ class ipamServer:
             dnsId=sn.getNameServerId()
             if dnsId != 0:
                 # Get nameserver
-                jsonres = self.pi.get_entity(controller='tools/nameservers', controller_path=f"/{dnsId}")
+                jsonres = self._cachedGet(controller='tools/nameservers', controller_path=f"/{dnsId}")
                 if jsonres:
                     dnsDesc=jsonres.get('name',f'DNSServer subnet {sn.getDescription()}')
                     dnsIPs=jsonres.get('namesrv1','')
@@ -451,53 +858,15 @@ class ipamServer:
         return []
 
     def listSubnetPlain(self, sn:ipamSubnet) -> str:
-        # Get VLAN data
-        if sn.getvlanId() and sn.getvlanId() > 0:
-            try:
-                vList = self.findVLANbyId(id = sn.getvlanId())
-                if len(vList) == 1:
-                    vlan = vSequence[0]
-                    vlanid = vlan.getNumber()
-                else:
-                    vlanid = 0
-            except Exception as e:
-                vlanid = 0
-        else:
-            vlanid = 0
-            
-        # Get other data from subnet
-        description = sn.getDescription()
-        routerIP = str(sn.getSubnet()[-2])
-        ipRange = f"{sn.getBaseaddr()}/{sn.getMask()}"
-        routerMask = sn.getMask()
-
-        # Generate banner
-        banner = "##################################################################################################\n"
-        banner += f"# vlan: {vlanid:3} red: {ipRange:18} {description:61}#\n"
-        banner += f"# router: {routerIP:18} mask {routerMask:21}                                          #\n"
-        banner += "##################################################################################################\n"
-        output = banner
-
-        # Generate list  header
-        #output += f"{'IP':^15} {'Hostname':^17} \t # Description # Notes\n"
-        output += f"\n"
-
-        # List hosts
-        aList = self.findIPsbyNet(sn)
-        for a in aList:
-            description = a.getField('description')
-            if not description or re.match(r".*autodiscover.*", description, flags=re.RegexFlag.IGNORECASE):
-                description = ''
-            else:
-                description = f"# {description}"
-            note = a.getField('note')
-            if not note or re.match(r".*autodiscover.*", note, flags=re.RegexFlag.IGNORECASE):
-                note = ''
-            else:
-                note = f"# {note}"
-            host = a.getField('hostname',default='------')
-            if not host:
-                 host = '----------'
-            output += f"{str(a.getIP()):15} {host.split('.')[0]:17} {description} {note}\n" # type: ignore
-        output += '\n\n'
-        return output
\ No newline at end of file
+        """Get a plain text listing of a subnet and its addresses. See ipamReport for reports of many subnets."""
+        report = ipamReport(self, format='plain')
+        return report.renderPlain(sn, *report.fetch(self, sn))
+
+    def report(self, out:TextIO, subnets:Iterable[ipamSubnet], format:str = 'plain', maxWorkers:int = 8) -> List[Tuple[ipamSubnet, Exception]]:
+        """Write a report of the addresses of many subnets to a file, fetching the subnets in parallel. See ipamReport.
+        :param out: The file or object with a write() method receiving the report.
+        :param subnets: The subnets to report, in the order they are written.
+        :param format: The format of the report: 'plain', 'csv' or 'jsonl'.
+        :param maxWorkers: The maximum number of subnets fetched in parallel.
+        :return: The subnets that could not be reported with their exceptions."""
+        return ipamReport(self, format=format, maxWorkers=maxWorkers).write(out, subnets)
\ No newline at end of file
@@ -0,0 +1,449 @@
+#!/usr/bin/python3
+"""This file provides a compact columnar file format for offline snapshots of a phpIPAM service and a read-only
+client answering the same queries as ipamServer from a snapshot file.
+
+Layout of a snapshot file (all numbers are little endian):
+    - 8 bytes: magic string 'IPAMSNAP'.
+    - 4 bytes: format version. 4 bytes: length of the header.
+    - Header: JSON object describing the tables and the position of the arrays of every column.
+    - Data: raw arrays, every one aligned to 8 bytes. Offsets in the header are relative to the start of the data.
+
+Every field of a table is stored as one column with one of these encodings:
+    - 'ip': IP addresses as two uint64 arrays (high and low 64 bits) and a uint8 array with the IP version (0 if absent).
+    - 'int': integers (or strings of integers) as an int64 array. Absent values are stored as the minimum int64 value.
+    - 'dict': low cardinality values as an int32 array of codes into a list of values kept in the header (-1 if absent).
+    - 'plain': other values encoded as JSON in a blob indexed by an int64 array of offsets (empty if absent).
+    - 'text': strings encoded as UTF-8 in a blob indexed by an int64 array of offsets and a uint8 array (0 if absent).
+"""
+
+import os, json, struct, copy
+from datetime import datetime
+from ipaddress import IPv4Address, IPv6Address, ip_address
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from .ipamSubnet import ipamSubnet
+from .ipamAddress import ipamAddress, parseIP
+from .ipamScanAgent import ipamScanAgent
+from .ipamVLAN import ipamVLAN
+from .ipamFreeSpace import ipamFreeSpace
+from .ipamSubnetIndex import ipamSubnetIndex
+from .ipamQuery import ipamQuery
+
+_MAGIC = b'IPAMSNAP'
+_FORMAT = 1
+_PREFIX = struct.Struct('<8sII')
+_ALIGN = 8
+_INT_ABSENT = int(np.iinfo(np.int64).min)
+_INT_MAX = int(np.iinfo(np.int64).max)
+_LOW64 = (1 << 64) - 1
+
+# Tables of a snapshot and fields stored as packed IP addresses
+TABLES = ('sections', 'subnets', 'addresses', 'vlans', 'scanagents', 'nameservers')
+_IP_FIELDS = {'addresses': ('ip',)}
+
+def _aligned(size:int) -> int:
+    return (size + _ALIGN - 1) // _ALIGN * _ALIGN
+
+_dumps = json.JSONEncoder(separators=(',', ':'), ensure_ascii=False).encode
+
+def _isIntLike(value:Any, asString:bool) -> bool:
+    """Check if a value is an integer (or a string with the canonical form of an integer) fitting in an int64."""
+    if asString:
+        if not isinstance(value, str):
+            return False
+        try:
+            number = int(value)
+        except ValueError:
+            return False
+        if str(number) != value:
+            return False
+    elif isinstance(value, bool) or not isinstance(value, int):
+        return False
+    else:
+        number = value
+    return _INT_ABSENT < number <= _INT_MAX
+
+def _encodeColumn(cells:List[Any], absent:Any, ipField:bool) -> Tuple[Dict[str, Any], Dict[str, np.ndarray]]:
+    """Choose the encoding of a column and build its arrays.
+    :param cells: The values of the column. Rows without the field have the 'absent' object.
+    :param ipField: The column contains IP addresses as strings.
+    :return: The description of the column for the header and its arrays."""
+    present = [c for c in cells if c is not absent]
+    ips = [parseIP(c) if c is not absent else absent for c in cells] if ipField else []
+    if ipField and None not in ips:
+        values = [ip[1] if ip is not absent else 0 for ip in ips]
+        hi = np.array([v >> 64 for v in values], dtype='<u8')
+        lo = np.array([v & _LOW64 for v in values], dtype='<u8')
+        ver = np.array([ip[0] if ip is not absent else 0 for ip in ips], dtype='u1')
+        return {'kind': 'ip'}, {'hi': hi, 'lo': lo, 'version': ver}
+    for asString in (False, True):
+        if present and all(_isIntLike(c, asString) for c in present):
+            data = np.array([int(c) if c is not absent else _INT_ABSENT for c in cells], dtype='<i8')
+            return {'kind': 'int', 'asString': asString}, {'data': data}
+    if present and all(isinstance(c, str) for c in present) and len(set(present)) * 2 > len(present):
+        chunks = [c.encode('utf-8') if c is not absent else b'' for c in cells]
+        offsets = np.zeros(len(cells) + 1, dtype='<i8')
+        np.cumsum([len(c) for c in chunks], out=offsets[1:])
+        mask = np.array([c is not absent for c in cells], dtype='u1')
+        return {'kind': 'text'}, {'offsets': offsets, 'present': mask, 'blob': np.frombuffer(b''.join(chunks), dtype='u1')}
+    encoded = [_dumps(c) if c is not absent else None for c in cells]
+    distinct = list(dict.fromkeys(e for e in encoded if e is not None))
+    if len(distinct) * 2 <= len(present) and len(distinct) < np.iinfo(np.int32).max:
+        codeOf = {e: i for i, e in enumerate(distinct)}
+        codes = np.array([codeOf[e] if e is not None else -1 for e in encoded], dtype='<i4')
+        return {'kind': 'dict', 'values': distinct}, {'codes': codes}
+    chunks = [e.encode('utf-8') if e is not None else b'' for e in encoded]
+    offsets = np.zeros(len(cells) + 1, dtype='<i8')
+    np.cumsum([len(c) for c in chunks], out=offsets[1:])
+    return {'kind': 'plain'}, {'offsets': offsets, 'blob': np.frombuffer(b''.join(chunks), dtype='u1')}
+
+class _Column:
+    """A column of a snapshot table decoded on demand from its arrays."""
+    def __init__(self, spec:Dict[str, Any], arrays:Dict[str, np.ndarray]) -> None:
+        self.kind:str = spec['kind']
+        self.spec = spec
+        self.arrays = arrays
+        if self.kind == 'dict':
+            self._values = [json.loads(v) for v in spec['values']]
+
+    def cell(self, i:int, absent:Any) -> Any:
+        """Get the value of the column in a row or 'absent' if the row does not have the field."""
+        if self.kind == 'ip':
+            version = int(self.arrays['version'][i])
+            if version == 0:
+                return absent
+            value = (int(self.arrays['hi'][i]) << 64) | int(self.arrays['lo'][i])
+            return str(IPv4Address(value) if version == 4 else IPv6Address(value))
+        if self.kind == 'int':
+            value = int(self.arrays['data'][i])
+            if value == _INT_ABSENT:
+                return absent
+            return str(value) if self.spec['asString'] else value
+        if self.kind == 'dict':
+            code = int(self.arrays['codes'][i])
+            if code < 0:
+                return absent
+            value = self._values[code]
+            return copy.deepcopy(value) if isinstance(value, (dict, list)) else value
+        start, end = int(self.arrays['offsets'][i]), int(self.arrays['offsets'][i + 1])
+        if self.kind == 'text':
+            return self.arrays['blob'][start:end].tobytes().decode('utf-8') if self.arrays['present'][i] else absent
+        if start == end:
+            return absent
+        return json.loads(self.arrays['blob'][start:end].tobytes().decode('utf-8'))
+
+    def cells(self, indexes:np.ndarray, absent:Any) -> List[Any]:
+        """Get the values of the column in many rows decoding the arrays in bulk."""
+        if self.kind == 'ip':
+            versions = self.arrays['version'][indexes].tolist()
+            his = self.arrays['hi'][indexes].tolist()
+            los = self.arrays['lo'][indexes].tolist()
+            return [absent if v == 0 else str(IPv4Address(lo) if v == 4 else IPv6Address((hi << 64) | lo))
+                    for v, hi, lo in zip(versions, his, los)]
+        if self.kind == 'int':
+            data = self.arrays['data'][indexes].tolist()
+            if self.spec['asString']:
+                return [absent if v == _INT_ABSENT else str(v) for v in data]
+            return [absent if v == _INT_ABSENT else v for v in data]
+        if self.kind == 'dict':
+            values = self._values
+            return [absent if c < 0 else (copy.deepcopy(values[c]) if isinstance(values[c], (dict, list)) else values[c])
+                    for c in self.arrays['codes'][indexes].tolist()]
+        starts = self.arrays['offsets'][indexes].tolist()
+        ends = self.arrays['offsets'][indexes + 1].tolist()
+        blob = memoryview(self.arrays['blob'])
+        if self.kind == 'text':
+            present = self.arrays['present'][indexes].tolist()
+            return [str(blob[start:end], 'utf-8') if p else absent for start, end, p in zip(starts, ends, present)]
+        return [absent if start == end else json.loads(str(blob[start:end], 'utf-8')) for start, end in zip(starts, ends)]
+
+    def match(self, value:Any, rows:int) -> np.ndarray:
+        """Get a boolean array with the rows whose value has the same text representation as the given value."""
+        if self.kind == 'ip':
+            try:
+                ip = ip_address(str(value))
+            except ValueError:
+                return np.zeros(rows, dtype=bool)
+            return (self.arrays['version'] == ip.version) & (self.arrays['hi'] == int(ip) >> 64) & (self.arrays['lo'] == int(ip) & _LOW64)
+        if self.kind == 'int':
+            try:
+                number = int(str(value))
+            except ValueError:
+                return np.zeros(rows, dtype=bool)
+            if str(number) != str(value) or not _INT_ABSENT < number <= _INT_MAX:
+                return np.zeros(rows, dtype=bool)
+            return self.arrays['data'] == number
+        if self.kind == 'dict':
+            codes = [i for i, v in enumerate(self._values) if v is not None and str(v) == str(value)]
+            return np.isin(self.arrays['codes'], codes)
+        if self.kind == 'text':
+            # Compare the bytes of the strings with the same length in blocks of rows
+            target = np.frombuffer(str(value).encode('utf-8'), dtype='u1')
+            offsets = self.arrays['offsets']
+            found = (np.diff(offsets) == len(target)) & (self.arrays['present'] != 0)
+            candidates = np.flatnonzero(found)
+            block = max(1, (1 << 22) // max(1, len(target)))
+            for first in range(0, len(candidates), block):
+                rowsBlock = candidates[first:first + block]
+                chars = self.arrays['blob'][offsets[rowsBlock][:, None] + np.arange(len(target))]
+                found[rowsBlock] = (chars == target).all(axis=1)
+            return found
+        absent = object()
+        return np.array([(v is not absent and v is not None and str(v) == str(value)) for v in self.cells(np.arange(rows), absent)], dtype=bool)
+
+class _RowSequence(Sequence):
+    """A read-only sequence of rows of a snapshot table. The object of a row is created when the row is accessed."""
+    def __init__(self, snapshot:"ipamSnapshot", table:str, indexes:np.ndarray, wrapper:Callable[[dict], Any]) -> None:
+        self._snapshot = snapshot
+        self._table = table
+        self._indexes = indexes
+        self._wrapper = wrapper
+
+    def __len__(self) -> int:
+        return len(self._indexes)
+
+    def __getitem__(self, i:Any) -> Any:
+        if isinstance(i, slice):
+            return _RowSequence(self._snapshot, self._table, self._indexes[i], self._wrapper)
+        return self._wrapper(self._snapshot._row(self._table, int(self._indexes[i])))
+
+    def __iter__(self) -> Iterator[Any]:
+        for i in self._indexes.tolist():
+            yield self._wrapper(self._snapshot._row(self._table, i))
+
+class ipamSnapshot:
+    """This object is a read-only client of a snapshot of a phpIPAM service stored in a file.
+    It provides the same getAll* and find* methods as ipamServer returning the same objects, without connecting to the service.
+    Snapshots are written with ipamServer.exportSnapshot().
+
+    In memory-mapped mode, the file is not read into memory: the columns are arrays mapped on the file, so processes
+    opening the same snapshot share one copy of it through the page cache. The methods returning many objects return
+    lazy sequences, creating the object of a row only when it is accessed. Objects are picklable and they are mapped
+    again when they are unpickled (e.g. in the workers of a multiprocessing pool)."""
+    def __init__(self, path:str, mmap:bool = False) -> None:
+        """Opens a snapshot file.
+        :param path: The path of the snapshot file.
+        :param mmap: Map the file in memory instead of reading it, and return lazy sequences of objects."""
+        self.path = path
+        self.mmap = mmap
+        if mmap:
+            self._buffer:Any = np.memmap(path, dtype='u1', mode='r')
+        else:
+            with open(path, 'rb') as f:
+                self._buffer = f.read()
+        self._load()
+
+    def __reduce__(self) -> Tuple[Any, Tuple[str, bool]]:
+        return self.__class__, (self.path, self.mmap)
+
+    def close(self) -> None:
+        """Release the buffer of the file. Objects already returned are still valid, but lazy sequences can't be used."""
+        self._columns = {}
+        self._rows = {}
+        self._buffer = None
+
+    def _load(self) -> None:
+        """Parse the header and map the arrays of every column over the buffer."""
+        magic, version, headerLength = _PREFIX.unpack_from(self._buffer, 0)
+        if magic != _MAGIC:
+            raise Exception(f"File {self.path} is not a phpIPAM snapshot")
+        if version > _FORMAT:
+            raise Exception(f"Snapshot {self.path} has an unsupported format version {version}")
+        self._header:Dict[str, Any] = json.loads(bytes(self._buffer[_PREFIX.size:_PREFIX.size + headerLength]).decode('utf-8'))
+        dataStart = _aligned(_PREFIX.size + headerLength)
+        self._rows:Dict[str, int] = {}
+        self._columns:Dict[str, Dict[str, _Column]] = {}
+        for table, tableSpec in self._header['tables'].items():
+            self._rows[table] = tableSpec['rows']
+            self._columns[table] = {}
+            for name, spec in tableSpec['columns'].items():
+                arrays = {key: np.frombuffer(self._buffer, dtype=a['dtype'], count=a['count'], offset=dataStart + a['offset'])
+                          for key, a in spec['arrays'].items()}
+                self._columns[table][name] = _Column(spec, arrays)
+
+    @staticmethod
+    def write(path:str, tables:Dict[str, Sequence[Dict[str, Any]]], source:str = '') -> Dict[str, int]:
+        """Write a snapshot file. The file is replaced atomically.
+        :param path: The path of the snapshot file.
+        :param tables: The rows of every table as lists of dictionaries returned by phpypam. See TABLES for the names of the tables.
+        :param source: The URL of the service the data comes from.
+        :return: A dictionary with the number of rows of every table."""
+        absent = object()
+        header:Dict[str, Any] = {'created': datetime.now().astimezone().isoformat(), 'source': source, 'tables': {}}
+        blocks:List[np.ndarray] = []
+        offset = 0
+        for table, rows in tables.items():
+            rows = list(rows)
+            # Columns in order of first appearance of the fields
+            fields = list(dict.fromkeys(field for row in rows for field in row))
+            columns = {}
+            for field in fields:
+                spec, arrays = _encodeColumn([row.get(field, absent) for row in rows], absent, field in _IP_FIELDS.get(table, ()))
+                spec['arrays'] = {}
+                for key, array in arrays.items():
+                    spec['arrays'][key] = {'dtype': array.dtype.str, 'count': len(array), 'offset': offset}
+                    blocks.append(array)
+                    offset = _aligned(offset + array.nbytes)
+                columns[field] = spec
+            header['tables'][table] = {'rows': len(rows), 'columns': columns}
+
+        headerBytes = json.dumps(header, separators=(',', ':')).encode('utf-8')
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(_PREFIX.pack(_MAGIC, _FORMAT, len(headerBytes)))
+            f.write(headerBytes)
+            f.write(b'\0' * (_aligned(f.tell()) - f.tell()))
+            for array in blocks:
+                f.write(array.tobytes())
+                f.write(b'\0' * (_aligned(array.nbytes) - array.nbytes))
+        os.replace(tmp, path)
+        return {table: spec['rows'] for table, spec in header['tables'].items()}
+
+    ################################################
+
+    def getCreated(self) -> datetime:
+        """Get the date the snapshot was taken."""
+        return datetime.fromisoformat(self._header['created'])
+
+    def getSource(self) -> str:
+        """Get the URL of the service the snapshot was taken from."""
+        return self._header.get('source', '')
+
+    def getCounts(self) -> Dict[str, int]:
+        """Get the number of rows of every table."""
+        return dict(self._rows)
+
+    def _row(self, table:str, i:int) -> Dict[str, Any]:
+        """Build the dictionary of a row as returned by phpypam."""
+        absent = object()
+        row = {}
+        for name, column in self._columns.get(table, {}).items():
+            value = column.cell(i, absent)
+            if value is not absent:
+                row[name] = value
+        return row
+
+    def _rowsOf(self, table:str, mask:Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
+        """Build the dictionaries of all the rows of a table or of the rows selected by a boolean array."""
+        indexes = np.arange(self._rows.get(table, 0)) if mask is None else np.flatnonzero(mask)
+        absent = object()
+        rows:List[Dict[str, Any]] = [{} for _ in range(len(indexes))]
+        for name, column in self._columns.get(table, {}).items():
+            for row, value in zip(rows, column.cells(indexes, absent)):
+                if value is not absent:
+                    row[name] = value
+        return rows
+
+    def _objects(self, wrapper:Callable[[dict], Any], table:str, mask:Optional[np.ndarray] = None) -> Sequence[Any]:
+        """Get the objects of all the rows of a table or of the rows selected by a boolean array.
+        A lazy sequence is returned in memory-mapped mode."""
+        if self.mmap:
+            indexes = np.arange(self._rows.get(table, 0)) if mask is None else np.flatnonzero(mask)
+            return _RowSequence(self, table, indexes, wrapper)
+        return [wrapper(row) for row in self._rowsOf(table, mask)]
+
+    def getArrays(self, table:str, field:str) -> Dict[str, np.ndarray]:
+        """Get the read-only arrays storing a column of a table for vectorized processing.
+        :param table: The name of the table (see TABLES).
+        :param field: The name of the field.
+        :return: A dictionary with the arrays of the column (e.g. 'hi', 'lo' and 'version' for the IP addresses,
+            'data' for integer fields). An empty dictionary if the table does not have the field."""
+        column = self._columns.get(table, {}).get(field)
+        return dict(column.arrays) if column is not None else {}
+
+    def _match(self, table:str, field:str, value:Any) -> np.ndarray:
+        """Get a boolean array with the rows of a table whose field has the given value."""
+        rows = self._rows.get(table, 0)
+        column = self._columns.get(table, {}).get(field)
+        if column is None:
+            return np.zeros(rows, dtype=bool)
+        return column.match(value, rows)
+
+    ################################################
+
+    def getAllSections(self) -> Sequence[Any]:
+        return self._rowsOf('sections')
+
+    def getAllSubnets(self) -> Sequence[ipamSubnet]:
+        """Get all the subnets of the snapshot.
+        :return: An array with ipamSubnet objects representing the subnets."""
+        return self._objects(ipamSubnet, 'subnets')
+
+    def getAllAddresses(self) -> Sequence[ipamAddress]:
+        """Get all the IP addresses of the snapshot.
+        :return: An array with ipamAddress objects representing the addresses."""
+        return self._objects(ipamAddress, 'addresses')
+
+    def getAllVLANs(self) -> Sequence[ipamVLAN]:
+        """Get all the VLANs of the snapshot.
+        :return: An array with ipamVLAN objects representing the VLANs."""
+        return self._objects(ipamVLAN, 'vlans')
+
+    def getAllScanAgents(self) -> Sequence[ipamScanAgent]:
+        """Get all the Scan Agents of the snapshot.
+        :return: An array with ipamScanAgent objects representing the scanners."""
+        return self._objects(ipamScanAgent, 'scanagents')
+
+    def getSubnetIndex(self) -> ipamSubnetIndex:
+        """Get all the subnets of the snapshot in a local index for fast lookup of the subnets containing an address."""
+        return ipamSubnetIndex(self.getAllSubnets())
+
+    ################################################
+
+    def findSubnetsbyIPMask(self, base_ip:Union[IPv4Address, IPv6Address], mask:int) -> Sequence[ipamSubnet]:
+        """Find the subnets defined by base_ip/mask in the snapshot."""
+        match = self._match('subnets', 'subnet', str(base_ip)) & self._match('subnets', 'mask', str(mask))
+        return self._objects(ipamSubnet, 'subnets', match)
+
+    def findVLANbyId(self, id:int) -> Sequence[ipamVLAN]:
+        """Find the VLAN with given database ID in the snapshot."""
+        return self._objects(ipamVLAN, 'vlans', self._match('vlans', 'vlanId', id))
+
+    def findIPs(self, ip:Union[IPv4Address, IPv6Address]) -> Sequence[ipamAddress]:
+        """Find the IP addresses of the snapshot matching a given IP address."""
+        return self._objects(ipamAddress, 'addresses', self._match('addresses', 'ip', ip))
+
+    def findIPsbyHostName(self, hostname:str) -> Sequence[ipamAddress]:
+        """Find the IP addresses of the snapshot with the given hostname."""
+        return self._objects(ipamAddress, 'addresses', self._match('addresses', 'hostname', hostname))
+
+    def findIPsbyNet(self, subnet:ipamSubnet) -> Sequence[ipamAddress]:
+        """Find all the IP addresses of the snapshot registered inside a subnet."""
+        return self._objects(ipamAddress, 'addresses', self._match('addresses', 'subnetId', subnet.getId()))
+
+    def findIPsbyField(self, subnet:ipamSubnet, field:str, pattern:str) -> Sequence[ipamAddress]:
+        """Find all the IP addresses of the snapshot registered inside a subnet whose value of 'field' matches the given pattern.
+        Missing and null values are matched as empty strings, as ipamServer.findIPsbyField() does."""
+        query = ipamQuery(field, pattern)
+        return [a for a in self.findIPsbyNet(subnet) if query.matches(a.getDictionary())]
+
+    def findFree(self, subnet:ipamSubnet, num:int, fitAlg:str = 'FirstFit', align:int = 1, vectorized:Optional[bool] = None) -> Sequence[ipamAddress]:
+        """Finds a block of exactly 'num' contiguous free IP addresses inside given subnet as it was when the snapshot was taken.
+        See ipamServer.findFree()."""
+        netRange = subnet.getSubnet()
+        ips = self.getArrays('addresses', 'ip')
+        if 'version' in ips:
+            # Read the used addresses from the packed columns without building objects
+            rows = np.flatnonzero(self._match('addresses', 'subnetId', subnet.getId()) & (ips['version'] == netRange.version))
+            used = [(hi << 64) | lo for hi, lo in zip(ips['hi'][rows].tolist(), ips['lo'][rows].tolist())]
+        else:
+            used = [u.getIPInt() for u in self.findIPsbyNet(subnet) if u.getVersion() == netRange.version]
+        space = ipamFreeSpace.fromUsed(netRange, used, vectorized=vectorized)
+        startIP = space.find(num, fitAlg, align)
+        if startIP is not None:
+            return [ipamAddress(ip=startIP + offset, subnet=subnet) for offset in range(num)] # type: ignore
+        else:
+            return []
+
+    def dns_subnet(self, sn:ipamSubnet) -> Sequence[Union[IPv4Address, IPv6Address]]:
+        """Get the addresses of the DNS servers of a subnet."""
+        if sn.getisPool():
+            dnsId = sn.getNameServerId()
+            if dnsId != 0:
+                for ns in self._rowsOf('nameservers', self._match('nameservers', 'id', dnsId)):
+                    dnsIPs = ns.get('namesrv1', '')
+                    if dnsIPs:
+                        return [ip_address(ip) for ip in dnsIPs.split(';')]
+        return []
@@ -0,0 +1,223 @@
+#!/usr/bin/python3
+"""This file provides the instrumentation of the requests sent to the phpIPAM service: call counters, bytes transferred and latency histograms by controller."""
+
+# Initialize logger
+import logging
+
+mylogger = logging.getLogger()
+
+import threading, time
+from bisect import bisect_left
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from phpypam.core.exceptions import PHPyPAMEntityNotFoundException
+
+# Upper bounds in seconds of the buckets of the latency histograms
+_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Controllers whose objects are identified by two segments of the path
+_NESTED = ('tools',)
+
+class ipamSpan:
+    """This object describes a request to the phpIPAM service. It is passed to the tracing hooks when the request ends."""
+    __slots__ = ('method', 'controller', 'path', 'start', 'duration', 'bytesSent', 'bytesReceived', 'status', 'error', '_t0', '_paused', '_pausedAt')
+
+    def __init__(self, method:str, controller:str, path:str) -> None:
+        self.method = method
+        self.controller = controller
+        self.path = path
+        # POSIX timestamp of the start of the request
+        self.start = time.time()
+        self.duration = 0.0
+        self.bytesSent = 0
+        self.bytesReceived = 0
+        # 'ok', 'notFound' or 'error'
+        self.status = 'ok'
+        self.error:Optional[Exception] = None
+        self._t0 = time.perf_counter()
+        # Seconds spent by the caller while the request was paused
+        self._paused = 0.0
+        self._pausedAt:Optional[float] = None
+
+    def addResponse(self, resp:Any) -> None:
+        """Count the bytes of a request sent and of its response. The bytes sent are the body and the encoded
+        parameters of the query string, as phpypam sends the fields of updates as parameters."""
+        if resp.request is not None:
+            self.addRequest(resp.request)
+        self.bytesReceived += len(resp.content)
+
+    def addRequest(self, request:Any) -> None:
+        """Count the bytes of the body and of the query string of a prepared request."""
+        body = request.body
+        if isinstance(body, str):
+            body = body.encode()
+        self.bytesSent += len(body) if body else 0
+        self.bytesSent += len(urlsplit(request.url).query) if request.url else 0
+
+    def countChunks(self, chunks:Iterable[bytes]) -> Iterator[bytes]:
+        """Count the bytes of a response read in chunks."""
+        for chunk in chunks:
+            self.bytesReceived += len(chunk)
+            yield chunk
+
+    def pause(self) -> None:
+        """Stop counting time, e.g. while the caller processes an entity of a streamed response."""
+        self._pausedAt = time.perf_counter()
+
+    def resume(self) -> None:
+        """Count time again after pause()."""
+        if self._pausedAt is not None:
+            self._paused += time.perf_counter() - self._pausedAt
+            self._pausedAt = None
+
+    def finish(self) -> None:
+        """Set the duration of the request: the time since it started, excluding the time paused."""
+        end = self._pausedAt if self._pausedAt is not None else time.perf_counter()
+        self.duration = end - self._t0 - self._paused
+
+    def __repr__(self) -> str:
+        return f"ipamSpan({self.method} {self.path}: {self.status} in {self.duration:.3f}s)"
+
+class ipamStats:
+    """This object aggregates the requests sent to the phpIPAM service by controller ('addresses', 'subnets',
+    'tools/scanagents', ...) and HTTP method: number of calls, calls not found and failed, bytes sent and received,
+    and a histogram of their latency. It is shared by all the copies of an ipamApi object, so the requests of parallel
+    operations are aggregated. Access is thread safe.
+
+    Tracing hooks are functions called with an ipamSpan object after every request:
+
+        stats = ipam.getRequestStats()
+        stats.addHook(lambda span: print(span.method, span.path, span.duration))
+        print(stats.toPrometheus())
+    """
+    def __init__(self, buckets:Sequence[float] = _BUCKETS) -> None:
+        """Creates empty statistics.
+        :param buckets: The upper bounds in seconds of the buckets of the latency histograms."""
+        self.buckets:Tuple[float, ...] = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._series:Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._hooks:List[Callable[[ipamSpan], None]] = []
+
+    @staticmethod
+    def controllerOf(path:str) -> str:
+        """Get the controller of the path of a request (e.g. 'addresses' for 'addresses/search/10.0.0.1')."""
+        segments = [s for s in path.split('?', 1)[0].split('/') if s]
+        if not segments:
+            return ''
+        if segments[0] in _NESTED and len(segments) > 1:
+            return f"{segments[0]}/{segments[1]}"
+        return segments[0]
+
+    def addHook(self, hook:Callable[[ipamSpan], None]) -> None:
+        """Register a function called with an ipamSpan object after every request."""
+        self._hooks.append(hook)
+
+    def removeHook(self, hook:Callable[[ipamSpan], None]) -> None:
+        """Unregister a function registered with addHook."""
+        self._hooks.remove(hook)
+
+    @contextmanager
+    def measure(self, method:str, path:str) -> Iterator[ipamSpan]:
+        """Measure a request. Bytes are added to the span by the caller, which may pause it while it is not waiting for the service.
+        Exceptions mark the request as failed, except not found errors.
+        :param method: The HTTP method.
+        :param path: The path of the request."""
+        span = ipamSpan(method, self.controllerOf(path), path)
+        try:
+            yield span
+        except PHPyPAMEntityNotFoundException:
+            span.status = 'notFound'
+            raise
+        except Exception as e:
+            span.status = 'error'
+            span.error = e
+            raise
+        finally:
+            span.finish()
+            self.record(span)
+
+    def record(self, span:ipamSpan) -> None:
+        """Add a finished request to the statistics and call the hooks."""
+        with self._lock:
+            series = self._series.get((span.controller, span.method))
+            if series is None:
+                series = {'count': 0, 'notFound': 0, 'errors': 0, 'bytesSent': 0, 'bytesReceived': 0,
+                          'latencySum': 0.0, 'latencyMax': 0.0, 'buckets': [0] * (len(self.buckets) + 1)}
+                self._series[(span.controller, span.method)] = series
+            series['count'] += 1
+            if span.status == 'notFound':
+                series['notFound'] += 1
+            elif span.status == 'error':
+                series['errors'] += 1
+            series['bytesSent'] += span.bytesSent
+            series['bytesReceived'] += span.bytesReceived
+            series['latencySum'] += span.duration
+            series['latencyMax'] = max(series['latencyMax'], span.duration)
+            series['buckets'][bisect_left(self.buckets, span.duration)] += 1
+        for hook in list(self._hooks):
+            try:
+                hook(span)
+            except Exception as e:
+                mylogger.error(f"Error in request hook {hook}: {str(e)}")
+
+    def reset(self) -> None:
+        """Clear the statistics. Hooks are kept."""
+        with self._lock:
+            self._series = {}
+
+    ################################################
+
+    def snapshot(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """Get a copy of the statistics.
+        :return: A dictionary by controller and HTTP method with the keys 'count', 'notFound', 'errors', 'errorRate',
+            'bytesSent', 'bytesReceived', 'latencySum', 'latencyMean', 'latencyMax' and 'histogram'. The histogram is a
+            list of tuples (upper bound, cumulative count) ending with the bound float('inf')."""
+        with self._lock:
+            result:Dict[str, Dict[str, Dict[str, Any]]] = {}
+            for (controller, method), series in sorted(self._series.items()):
+                cumulative = 0
+                histogram = []
+                for bound, count in zip(self.buckets + (float('inf'),), series['buckets']):
+                    cumulative += count
+                    histogram.append((bound, cumulative))
+                result.setdefault(controller, {})[method] = {
+                    'count': series['count'], 'notFound': series['notFound'], 'errors': series['errors'],
+                    'errorRate': series['errors'] / series['count'],
+                    'bytesSent': series['bytesSent'], 'bytesReceived': series['bytesReceived'],
+                    'latencySum': series['latencySum'], 'latencyMean': series['latencySum'] / series['count'],
+                    'latencyMax': series['latencyMax'], 'histogram': histogram,
+                }
+            return result
+
+    @staticmethod
+    def _label(value:str) -> str:
+        return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    def toPrometheus(self, prefix:str = 'phpipam_client') -> str:
+        """Get the statistics in the Prometheus text exposition format.
+        :param prefix: The prefix of the names of the metrics."""
+        snapshot = self.snapshot()
+        series = [(f'controller="{self._label(controller)}",method="{self._label(method)}"', values)
+                  for controller, methods in snapshot.items() for method, values in methods.items()]
+        lines:List[str] = []
+        counters = [('requests_total', 'count', 'Requests sent to the phpIPAM service.'),
+                    ('not_found_total', 'notFound', 'Requests answered with objects not found.'),
+                    ('errors_total', 'errors', 'Requests failed.'),
+                    ('sent_bytes_total', 'bytesSent', 'Bytes of the bodies and query strings of the requests.'),
+                    ('received_bytes_total', 'bytesReceived', 'Bytes of the bodies of the responses.')]
+        for name, key, help in counters:
+            lines.append(f"# HELP {prefix}_{name} {help}")
+            lines.append(f"# TYPE {prefix}_{name} counter")
+            lines.extend(f"{prefix}_{name}{{{labels}}} {values[key]}" for labels, values in series)
+        name = f"{prefix}_request_duration_seconds"
+        lines.append(f"# HELP {name} Latency of the requests sent to the phpIPAM service.")
+        lines.append(f"# TYPE {name} histogram")
+        for labels, values in series:
+            for bound, count in values['histogram']:
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{name}_bucket{{{labels},le="{le}"}} {count}')
+            lines.append(f"{name}_sum{{{labels}}} {values['latencySum']!r}")
+            lines.append(f"{name}_count{{{labels}}} {values['count']}")
+        return '\n'.join(lines) + '\n'
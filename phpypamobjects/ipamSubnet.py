@@ -6,15 +6,35 @@ This file provides management for wrapping a dictionary describing a phpIPAM sub
 from datetime import datetime, timedelta
 from email.policy import default
 from ipaddress import IPv4Address, IPv4Network, IPv6Address, IPv6Network, ip_network, ip_address
-from typing import Optional, Union, Dict, Any
+from typing import Optional, Union, Dict, Any, Callable, Tuple
 from macaddress import MAC
 
 class ipamSubnet:
-    """This object wraps a JSON dictionary representing a phpIPAM IP subnet returned by phpypam."""
+    """This object wraps a JSON dictionary representing a phpIPAM IP subnet returned by phpypam.
+    The range and the dates of the subnet are parsed on first access and cached until the fields change."""
+    __slots__ = ('_net', '_parsed')
+
     def __init__(self, net:dict) -> None:
         """Creates a new object. The object is initialized with a dictionary returned by phpypam.
         :param addr: A JSON dictionary returned by phpypam."""
         self._net:Dict[str,Any] = net
+        # Parsed values by field: (raw value, parsed value)
+        self._parsed:Dict[str, Tuple[Any, Any]] = {}
+
+    def _cached(self, field:str, raw:Any, parse:Callable[[Any], Any]) -> Any:
+        """Get the parsed value of a field, parsing it again only if the raw value has changed."""
+        entry = self._parsed.get(field)
+        if entry is None or entry[0] != raw:
+            entry = (raw, parse(raw))
+            self._parsed[field] = entry
+        return entry[1]
+
+    @staticmethod
+    def _parseDate(date:str) -> datetime:
+        ts = datetime.fromisoformat(date)
+        # Set timezone
+        ts = ts.astimezone()
+        return ts
 
     def getField(self, field:str, default:Any = None) -> Optional[Any]:
         """Get any field of the JSON object.
@@ -33,34 +53,28 @@ class ipamSubnet:
         date = self._net.get('editDate','')
         if not date:
             return None
-        ts = datetime.fromisoformat(date)
-        # Set timezone
-        ts = ts.astimezone()
-        return ts
+        return self._cached('editDate', date, self._parseDate)
 
     def getLastRescan(self, interval:timedelta=timedelta(hours=1)) -> Optional[datetime]:
         date = self._net.get('lastScan','')
         if not date:
             return None
-        ts = datetime.fromisoformat(date)
-        # Set timezone
-        ts = ts.astimezone()
-        return ts
+        return self._cached('lastScan', date, self._parseDate)
 
     def getLastDiscovery(self, interval:timedelta=timedelta(hours=1)) -> Optional[datetime]:
         date = self._net.get('lastDiscovery','')
         if not date:
             return None
-        ts = datetime.fromisoformat(date)
-        # Set timezone
-        ts = ts.astimezone()
-        return ts
+        return self._cached('lastDiscovery', date, self._parseDate)
+
+    def getDictionary(self) -> Dict[str,Any]:
+        return self._net
 
     def getId(self) -> int:
         return self.getFieldInt('id')
 
     def getBaseaddr(self) -> Union[IPv4Address, IPv6Address, None]:
-        return ip_address(self.getField('subnet')) if self.getField('subnet') else None  # type: ignore
+        return self._cached('subnet', self.getField('subnet'), ip_address) if self.getField('subnet') else None  # type: ignore
 
     def getMask(self) -> int:
         return self.getFieldInt('mask',0)
@@ -69,7 +83,7 @@ class ipamSubnet:
         """Returns an object representing the subnet range.
         :return: A IPv4|6Network object."""
         if self._net.get('subnet','') and self._net.get('mask',''):
-            return ip_network(f"{self._net.get('subnet')}/{self._net.get('mask')}")
+            return self._cached('range', (self._net.get('subnet'), self._net.get('mask')), lambda raw: ip_network(f"{raw[0]}/{raw[1]}"))
         else:
             raise Exception('ipamSubnet does not have a defined subnet')
 
@@ -0,0 +1,133 @@
+#!/usr/bin/python3
+"""This file provides a local index of phpIPAM subnets for finding the subnets containing an address without querying the service."""
+
+from ipaddress import IPv4Address, IPv6Address, IPv4Network, IPv6Network
+from typing import Iterable, List, Optional, Union
+
+from .ipamSubnet import ipamSubnet
+
+# Positions of the fields of a node of the trie
+_ZERO = 0
+_ONE = 1
+_SUBNETS = 2
+
+class ipamSubnetIndex:
+    """This object indexes ipamSubnet objects in a binary radix trie per IP version.
+    It supports longest-prefix match of addresses, retrieval of all the supernets of an address or subnet and retrieval
+    of all the subnets inside a subnet. Subnets are parsed once when they are added to the index."""
+    def __init__(self, subnets:Iterable[ipamSubnet] = ()) -> None:
+        """Creates a new index.
+        :param subnets: The ipamSubnet objects to add to the index. Subnets without a range (folders) are ignored."""
+        # Nodes are lists [child for bit 0, child for bit 1, list of subnets with this prefix]
+        self._roots = {4: [None, None, None], 6: [None, None, None]}
+        self._count = 0
+        for sn in subnets:
+            self.add(sn)
+
+    @staticmethod
+    def _bits(version:int) -> int:
+        return 32 if version == 4 else 128
+
+    def add(self, subnet:ipamSubnet) -> bool:
+        """Add a subnet to the index.
+        :param subnet: An ipamSubnet object.
+        :return: True if the subnet has been added or False if it has not a defined range."""
+        try:
+            net = subnet.getSubnet()
+        except Exception:
+            return False
+        node = self._roots[net.version]
+        value = int(net.network_address)
+        shift = self._bits(net.version) - 1
+        for _ in range(net.prefixlen):
+            bit = (value >> shift) & 1
+            child = node[bit]
+            if child is None:
+                child = [None, None, None]
+                node[bit] = child
+            node = child
+            shift -= 1
+        if node[_SUBNETS] is None:
+            node[_SUBNETS] = []
+        node[_SUBNETS].append(subnet)
+        self._count += 1
+        return True
+
+    def _path(self, version:int, value:int, length:int) -> List[List[ipamSubnet]]:
+        """Get the lists of subnets found walking the trie along the first 'length' bits of a value."""
+        found = []
+        node = self._roots[version]
+        shift = self._bits(version) - 1
+        depth = 0
+        while node is not None:
+            if node[_SUBNETS]:
+                found.append(node[_SUBNETS])
+            if depth == length:
+                break
+            node = node[(value >> shift) & 1]
+            shift -= 1
+            depth += 1
+        return found
+
+    def longestMatch(self, ip:Union[IPv4Address, IPv6Address]) -> Optional[ipamSubnet]:
+        """Find the most specific subnet containing an address.
+        When several subnets share the same prefix, the one added last is returned.
+        :param ip: An IP address.
+        :return: An ipamSubnet object or None if no subnet contains the address."""
+        node = self._roots[ip.version]
+        value = int(ip)
+        shift = self._bits(ip.version) - 1
+        best = None
+        while node is not None:
+            if node[_SUBNETS]:
+                best = node[_SUBNETS]
+            if shift < 0:
+                break
+            node = node[(value >> shift) & 1]
+            shift -= 1
+        return best[-1] if best else None
+
+    def supernets(self, target:Union[IPv4Address, IPv6Address, IPv4Network, IPv6Network, ipamSubnet]) -> List[ipamSubnet]:
+        """Find all the subnets containing an address or a subnet.
+        :param target: An IP address, or a subnet given as an IPv4|6Network or ipamSubnet object. The subnets with the same prefix as a given subnet are not included.
+        :return: A list of ipamSubnet objects sorted from the largest to the most specific subnet."""
+        if isinstance(target, ipamSubnet):
+            target = target.getSubnet()
+        if isinstance(target, (IPv4Network, IPv6Network)):
+            if target.prefixlen == 0:
+                # Nothing is larger than the whole address space
+                return []
+            found = self._path(target.version, int(target.network_address), target.prefixlen - 1)
+        else:
+            found = self._path(target.version, int(target), self._bits(target.version))
+        return [sn for subnets in found for sn in subnets]
+
+    def children(self, target:Union[IPv4Network, IPv6Network, ipamSubnet]) -> List[ipamSubnet]:
+        """Find all the subnets inside a subnet.
+        :param target: A subnet given as an IPv4|6Network or ipamSubnet object. The subnets with the same prefix are not included.
+        :return: A list of ipamSubnet objects sorted by address, with every subnet before the subnets inside it."""
+        if isinstance(target, ipamSubnet):
+            target = target.getSubnet()
+        node = self._roots[target.version]
+        value = int(target.network_address)
+        shift = self._bits(target.version) - 1
+        for _ in range(target.prefixlen):
+            node = node[(value >> shift) & 1]
+            if node is None:
+                return []
+            shift -= 1
+        found:List[ipamSubnet] = []
+        # Depth first traversal of the nodes below the subnet
+        pending = [node[_ONE], node[_ZERO]]
+        while pending:
+            node = pending.pop()
+            if node is None:
+                continue
+            if node[_SUBNETS]:
+                found.extend(node[_SUBNETS])
+            pending.append(node[_ONE])
+            pending.append(node[_ZERO])
+        return found
+
+    def __len__(self) -> int:
+        return self._count
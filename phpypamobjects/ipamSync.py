@@ -0,0 +1,194 @@
+#!/usr/bin/python3
+"""This file provides an incremental synchronization of a local replica of the subnets and addresses of a phpIPAM service."""
+
+# Initialize logger
+import logging
+
+mylogger = logging.getLogger()
+
+import os, json, time, threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .ipamSubnet import ipamSubnet
+from .ipamAddress import ipamAddress
+
+# Format version of the replica file
+_FORMAT = 1
+
+# Fields of a subnet updated by scans and discoveries, not reported as subnet changes
+_VOLATILE = ('editDate', 'lastScan', 'lastDiscovery')
+
+class ipamSync:
+    """This object keeps a local replica of the subnets and addresses of a phpIPAM service and updates it incrementally.
+    All the subnets are fetched in every synchronization, but the addresses of a subnet are only fetched again when
+    its editDate, lastScan or lastDiscovery dates have changed, when it is new or when it has not been fetched for
+    'maxAge' seconds. Changes found are reported as events (event, new, old):
+        - 'added', 'removed', 'changed': for ipamAddress objects.
+        - 'subnetAdded', 'subnetRemoved', 'subnetChanged': for ipamSubnet objects. Changes of only the editDate, lastScan
+          or lastDiscovery dates of a subnet are not reported, although they still trigger a fetch of its addresses.
+    'new' is None for removals and 'old' is None for additions.
+
+    As phpIPAM does not update the dates of a subnet when an address is modified through the API or the web interface,
+    'maxAge' bounds the time a change of an address may go unnoticed.
+    """
+    def __init__(self, server:Any, path:str = "", maxAge:float = 86400.0, maxWorkers:int = 8) -> None:
+        """Creates the replica. If the file exists, the replica is loaded from it.
+        :param server: The ipamServer object used to fetch the data.
+        :param path: Path of the JSON file where the replica is saved after every synchronization. If empty, it is only kept in memory.
+        :param maxAge: Seconds after which the addresses of a subnet are fetched even if its dates have not changed. Zero always fetches them.
+        :param maxWorkers: The maximum number of concurrent requests."""
+        self._server = server
+        self.path:str = os.path.expanduser(path) if path else ""
+        self.maxAge = maxAge
+        self.maxWorkers = maxWorkers
+        self._lock = threading.RLock()
+        # Raw dictionaries of the subnets and addresses by id, as strings for JSON persistence
+        self._subnets:Dict[str, Dict[str, Any]] = {}
+        self._addresses:Dict[str, Dict[str, Dict[str, Any]]] = {}
+        # Dates of every subnet when its addresses were fetched and time of that fetch
+        self._stamps:Dict[str, List[Any]] = {}
+        self._fetched:Dict[str, float] = {}
+        self._listeners:List[Callable[[str, Any, Any], None]] = []
+        self._errors:List[Tuple[ipamSubnet, Exception]] = []
+        self._stats = {'syncs': 0, 'refreshed': 0, 'skipped': 0}
+        if self.path and os.path.exists(self.path):
+            self.load()
+
+    @staticmethod
+    def _stamp(net:Dict[str, Any]) -> List[Any]:
+        """Get the dates of a subnet that change when it is modified or scanned."""
+        return [net.get('editDate'), net.get('lastScan'), net.get('lastDiscovery')]
+
+    @staticmethod
+    def _sameSubnet(old:Dict[str, Any], new:Dict[str, Any]) -> bool:
+        """Compare two subnets ignoring the dates updated by scans."""
+        return {k: v for k, v in old.items() if k not in _VOLATILE} == {k: v for k, v in new.items() if k not in _VOLATILE}
+
+    def subscribe(self, callback:Callable[[str, Any, Any], None]) -> None:
+        """Register a function called with (event, new, old) for every change found."""
+        self._listeners.append(callback)
+
+    def _emit(self, events:List[Tuple[str, Any, Any]], event:str, new:Any, old:Any) -> None:
+        events.append((event, new, old))
+        for callback in self._listeners:
+            try:
+                callback(event, new, old)
+            except Exception as e:
+                mylogger.error(f"Error in listener of {event} event: {str(e)}")
+
+    def _needsRefresh(self, key:str, net:Dict[str, Any], now:float) -> bool:
+        if key not in self._addresses:
+            return True
+        if self._stamps.get(key) != self._stamp(net):
+            return True
+        return now - self._fetched.get(key, 0.0) >= self.maxAge
+
+    def sync(self) -> List[Tuple[str, Any, Any]]:
+        """Fetch the subnets and the addresses of the subnets that may have changed and update the replica.
+        If the addresses of a subnet can't be fetched, its previous addresses are kept and they are fetched again in the next synchronization.
+        :return: The list of events (event, new, old) in the order they were found."""
+        with self._lock:
+            events:List[Tuple[str, Any, Any]] = []
+            now = time.time()
+            self._errors = []
+            current = {str(sn.getId()): sn for sn in self._server.getAllSubnets()}
+
+            for key in [k for k in self._subnets if k not in current]:
+                for addr in self._addresses.pop(key, {}).values():
+                    self._emit(events, 'removed', None, ipamAddress(dict(addr)))
+                self._stamps.pop(key, None)
+                self._fetched.pop(key, None)
+                self._emit(events, 'subnetRemoved', None, ipamSubnet(self._subnets.pop(key)))
+
+            refresh:List[ipamSubnet] = []
+            for key, sn in current.items():
+                net = sn.getDictionary()
+                old = self._subnets.get(key)
+                if old is None:
+                    self._emit(events, 'subnetAdded', ipamSubnet(dict(net)), None)
+                elif not self._sameSubnet(old, net):
+                    self._emit(events, 'subnetChanged', ipamSubnet(dict(net)), ipamSubnet(old))
+                self._subnets[key] = dict(net)
+                if self._needsRefresh(key, net, now):
+                    refresh.append(sn)
+                else:
+                    self._stats['skipped'] += 1
+
+            for sn, addresses, error in self._server.parallelMap('findIPsbyNet', refresh, maxWorkers=self.maxWorkers):
+                if error is not None:
+                    self._errors.append((sn, error))
+                    # Fetch it again in the next synchronization
+                    self._stamps.pop(str(sn.getId()), None)
+                    continue
+                self._diff(events, str(sn.getId()), addresses)
+                self._stamps[str(sn.getId())] = self._stamp(sn.getDictionary())
+                self._fetched[str(sn.getId())] = now
+                self._stats['refreshed'] += 1
+
+            self._stats['syncs'] += 1
+            if self.path:
+                self.save()
+            return events
+
+    def _diff(self, events:List[Tuple[str, Any, Any]], key:str, addresses:List[ipamAddress]) -> None:
+        """Compare the addresses fetched for a subnet with the replica and replace them."""
+        old = self._addresses.get(key, {})
+        new = {str(a.getId()): a.getDictionary() for a in addresses}
+        for addrId, addr in new.items():
+            if addrId not in old:
+                self._emit(events, 'added', ipamAddress(dict(addr)), None)
+            elif old[addrId] != addr:
+                self._emit(events, 'changed', ipamAddress(dict(addr)), ipamAddress(old[addrId]))
+        for addrId, addr in old.items():
+            if addrId not in new:
+                self._emit(events, 'removed', None, ipamAddress(dict(addr)))
+        self._addresses[key] = new
+
+    ################################################
+
+    def getSubnets(self) -> List[ipamSubnet]:
+        """Get the subnets of the replica."""
+        with self._lock:
+            return [ipamSubnet(dict(net)) for net in self._subnets.values()]
+
+    def getAddresses(self, subnet:Optional[ipamSubnet] = None) -> List[ipamAddress]:
+        """Get the addresses of the replica.
+        :param subnet: Get only the addresses of this subnet. By default, the addresses of all the subnets."""
+        with self._lock:
+            if subnet is not None:
+                return [ipamAddress(dict(a)) for a in self._addresses.get(str(subnet.getId()), {}).values()]
+            return [ipamAddress(dict(a)) for addresses in self._addresses.values() for a in addresses.values()]
+
+    def getErrors(self) -> List[Tuple[ipamSubnet, Exception]]:
+        """Get the subnets whose addresses could not be fetched in the last synchronization with their exceptions."""
+        return list(self._errors)
+
+    def getStats(self) -> Dict[str, int]:
+        """Get the number of synchronizations and the number of times the addresses of a subnet were fetched or skipped."""
+        return dict(self._stats)
+
+    ################################################
+
+    def save(self) -> None:
+        """Write the replica to its file. The file is replaced atomically."""
+        if not self.path:
+            raise Exception("ipamSync has no file to save the replica")
+        with self._lock:
+            data = {'version': _FORMAT, 'subnets': self._subnets, 'addresses': self._addresses,
+                    'stamps': self._stamps, 'fetched': self._fetched}
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp, 'w') as f:
+                json.dump(data, f, separators=(',', ':'))
+            os.replace(tmp, self.path)
+
+    def load(self) -> None:
+        """Read the replica from its file."""
+        with self._lock:
+            with open(self.path) as f:
+                data = json.load(f)
+            if data.get('version', 0) > _FORMAT:
+                raise Exception(f"Replica {self.path} has an unsupported format version {data.get('version')}")
+            self._subnets = data.get('subnets', {})
+            self._addresses = data.get('addresses', {})
+            self._stamps = data.get('stamps', {})
+            self._fetched = data.get('fetched', {})
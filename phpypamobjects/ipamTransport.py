@@ -0,0 +1,459 @@
+#!/usr/bin/python3
+"""This file provides the HTTP transport used to talk to the phpIPAM service: a phpypam API sending its requests through
+a pooled keep-alive session with timeouts and retries."""
+
+# Initialize logger
+import logging
+
+mylogger = logging.getLogger()
+
+import os, ssl, json, time, codecs, getpass, threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, Optional, Union
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows: tokens are only shared between threads
+    fcntl = None
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.auth import HTTPBasicAuth
+from urllib3.util.retry import Retry
+
+import phpypam
+from phpypam.core.api import GET, POST, PATCH, DELETE, OPTIONS
+from phpypam.core.exceptions import PHPyPAMException, PHPyPAMEntityNotFoundException
+
+from .ipamStats import ipamStats
+
+# HTTP verbs of the phpypam request functions
+_METHODS = {GET: 'GET', POST: 'POST', PATCH: 'PATCH', DELETE: 'DELETE', OPTIONS: 'OPTIONS'}
+
+def readPassword(prompt:str = "Password: ") -> str:
+    """Read a password from console disabling terminal echo for privacy.
+    :return: The password, or an empty string if it can't be read or CTRL-C is pressed."""
+    try:
+        return getpass.getpass(prompt)
+    except KeyboardInterrupt:
+        mylogger.error("Operation canceled by user")
+    except Exception:
+        mylogger.error("Error reading password from console")
+    return ''
+
+def isAuthError(result:Dict[str, Any]) -> bool:
+    """Check if a response of the service reports an invalid or expired token."""
+    message = str(result.get('message', '')).lower()
+    return result.get('code') == 401 or (result.get('code') == 403 and 'token' in message)
+
+def raiseError(code:Any, message:Any) -> None:
+    """Raise the phpypam exception of an error response of the service. phpIPAM answers lists and searches without
+    results with code 200 and a message that depends on the controller, so any error with code 200 is raised as not found."""
+    if code == 200:
+        raise PHPyPAMEntityNotFoundException(message)
+    raise PHPyPAMException(code=code, message=message)
+
+def parseExpires(expires:Optional[str]) -> float:
+    """Convert the expiration date of a token returned by the service to a POSIX timestamp (0 if unknown)."""
+    if not expires:
+        return 0.0
+    try:
+        return datetime.fromisoformat(expires).timestamp()
+    except ValueError:
+        return 0.0
+
+class _SSLContextAdapter(HTTPAdapter):
+    """HTTP adapter creating its connections with a given SSL context."""
+    def __init__(self, sslContext:Optional[ssl.SSLContext] = None, **kwargs) -> None:
+        self._sslContext = sslContext
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        if self._sslContext is not None:
+            kwargs['ssl_context'] = self._sslContext
+        return super().init_poolmanager(*args, **kwargs)
+
+class _JSONStream:
+    """Incremental parser of a response of the phpIPAM service. The elements of its 'data' array are decoded one by one
+    as the text arrives, so they can be processed before the whole response has been received."""
+    def __init__(self, chunks:Iterable[bytes]) -> None:
+        self._chunks = iter(chunks)
+        self._decoder = json.JSONDecoder()
+        self._utf8 = codecs.getincrementaldecoder('utf-8')()
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+        self._started = False
+        # First character of the value of 'data' once it is found
+        self._data:Optional[str] = None
+        # Members of the response other than 'data'
+        self.fields:Dict[str, Any] = {}
+
+    def _more(self) -> bool:
+        """Read the next chunk of text. Return False at the end of the response."""
+        if self._eof:
+            return False
+        # Discard the text already parsed
+        self._buf = self._buf[self._pos:]
+        self._pos = 0
+        for chunk in self._chunks:
+            text = self._utf8.decode(chunk)
+            if text:
+                self._buf += text
+                return True
+        self._buf += self._utf8.decode(b'', final=True)
+        self._eof = True
+        return False
+
+    def _peek(self) -> str:
+        """Skip whitespace and return the next character ('' at the end of the response)."""
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in ' \t\r\n':
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._more():
+                return ''
+
+    def _expect(self, chars:str) -> str:
+        c = self._peek()
+        if not c or c not in chars:
+            raise ValueError(f"Invalid response of phpIPAM service: expected '{chars}' and found '{c}'")
+        self._pos += 1
+        return c
+
+    def _value(self) -> Any:
+        """Decode the next JSON value, reading more text until it is complete."""
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+                # A number at the end of the text may continue in the next chunk
+                if self._eof or (end < len(self._buf) and self._buf[end] not in '.eE+-0123456789'):
+                    self._pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+            self._more()
+
+    def head(self) -> Optional[str]:
+        """Parse the members of the response until the 'data' member is found or the response ends.
+        :return: The first character of the value of 'data' or None if the response has no data."""
+        if not self._started:
+            self._started = True
+            self._expect('{')
+            if self._peek() == '}':
+                self._pos += 1
+                return None
+        while True:
+            key = self._value()
+            self._expect(':')
+            if key == 'data' and self._peek() in '[{':
+                self._data = self._peek()
+                return self._data
+            self.fields[key] = self._value()
+            if self._expect(',}') == '}':
+                return None
+
+    def items(self) -> Iterator[Any]:
+        """Decode the elements of 'data' (a single object is returned as one element) and the members after it."""
+        first = self._data if self._started else self.head()
+        if first == '{':
+            yield self._value()
+        elif first == '[':
+            self._pos += 1
+            if self._peek() == ']':
+                self._pos += 1
+            else:
+                while True:
+                    yield self._value()
+                    if self._expect(',]') == ']':
+                        break
+        if first is not None and self._expect(',}') == ',':
+            self.head()
+
+class ipamTokenStore:
+    """This object holds the authentication token shared by all the copies of an ipamApi object (one per thread).
+    If a file is given, the token is also shared with other processes through that file and logins are serialized
+    with a lock on the file, so a fleet of workers does not flood the login endpoint of the service. The file keeps a
+    token per service, application and user, so clients with different configurations can share the same file."""
+    def __init__(self, path:str = "", key:str = "") -> None:
+        """Creates a new empty store.
+        :param path: Path of the file shared by processes. If empty, the token is only kept in memory.
+        :param key: The entry of the file used by this store (see keyOf)."""
+        self.path:str = os.path.expanduser(path) if path else ""
+        self.key:str = key
+        self.token:str = ""
+        # Expiration time as a POSIX timestamp (0 if unknown)
+        self.expires:float = 0.0
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def keyOf(url:str, app_id:str, user:str) -> str:
+        """Get the key of the entry of a token in a shared file.
+        :param url: The URL of the phpIPAM service.
+        :param app_id: The identifier of the client application.
+        :param user: The user authenticated, if any."""
+        return f"{user}@{url.rstrip('/')}/api/{app_id}"
+
+    def _entries(self) -> Dict[str, Any]:
+        """Read the tokens of the shared file by key."""
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def reload(self) -> None:
+        """Read the token from the shared file if there is one."""
+        if not self.path:
+            return
+        entry = self._entries().get(self.key)
+        if not isinstance(entry, dict):
+            return
+        try:
+            self.token = entry.get('token', '')
+            self.expires = float(entry.get('expires', 0.0))
+        except (TypeError, ValueError):
+            pass
+
+    def save(self, token:str, expires:float) -> None:
+        """Store a new token and write it to the shared file if there is one. The tokens of the other entries of the file
+        are kept, so the store must be locked by the caller."""
+        self.token = token
+        self.expires = expires
+        if not self.path:
+            return
+        entries = {k: v for k, v in self._entries().items() if isinstance(v, dict)}
+        entries[self.key] = {'token': token, 'expires': expires}
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w') as f:
+                json.dump(entries, f)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            mylogger.error(f"Error writing token file {self.path}: {str(e)}")
+
+    def isValid(self, margin:float = 0.0) -> bool:
+        """Check if the token exists and it does not expire in the next 'margin' seconds."""
+        return bool(self.token) and (self.expires == 0.0 or time.time() < self.expires - margin)
+
+    @contextmanager
+    def locked(self) -> Iterator[None]:
+        """Lock the store for the threads of this process and, if there is a shared file, for other processes."""
+        with self._lock:
+            if not self.path or fcntl is None:
+                yield
+                return
+            with open(f"{self.path}.lock", 'a') as lockFile:
+                fcntl.flock(lockFile, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lockFile, fcntl.LOCK_UN)
+
+class ipamApi(phpypam.api):
+    """This object is a phpypam API whose requests are sent through a requests session with a pool of keep-alive
+    connections, so TLS handshakes are not repeated on every call. Idempotent requests (GET, OPTIONS) are retried with
+    exponential backoff on connection errors and 5xx responses. Copies of the object (copy.copy) share the
+    configuration and the authentication token but have their own session, so they can be used by other threads."""
+    def __init__(self, url:str, app_id:str, username:Optional[str] = None, password:Optional[str] = None, token:Optional[str] = None,
+                 sslContext:Optional[ssl.SSLContext] = None, ssl_verify:Union[bool, str] = True, poolSize:int = 10,
+                 connectTimeout:float = 10.0, readTimeout:float = 60.0, retries:int = 3, backoff:float = 0.5, user_agent:Optional[str] = None,
+                 tokenStore:Optional[ipamTokenStore] = None, refreshMargin:float = 300.0, autoRefresh:bool = False,
+                 stats:Optional[ipamStats] = None) -> None:
+        """Creates the session and authenticates at the service.
+        :param url: The URL of the phpIPAM service.
+        :param app_id: The identifier of the client application at the phpIPAM service.
+        :param username: The user for authentication.
+        :param password: The password of the user.
+        :param token: The access token of the application.
+        :param sslContext: The SSL context used for the connections.
+        :param ssl_verify: Verify the certificate of the server: False, True or the path to the CA certificate file.
+        :param poolSize: Maximum number of connections kept open to the service.
+        :param connectTimeout: Seconds to wait for a connection to be established.
+        :param readTimeout: Seconds to wait for the response of the service.
+        :param retries: Number of retries of idempotent requests. Zero disables retries.
+        :param backoff: Backoff factor in seconds between retries (backoff, 2*backoff, 4*backoff...).
+        :param user_agent: The user agent header string.
+        :param tokenStore: The store of the authentication token. Give an ipamTokenStore with a file to share tokens between processes.
+        :param refreshMargin: Seconds before the expiration of the token when it is renewed.
+        :param autoRefresh: Renew the token in a background timer before it expires.
+        :param stats: The statistics where the requests are recorded. By default, new statistics shared by the copies of this object."""
+        self._stats = stats if stats is not None else ipamStats()
+        self._sslContext = sslContext
+        self._poolSize = poolSize
+        self._retries = retries
+        self._backoff = backoff
+        self._session = self._newSession()
+        self._appToken = token
+        self._tokens = tokenStore if tokenStore is not None else ipamTokenStore()
+        self._refreshMargin = refreshMargin
+        self._timer:Optional[threading.Timer] = None
+        super().__init__(url=url, app_id=app_id, username=username, password=password, token=token, encryption=False,
+                         timeout=(connectTimeout, readTimeout), ssl_verify=ssl_verify, user_agent=user_agent)
+        if autoRefresh:
+            self._scheduleRefresh()
+
+    def _newSession(self) -> requests.Session:
+        """Create a session with a pool of connections and the retry policy."""
+        retry = Retry(total=self._retries, connect=self._retries, read=self._retries, status=self._retries,
+                      backoff_factor=self._backoff, status_forcelist=(500, 502, 503, 504),
+                      allowed_methods=frozenset(['GET', 'OPTIONS']), raise_on_status=False)
+        adapter = _SSLContextAdapter(sslContext=self._sslContext, pool_connections=1, pool_maxsize=self._poolSize, max_retries=retry)
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def __copy__(self) -> "ipamApi":
+        clone = self.__class__.__new__(self.__class__)
+        clone.__dict__.update(self.__dict__)
+        clone._session = clone._newSession()
+        clone._timer = None
+        return clone
+
+    def getStats(self) -> ipamStats:
+        """Get the statistics of the requests sent by this object and its copies."""
+        return self._stats
+
+    def close(self) -> None:
+        """Close the connections of the session and stop the renewal of the token."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._session.close()
+
+    ################################################
+
+    def _login(self) -> None:
+        """Get a token from the store or, if there is not a valid one, login to the service and store the new token."""
+        with self._tokens.locked():
+            self._tokens.reload()
+            if self._tokens.isValid(self._refreshMargin):
+                self._api_token = self._tokens.token
+            else:
+                self._newToken()
+
+    def _newToken(self) -> None:
+        """Login to the service and store the new token. The store must be locked by the caller."""
+        # Login with the application token, not with the expired session token
+        self._api_token = self._appToken
+        resp = self._query(method=POST, auth=HTTPBasicAuth(self._api_username, self._api_password))
+        self._api_token = resp['token']
+        self._tokens.save(resp['token'], self._parseExpires(resp.get('expires')))
+        mylogger.debug(f"Logged in phpIPAM service {self._api_url}")
+
+    _parseExpires = staticmethod(parseExpires)
+
+    def refreshToken(self, staleToken:Optional[str] = None) -> None:
+        """Renew the token unless another thread or process has already renewed it.
+        :param staleToken: The token known to be expired. By default, the token currently used by this object."""
+        staleToken = staleToken if staleToken is not None else self._api_token
+        with self._tokens.locked():
+            self._tokens.reload()
+            if self._tokens.token != staleToken and self._tokens.isValid(self._refreshMargin):
+                self._api_token = self._tokens.token
+            else:
+                self._newToken()
+
+    def _scheduleRefresh(self) -> None:
+        """Schedule the renewal of the token 'refreshMargin' seconds before it expires."""
+        if self._tokens.expires:
+            delay = max(self._tokens.expires - self._refreshMargin - time.time(), 1.0)
+        else:
+            # Expiration unknown: check again later
+            delay = max(self._refreshMargin, 1.0)
+        self._timer = threading.Timer(delay, self._timedRefresh)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _timedRefresh(self) -> None:
+        try:
+            if self._tokens.expires and not self._tokens.isValid(self._refreshMargin):
+                self.refreshToken()
+        except Exception as e:
+            mylogger.error(f"Error renewing token of phpIPAM service {self._api_url}: {str(e)}")
+        self._scheduleRefresh()
+
+    _isAuthError = staticmethod(isAuthError)
+
+    def _request(self, method:str, url:str, headers:Dict[str, str], data:Any = None, params:Any = None, auth:Any = None) -> requests.Response:
+        return self._session.request(method, url, params=params, data=data, headers=headers, auth=auth,
+                                     verify=self._api_ssl_verify, timeout=self._api_timeout)
+
+    def iter_entity(self, controller:str, controller_path:Optional[str] = None, params:Optional[Dict[str, Any]] = None, chunkSize:int = 65536) -> Iterator[Dict[str, Any]]:
+        """Get entities from the service as get_entity(), but the entities are yielded one by one while the response is
+        received and parsed. Errors reported by the service are raised before yielding anything.
+        :param controller: Name of the controller.
+        :param controller_path: The path of the query inside the controller.
+        :param params: Parameters of the request.
+        :param chunkSize: Bytes read from the connection at once.
+        :return: An iterator of the dictionaries of the entities."""
+        path = f"{controller}/{controller_path}" if controller_path else controller
+        url = '{}/api/{}/{}'.format(self._api_url, self._api_appid, path)
+        if params and not url.endswith('/'):
+            url = url + '/'
+        for attempt in range(2):
+            with self._stats.measure('GET', path) as span:
+                if self._tokens.token:
+                    self._api_token = self._tokens.token
+                headers = {'token': self._api_token} if self._api_token else {}
+                with self._session.request('GET', url, params=params, headers=headers, verify=self._api_ssl_verify,
+                                           timeout=self._api_timeout, stream=True) as resp:
+                    span.addRequest(resp.request)
+                    stream = _JSONStream(span.countChunks(resp.iter_content(chunk_size=chunkSize)))
+                    hasData = stream.head() is not None
+                    if not hasData and attempt == 0 and self._isAuthError(stream.fields):
+                        # The rejected request is recorded as failed and the retry as another request
+                        span.status = 'error'
+                    else:
+                        # phpIPAM sends the code of the response before the data
+                        if ('code' in stream.fields or not hasData) and (stream.fields.get('code') not in (200, 201) or not stream.fields.get('success')):
+                            raiseError(stream.fields.get('code'), stream.fields.get('message'))
+                        if hasData:
+                            # The time the caller spends processing the entities is not part of the latency of the request
+                            for entity in stream.items():
+                                span.pause()
+                                yield entity
+                                span.resume()
+                        return
+            # Renew the token and retry once
+            self.refreshToken(headers.get('token'))
+
+    def _query(self, path='user', headers=None, method=GET, data=None, params=None, auth=None, token=None):
+        """Send a query to the service through the session. It behaves as phpypam.api._query(), but if the token has
+        expired it is renewed and the query is sent again."""
+        # Use the token renewed by other threads
+        if auth is None and self._tokens.token:
+            self._api_token = self._tokens.token
+        _api_headers = dict(headers or {})
+        if self._api_token:
+            _api_headers['token'] = self._api_token
+
+        _url = '{}/api/{}/{}'.format(self._api_url, self._api_appid, path)
+        if params and not _url.endswith('/'):
+            _url = _url + '/'
+
+        verb = _METHODS.get(method, 'GET')
+        for attempt in range(2):
+            with self._stats.measure(verb, path) as span:
+                resp = self._request(verb, _url, _api_headers, data=data, params=params, auth=auth)
+                span.addResponse(resp)
+                result = resp.json()
+
+                if attempt == 0 and auth is None and self._isAuthError(result):
+                    # The rejected request is recorded as failed and the retry as another request
+                    span.status = 'error'
+                elif result['code'] not in (200, 201) or not result['success']:
+                    raiseError(result['code'], result['message'])
+                else:
+                    return result.get('data')
+            # Renew the token and retry once
+            self.refreshToken(_api_headers.get('token'))
+            _api_headers['token'] = self._api_token
@@ -6,6 +6,8 @@ from typing import Optional
 
 class ipamVLAN:
     """This object wraps a JSON dictionary representing a phpIPAM VLAN either returned by phpypam or created to insert a new VLAN."""
+    __slots__ = ('_vlan',)
+
     def __init__(self, vlan:dict) -> None:
         """Creates a new object. The object is initialized with a dictionary returned by phpypam.
         :param vlan: A JSON dictionary returned by phpypam.
@@ -0,0 +1,23 @@
+#!/usr/bin/python3
+"""This file provides the fixtures shared by the tests: a fake phpIPAM service and a server object connected to it."""
+
+import os, sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+from phpypamobjects import ipamServer
+from ipamfakeserver import ipamFakeServer
+
+@pytest.fixture
+def fake():
+    """A fake service with 4 subnets of 10 addresses each (10.0.i.1 to 10.0.i.10 in 10.0.i.0/24)."""
+    with ipamFakeServer(subnets=4, addresses=40) as server:
+        yield server
+
+@pytest.fixture
+def ipam(fake):
+    """A server object connected to the fake service."""
+    return ipamServer(url=fake.url, app_id=fake.appId, user=fake.user, password=fake.password, cacert='NONE')
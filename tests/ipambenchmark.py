@@ -0,0 +1,367 @@
+#!/usr/bin/python3
+"""This file provides the benchmarks of the library: allocation of free addresses, construction and accessors of the
+objects, filtering of addresses, and bulk operations against the local fake phpIPAM service of ipamfakeserver.py.
+
+The results are written as JSON so the performance of two versions of the library can be compared:
+
+    python3 tests/ipambenchmark.py --output before.json
+    (change the library)
+    python3 tests/ipambenchmark.py --output after.json --compare before.json
+
+The generated data and the injected latency only depend on the seed, so the runs of the same version are comparable.
+The features of the library are detected when it is imported: the benchmarks of features missing in the measured
+version are skipped, so older versions can be measured with the same benchmarks.
+Use --quick for a short run with smaller inventories and --only to run the benchmarks whose name matches a regular expression.
+"""
+
+# Initialize logger
+import logging
+
+mylogger = logging.getLogger()
+
+import os, sys, re, json, time, random, inspect, platform, argparse, subprocess, statistics
+from datetime import datetime
+from ipaddress import IPv4Address, IPv4Network
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from phpypamobjects import ipamServer, ipamAddress, ipamSubnet
+from ipamfakeserver import ipamFakeServer
+
+# Features that older versions of the library lack
+try:
+    from phpypamobjects import ipamFreeSpace
+except ImportError:
+    ipamFreeSpace = None
+try:
+    from phpypamobjects import ipamAddressTable
+except ImportError:
+    ipamAddressTable = None
+
+def _accepts(func:Callable[..., Any], param:str) -> bool:
+    """Check if a function of the library has a parameter."""
+    try:
+        return param in inspect.signature(func).parameters
+    except (TypeError, ValueError):
+        return False
+
+# Version of the format of the results
+_FORMAT = 1
+
+# Prefix lengths of the subnets and fractions of used addresses of the allocation benchmarks
+_SIZES = (24, 20, 16)
+_QUICK_SIZES = (24, 20)
+_FILLS = (0.1, 0.5, 0.9)
+
+class ipamBenchmark:
+    """This object runs the benchmarks and keeps their results. Every benchmark runs a function 'number' times in each
+    of 'repeat' rounds and records the time per call of every round. The minimum is the most stable value for
+    comparisons; the median and the maximum show the noise of the measures. When 'number' is not given, it is chosen
+    so that a round takes at least 'minTime' seconds."""
+    def __init__(self, repeat:int = 5, minTime:float = 0.2, quick:bool = False, only:str = '', seed:int = 1,
+                 latency:float = 0.002) -> None:
+        """Creates the benchmarks.
+        :param repeat: The number of rounds of every benchmark.
+        :param minTime: The minimum seconds of a round of the benchmarks measured in a loop.
+        :param quick: Use smaller inventories and fewer cases.
+        :param only: A regular expression selecting the benchmarks to run by name (as re.search). By default, all of them.
+        :param seed: The seed of the generated data.
+        :param latency: Seconds of latency of the requests to the fake service in the end to end benchmarks."""
+        self.repeat = repeat
+        self.minTime = minTime
+        self.quick = quick
+        self.only = re.compile(only) if only else None
+        self.seed = seed
+        self.latency = latency
+        self.results:Dict[str, Dict[str, Any]] = {}
+
+    def selected(self, name:str) -> bool:
+        """Check if a benchmark must be run."""
+        return self.only is None or self.only.search(name) is not None
+
+    def _calibrate(self, func:Callable[[], Any]) -> int:
+        """Get the number of calls of a round taking at least minTime seconds."""
+        number = 1
+        while True:
+            t0 = time.perf_counter()
+            for _ in range(number):
+                func()
+            elapsed = time.perf_counter() - t0
+            if elapsed >= self.minTime or number >= 1 << 20:
+                return number
+            number *= 2 if elapsed <= 0 else max(2, min(10, int(self.minTime / elapsed) + 1))
+
+    def measure(self, name:str, func:Callable[[], Any], number:Optional[int] = None, repeat:Optional[int] = None,
+                items:int = 1, setup:Optional[Callable[[], Any]] = None, params:Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """Measure a function and record the result.
+        :param name: The name of the benchmark. Names are unique and identify the benchmark when comparing runs.
+        :param func: The function measured, called without arguments.
+        :param number: The number of calls of every round. By default, it is calibrated.
+        :param repeat: The number of rounds. By default, the repeat of the object.
+        :param items: The number of objects processed by a call, to compute the time per item.
+        :param setup: A function called before every round, not measured.
+        :param params: Parameters of the benchmark stored with the result.
+        :return: The result, or None if the benchmark is not selected or fails."""
+        if not self.selected(name):
+            return None
+        times:List[float] = []
+        try:
+            if setup is not None:
+                setup()
+            if number is None:
+                number = self._calibrate(func)
+            for _ in range(repeat or self.repeat):
+                if setup is not None:
+                    setup()
+                t0 = time.perf_counter()
+                for _ in range(number):
+                    func()
+                times.append((time.perf_counter() - t0) / number)
+        except Exception as e:
+            # Older versions of the library may fail on some cases: they are not recorded
+            mylogger.warning(f"{name}: failed with {type(e).__name__}: {str(e)}")
+            print(f"{name:60} {'failed':>10}", flush=True)
+            return None
+        result = {'min': min(times), 'median': statistics.median(times), 'max': max(times), 'number': number,
+                  'repeat': len(times), 'items': items, 'perItem': min(times) / items, 'params': params or {}}
+        self.results[name] = result
+        mylogger.info(f"{name}: {self.format(result['min'])} per call, {self.format(result['perItem'])} per item")
+        print(f"{name:60} {self.format(result['min']):>10} {self.format(result['median']):>10} {self.format(result['perItem']):>10}", flush=True)
+        return result
+
+    @staticmethod
+    def format(seconds:float) -> str:
+        """Get a duration with a readable unit."""
+        for unit, scale in (('s', 1.0), ('ms', 1e-3), ('us', 1e-6)):
+            if seconds >= scale:
+                return f"{seconds / scale:.3f}{unit}"
+        return f"{seconds / 1e-9:.1f}ns"
+
+    ################################################
+    # Allocation of free addresses
+
+    @staticmethod
+    def _usedAddresses(network:IPv4Network, fill:float, seed:int) -> List[int]:
+        """Get a random set of used addresses of a network. Used addresses come in runs, as they are usually assigned."""
+        rng = random.Random(seed)
+        first, last = int(network.network_address) + 1, int(network.broadcast_address) - 1
+        target = int((last - first + 1) * fill)
+        used = set()
+        while len(used) < target:
+            start = rng.randint(first, last)
+            for value in range(start, min(last, start + rng.randint(1, 16)) + 1):
+                used.add(value)
+                if len(used) >= target:
+                    break
+        return sorted(used)
+
+    def benchFit(self, server:ipamServer) -> None:
+        """Fit algorithms of ipamServer on random used addresses, by subnet size and fill ratio."""
+        for mask in (_QUICK_SIZES if self.quick else _SIZES):
+            network = IPv4Network(f"10.0.0.0/{mask}")
+            for fill in _FILLS:
+                used = self._usedAddresses(network, fill, self.seed)
+                usedIPs = [IPv4Address(v) for v in used]
+                params = {'mask': mask, 'fill': fill, 'used': len(used)}
+                for fitAlg, func in (('FirstFit', server._firstFit), ('BestFit', server._bestFit), ('WorstFit', server._worstFit)):
+                    self.measure(f"fit/{fitAlg}/mask={mask}/fill={fill}", lambda: func(network, usedIPs, 4), params=params)
+                if ipamFreeSpace is None:
+                    continue
+                for vectorized in (False, True):
+                    self.measure(f"fit/model/vectorized={vectorized}/mask={mask}/fill={fill}",
+                                 lambda: ipamFreeSpace.fromUsed(network, used, vectorized=vectorized), params=params)
+
+    def benchFindFree(self) -> None:
+        """findFree against the fake service: fetching the addresses and building the free space model, and answering from the index.
+        Versions without the index of free space fetch the addresses in every call, so only the 'fetch' cases are measured."""
+        indexed = _accepts(ipamServer.findFree, 'refresh')
+        for mask in (_QUICK_SIZES if self.quick else _SIZES):
+            size = 1 << (32 - mask)
+            for fill in _FILLS:
+                name = f"findFree/mask={mask}/fill={fill}"
+                if not self.selected(name):
+                    continue
+                count = int((size - 2) * fill)
+                # A single generated subnet holding the used addresses, queried with the size of the benchmark
+                with ipamFakeServer(subnets=1, addresses=count, seed=self.seed) as fake:
+                    server = self.connect(fake)
+                    row = dict(fake._subnet(0))
+                    row['mask'] = str(mask)
+                    subnet = ipamSubnet(row)
+                    params = {'mask': mask, 'fill': fill, 'used': count}
+                    for fitAlg in ('FirstFit', 'BestFit', 'WorstFit'):
+                        if indexed:
+                            self.measure(f"{name}/{fitAlg}/fetch", lambda: server.findFree(subnet, 4, fitAlg, refresh=True),
+                                         repeat=3, params=params)
+                            self.measure(f"{name}/{fitAlg}/indexed", lambda: server.findFree(subnet, 4, fitAlg), params=params)
+                        else:
+                            self.measure(f"{name}/{fitAlg}/fetch", lambda: server.findFree(subnet, 4, fitAlg), repeat=3, params=params)
+
+    ################################################
+    # Objects
+
+    def benchObjects(self, fake:ipamFakeServer) -> None:
+        """Construction of ipamAddress and ipamSubnet objects and cost of their accessors."""
+        rows = list(fake._allAddresses())
+        nets = [fake._subnet(i) for i in range(fake.numSubnets)]
+        addresses = [ipamAddress(addr=row) for row in rows]
+        subnets = [ipamSubnet(net) for net in nets]
+        params = {'addresses': len(rows), 'subnets': len(nets)}
+        self.measure("objects/ipamAddress/construct", lambda: [ipamAddress(addr=row) for row in rows], items=len(rows), params=params)
+        self.measure("objects/ipamSubnet/construct", lambda: [ipamSubnet(net) for net in nets], items=len(nets), params=params)
+        accessors:Sequence[Tuple[str, Callable[[Any], Any]]] = (
+            ('getIP', lambda a: a.getIP()), ('getIPInt', lambda a: a.getIPInt()), ('getHostname', lambda a: a.getHostname()),
+            ('getField', lambda a: a.getField('description')), ('getLastSeen', lambda a: a.getLastSeen()),
+            ('getSubnetId', lambda a: a.getSubnetId()),
+        )
+        for accessor, func in accessors:
+            if not hasattr(ipamAddress, accessor):
+                continue
+            self.measure(f"objects/ipamAddress/{accessor}", lambda: [func(a) for a in addresses], items=len(addresses), params=params)
+        accessors = (
+            ('getSubnet', lambda s: s.getSubnet()), ('getMask', lambda s: s.getMask()), ('getId', lambda s: s.getId()),
+            ('getLastRescan', lambda s: s.getLastRescan()), ('getvlanId', lambda s: s.getvlanId()),
+        )
+        for accessor, func in accessors:
+            self.measure(f"objects/ipamSubnet/{accessor}", lambda: [func(s) for s in subnets], items=len(subnets), params=params)
+        if ipamAddressTable is None:
+            return
+        self.measure("objects/ipamAddressTable/construct", lambda: ipamAddressTable(rows), items=len(rows), params=params)
+        table = ipamAddressTable(rows)
+        self.measure("objects/ipamAddressTable/match", lambda: table.match('hostname', r'host1\d*\.lab\.'), items=len(rows), params=params)
+
+    ################################################
+    # Requests to the fake service
+
+    def connect(self, fake:ipamFakeServer) -> ipamServer:
+        """Connect a server object to a fake service."""
+        return ipamServer(url=fake.url, app_id=fake.appId, user=fake.user, password=fake.password, cacert='NONE')
+
+    def benchFilter(self, fake:ipamFakeServer, server:ipamServer) -> None:
+        """findIPsbyField and searchIPs with patterns that can be sent to the service and patterns filtered locally."""
+        subnet = server.getAllSubnets()[0]
+        patterns = (('hostname', r'host1\d*\.'), ('hostname', r'.*\.lab\.example\.org$'), ('description', r'printer'),
+                    ('description', r'.*(server|camera)'))
+        for field, pattern in patterns:
+            params = {'field': field, 'pattern': pattern}
+            found = self._found(lambda: server.findIPsbyField(subnet, field, pattern))
+            self.measure(f"filter/findIPsbyField/{field}={pattern}", lambda: server.findIPsbyField(subnet, field, pattern),
+                         items=max(1, found), params=dict(params, found=found))
+            if not hasattr(server, 'searchIPs'):
+                continue
+            found = self._found(lambda: server.searchIPs(field, pattern))
+            self.measure(f"filter/searchIPs/{field}={pattern}", lambda: server.searchIPs(field, pattern), repeat=3,
+                         items=max(1, found), params=dict(params, found=found))
+
+    @staticmethod
+    def _found(func:Callable[[], Sequence[Any]]) -> int:
+        """Get the number of objects returned by a search, or zero if it fails (the benchmark reports the failure)."""
+        try:
+            return len(func())
+        except Exception:
+            return 0
+
+    def benchBulk(self, fake:ipamFakeServer, server:ipamServer) -> None:
+        """getAllAddresses and annotate_subnet end to end with the latency of the fake service."""
+        params = {'subnets': fake.numSubnets, 'addresses': fake.numAddresses, 'latency': fake.latency}
+        self.measure("bulk/getAllAddresses", lambda: server.getAllAddresses(), number=1, repeat=3, items=fake.numAddresses, params=params)
+        if _accepts(server.getAllAddresses, 'asTable'):
+            self.measure("bulk/getAllAddresses/asTable", lambda: server.getAllAddresses(asTable=True), number=1, repeat=3,
+                         items=fake.numAddresses, params=params)
+        subnets = list(server.getAllSubnets())
+        pending = iter(subnets)
+        # Every call annotates a subnet that has not been annotated yet
+        self.measure("bulk/annotate_subnet/initial", lambda: server.annotate_subnet(next(pending), hasRouter=True),
+                     number=max(1, min(10, len(subnets) // (self.repeat + 1))), params=params)
+        annotated = subnets[0]
+        self.measure("bulk/annotate_subnet/unchanged", lambda: server.annotate_subnet(annotated, hasRouter=True), params=params)
+        if not hasattr(server, 'annotate_subnets'):
+            return
+        self.measure("bulk/annotate_subnets", lambda: server.annotate_subnets(subnets, hasRouter=True), number=1, repeat=3,
+                     items=len(subnets), setup=fake.reset, params=params)
+
+    ################################################
+
+    def run(self) -> Dict[str, Any]:
+        """Run all the benchmarks.
+        :return: The results with the description of the environment."""
+        started = time.time()
+        print(f"{'benchmark':60} {'min':>10} {'median':>10} {'per item':>10}", flush=True)
+        subnets, addresses = (50, 10000) if self.quick else (500, 100000)
+        with ipamFakeServer(subnets=subnets, addresses=addresses, seed=self.seed) as fake:
+            server = self.connect(fake)
+            self.benchFit(server)
+            self.benchObjects(fake)
+            self.benchFilter(fake, server)
+        self.benchFindFree()
+        with ipamFakeServer(subnets=subnets, addresses=addresses, seed=self.seed, latency=self.latency) as fake:
+            self.benchBulk(fake, self.connect(fake))
+        return {'format': _FORMAT, 'environment': self.environment(), 'quick': self.quick, 'seed': self.seed,
+                'latency': self.latency, 'duration': time.time() - started, 'benchmarks': self.results}
+
+    @staticmethod
+    def environment() -> Dict[str, Any]:
+        """Get the description of the machine and of the versions of the software measured."""
+        try:
+            from importlib.metadata import version
+            library = version('phpypamobjects')
+        except Exception:
+            library = 'unknown'
+        try:
+            commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=10,
+                                    cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+        except Exception:
+            commit = ''
+        import numpy
+        return {'date': datetime.now().astimezone().isoformat(timespec='seconds'), 'library': library, 'commit': commit,
+                'python': platform.python_version(), 'implementation': platform.python_implementation(),
+                'numpy': numpy.__version__, 'machine': platform.machine(), 'system': platform.platform(),
+                'cpus': os.cpu_count()}
+
+def compare(previous:Dict[str, Any], current:Dict[str, Any], threshold:float = 0.1) -> List[Tuple[str, float, float, float]]:
+    """Compare the results of two runs and print the benchmarks present in both.
+    :param previous: The results of the reference run.
+    :param current: The results of the new run.
+    :param threshold: The relative increase of the minimum time reported as a regression (0.1 is 10% slower).
+    :return: The regressions as tuples (name, previous time, current time, ratio)."""
+    regressions:List[Tuple[str, float, float, float]] = []
+    old, new = previous.get('benchmarks', {}), current.get('benchmarks', {})
+    print(f"\n{'benchmark':60} {'previous':>10} {'current':>10} {'ratio':>7}")
+    for name in sorted(set(old) & set(new)):
+        before, after = old[name]['min'], new[name]['min']
+        ratio = after / before if before > 0 else float('inf')
+        mark = ' slower' if ratio > 1 + threshold else (' faster' if ratio < 1 / (1 + threshold) else '')
+        print(f"{name:60} {ipamBenchmark.format(before):>10} {ipamBenchmark.format(after):>10} {ratio:7.2f}{mark}")
+        if ratio > 1 + threshold:
+            regressions.append((name, before, after, ratio))
+    if set(old) - set(new) or set(new) - set(old):
+        print(f"{len(set(old) - set(new))} benchmarks only in the previous run, {len(set(new) - set(old))} only in the current run")
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks of the phpypamobjects library.')
+    parser.add_argument('--output', '-o', default='', help='Write the results to this JSON file.')
+    parser.add_argument('--compare', '-c', default='', help='Compare the results with a previous JSON file.')
+    parser.add_argument('--threshold', type=float, default=0.1, help='Relative slowdown reported as a regression (default 0.1).')
+    parser.add_argument('--only', default='', help='Run only the benchmarks whose name matches this regular expression.')
+    parser.add_argument('--repeat', type=int, default=5, help='Rounds of every benchmark (default 5).')
+    parser.add_argument('--min-time', type=float, default=0.2, help='Minimum seconds of a round (default 0.2).')
+    parser.add_argument('--latency', type=float, default=0.002, help='Latency of the fake service in the end to end benchmarks (default 0.002).')
+    parser.add_argument('--seed', type=int, default=1, help='Seed of the generated data (default 1).')
+    parser.add_argument('--quick', action='store_true', help='Smaller inventories and fewer cases.')
+    args = parser.parse_args()
+    logging.basicConfig(stream=sys.stderr, level=logging.WARNING)
+
+    results = ipamBenchmark(repeat=args.repeat, minTime=args.min_time, quick=args.quick, only=args.only, seed=args.seed,
+                            latency=args.latency).run()
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), results, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} benchmarks are more than {args.threshold:.0%} slower")
+            sys.exit(1)
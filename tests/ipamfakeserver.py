@@ -0,0 +1,670 @@
+#!/usr/bin/python3
+"""This file provides a local fake of the phpIPAM REST API used by the library, for testing and benchmarking without a phpIPAM service.
+
+The data is generated from a seed when it is requested, so large inventories (e.g. 5000 subnets and 1000000 addresses)
+are served without keeping them in memory. Objects created, updated or deleted through the API are kept in an overlay
+on top of the generated data. Latency and errors can be injected in every request.
+
+Run it from the command line and connect the library with the printed environment:
+
+    python3 tests/ipamfakeserver.py --subnets 5000 --addresses 1000000 --latency 0.005 --port 8080
+
+or start it from a test or benchmark:
+
+    with ipamFakeServer(subnets=100, addresses=10000, latency=0.002) as fake:
+        ipam = ipamServer(url=fake.url, app_id=fake.appId, user=fake.user, password=fake.password, cacert='NONE')
+"""
+
+# Initialize logger
+import logging
+
+mylogger = logging.getLogger()
+
+import sys, re, json, time, random, base64, threading, argparse
+from collections import Counter
+from datetime import datetime, timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from ipaddress import IPv4Address, ip_address
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit, parse_qsl, unquote
+
+# Dates of the generated objects are relative to this date, so the data does not depend on the current date
+_EPOCH = datetime(2024, 1, 1, 12, 0, 0)
+_DATE = '%Y-%m-%d %H:%M:%S'
+
+_DOMAINS = ('example.org', 'lab.example.org', 'dmz.example.org', 'example.net')
+_DESCRIPTIONS = ('', 'server', 'printer', 'workstation', '-- autodiscovered --', 'access point', 'camera')
+
+# Rows written at once in streamed responses
+_STREAM_BATCH = 1000
+
+class _NotFound(Exception):
+    """The requested object does not exist. The message is the one phpIPAM returns."""
+
+class _BadRequest(Exception):
+    """The request is not valid. The message is the one phpIPAM returns."""
+
+class ipamFakeServer:
+    """This object serves a fake phpIPAM API on a local HTTP port with generated data. The endpoints are:
+        - POST user: Login with basic authentication. Returns a token valid for 'tokenTTL' seconds.
+        - GET sections, sections/{id}.
+        - GET subnets, subnets/{id}, subnets/{id}/addresses, subnets/search/{ip}/{mask}. PATCH subnets/{id}.
+        - GET addresses, addresses/{id}, addresses/search/{ip}, addresses/search_hostname/{hostname},
+          addresses/search_hostbase/{prefix}. POST addresses. PATCH and DELETE addresses/{id}.
+        - GET vlan, vlan/{id}.
+        - GET tools/scanagents, tools/scanagents/{id}. PATCH tools/scanagents/{id}.
+        - GET tools/nameservers, tools/nameservers/{id}.
+    Lists accept the 'filter_by', 'filter_value' and 'filter_match' (full, partial or regex) parameters.
+    As in phpIPAM, empty lists and searches are answered with status 200, success false and a message ('No results
+    (filter applied)' if a filter was given), missing objects requested by id with status 404, and an address is only
+    a duplicate of another address with the same IP in the same subnet.
+    Numeric fields are returned as numbers, as phpIPAM does on PHP 8.1 or newer.
+
+    Subnet i (id i+1) has the address 10.0.0.0 + i*block, where block is the smallest power of two (at least 256)
+    holding the addresses of a subnet, and its addresses use consecutive IPs from its second address. Address k of
+    subnet i has id i*block + k + 1 and hostname 'host{id}.{domain}' (some addresses have no hostname).
+    """
+    def __init__(self, subnets:int = 100, addresses:int = 10000, seed:int = 1, sections:int = 3, vlans:int = 50,
+                 scanAgents:int = 3, nameservers:int = 4, latency:float = 0.0, jitter:float = 0.0,
+                 errorRate:float = 0.0, errorCode:int = 503, tokenTTL:float = 3600.0, host:str = '127.0.0.1', port:int = 0,
+                 appId:str = 'app', user:str = 'test', password:str = 'test') -> None:
+        """Creates the fake service. It starts serving when start() is called or when it is used as a context manager.
+        :param subnets: Number of generated subnets.
+        :param addresses: Number of generated addresses, distributed evenly among the subnets.
+        :param seed: The seed of the generated data and of the injected latency and errors.
+        :param sections: Number of generated sections.
+        :param vlans: Number of generated VLANs.
+        :param scanAgents: Number of generated scan agents.
+        :param nameservers: Number of generated nameservers.
+        :param latency: Seconds every request is delayed.
+        :param jitter: Maximum random seconds added to the latency.
+        :param errorRate: Probability of answering a request with an injected error.
+        :param errorCode: The HTTP status and code of the injected errors.
+        :param tokenTTL: Seconds a token is valid after login.
+        :param host: The address the server listens on.
+        :param port: The port the server listens on. Zero uses any free port.
+        :param appId: The application identifier accepted in the URLs.
+        :param user: The user accepted at login.
+        :param password: The password accepted at login."""
+        self.numSubnets = subnets
+        self.numAddresses = addresses
+        self.seed = seed
+        self.numSections = sections
+        self.numVLANs = vlans
+        self.numScanAgents = scanAgents
+        self.numNameservers = nameservers
+        self.latency = latency
+        self.jitter = jitter
+        self.errorRate = errorRate
+        self.errorCode = errorCode
+        self.tokenTTL = tokenTTL
+        self.appId = appId
+        self.user = user
+        self.password = password
+        self._host = host
+        self._port = port
+        self._httpd:Optional[ThreadingHTTPServer] = None
+        self._thread:Optional[threading.Thread] = None
+        self._lock = threading.RLock()
+        self._rng = random.Random(seed)
+        # Addresses per subnet and size of the block of every subnet
+        perSubnet = -(-addresses // subnets) if subnets else 0
+        self.block = 256
+        while self.block < perSubnet + 3:
+            self.block *= 2
+        self.mask = 32 - (self.block.bit_length() - 1)
+        self._base = int(IPv4Address('10.0.0.0'))
+        self._dates:Dict[int, str] = {}
+        self._reset()
+
+    def _reset(self) -> None:
+        with self._lock:
+            self._tokens:Dict[str, float] = {}
+            # Overlay of the generated data: modified addresses by id (None if deleted) and created addresses by id
+            self._modified:Dict[int, Optional[Dict[str, Any]]] = {}
+            self._created:Dict[int, Dict[str, Any]] = {}
+            self._nextId = self.numSubnets * self.block + 1
+            self._subnetOverlay:Dict[int, Dict[str, Any]] = {}
+            self._agentOverlay:Dict[int, Dict[str, Any]] = {}
+            self.requests:Counter = Counter()
+
+    def reset(self) -> None:
+        """Discard the changes made through the API, the tokens and the request counters."""
+        self._reset()
+
+    ################################################
+    # Generated data
+
+    @staticmethod
+    def _mix(value:int) -> int:
+        """Get a pseudo-random 32-bit number from an integer (splitmix style), cheaper than a Random object per row."""
+        value = (value + 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+        value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & 0xFFFFFFFFFFFFFFFF
+        value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & 0xFFFFFFFFFFFFFFFF
+        return (value ^ (value >> 31)) & 0xFFFFFFFF
+
+    def _count(self, index:int) -> int:
+        """Get the number of generated addresses of a subnet."""
+        count = self.numAddresses // self.numSubnets
+        return count + 1 if index < self.numAddresses % self.numSubnets else count
+
+    def _subnet(self, index:int) -> Dict[str, Any]:
+        """Generate the subnet with the given index."""
+        h = self._mix(self.seed * 7919 + index)
+        subnet = {
+            'id': index + 1, 'subnet': str(IPv4Address(self._base + index * self.block)), 'mask': str(self.mask),
+            'sectionId': index % self.numSections + 1 if self.numSections else 0,
+            'description': f"Subnet {index + 1}", 'linked_subnet': None, 'firewallAddressObject': None,
+            'vrfId': 0, 'masterSubnetId': 0, 'allowRequests': 1,
+            'vlanId': h % self.numVLANs + 1 if self.numVLANs and h % 5 else 0,
+            'showName': 1, 'device': 0, 'permissions': '{"3":"1","2":"2"}', 'pingSubnet': 1, 'discoverSubnet': 1,
+            'resolveDNS': 0, 'DNSrecursive': 0, 'DNSrecords': 0,
+            'nameserverId': h % self.numNameservers + 1 if self.numNameservers else 0,
+            'scanAgent': index % self.numScanAgents + 1 if self.numScanAgents else 0,
+            'customer_id': None, 'isFolder': 0, 'isFull': 0, 'isPool': 0 if h % 10 == 0 else 1, 'tag': 2,
+            'threshold': 0, 'location': None,
+            'editDate': (_EPOCH - timedelta(days=h % 365)).strftime(_DATE),
+            'lastScan': (_EPOCH - timedelta(minutes=h % 1440)).strftime(_DATE),
+            'lastDiscovery': (_EPOCH - timedelta(minutes=(h >> 8) % 1440)).strftime(_DATE),
+        }
+        subnet.update(self._subnetOverlay.get(index + 1, {}))
+        return subnet
+
+    def _generated(self, addrId:int) -> Optional[Dict[str, Any]]:
+        """Generate the address with the given id, or None if it is not a generated address."""
+        index, k = divmod(addrId - 1, self.block)
+        if addrId < 1 or index >= self.numSubnets or k >= self._count(index):
+            return None
+        h = self._mix(self.seed * 104729 + addrId)
+        ip = self._base + index * self.block + k + 1
+        return {
+            'id': addrId, 'subnetId': index + 1, 'ip': f"{ip >> 24}.{(ip >> 16) & 255}.{(ip >> 8) & 255}.{ip & 255}",
+            'is_gateway': 0, 'description': _DESCRIPTIONS[h % len(_DESCRIPTIONS)],
+            'hostname': f"host{addrId}.{_DOMAINS[(h >> 4) % len(_DOMAINS)]}" if h % 10 else None,
+            'mac': '02:%02x:%02x:%02x:%02x:%02x' % (h >> 24, (h >> 16) & 255, (h >> 8) & 255, h & 255, index & 255) if h % 3 else None,
+            'owner': None, 'tag': 1 if h % 17 == 0 else 2, 'deviceId': 0, 'location': 0, 'port': None,
+            'note': None, 'lastSeen': None if h % 7 == 0 else self._minutesAgo((h >> 3) % (90 * 1440)),
+            'excludePing': 0, 'PTRignore': 0, 'PTR': 0, 'firewallAddressObject': None,
+            'editDate': None, 'customer_id': None,
+            'custom_apiblock': 0, 'custom_apinotremovable': 0, 'custom_tcpports': None, 'custom_scanagentid': 0,
+            'custom_scanfirstdate': None, 'custom_OS_current': None, 'custom_OS_detected': None,
+        }
+
+    def _minutesAgo(self, minutes:int) -> str:
+        """Get the text of the date some minutes before the reference date. Dates are formatted once."""
+        date = self._dates.get(minutes)
+        if date is None:
+            date = self._dates[minutes] = (_EPOCH - timedelta(minutes=minutes)).strftime(_DATE)
+        return date
+
+    def _address(self, addrId:int) -> Optional[Dict[str, Any]]:
+        """Get the current version of an address: modified, created or generated."""
+        with self._lock:
+            if addrId in self._modified:
+                return self._modified[addrId]
+            if addrId in self._created:
+                return self._created[addrId]
+        return self._generated(addrId)
+
+    def _addressesOf(self, subnetId:int) -> Iterator[Dict[str, Any]]:
+        """Iterate over the current addresses of a subnet."""
+        index = subnetId - 1
+        with self._lock:
+            modified = dict(self._modified)
+            created = [dict(a) for a in self._created.values() if a['subnetId'] == subnetId]
+        if 0 <= index < self.numSubnets:
+            first = index * self.block + 1
+            for addrId in range(first, first + self._count(index)):
+                addr = modified[addrId] if addrId in modified else self._generated(addrId)
+                if addr is not None:
+                    yield addr
+        yield from created
+
+    def _allAddresses(self) -> Iterator[Dict[str, Any]]:
+        for index in range(self.numSubnets):
+            yield from self._addressesOf(index + 1)
+        with self._lock:
+            created = [dict(a) for a in self._created.values() if not 0 < a['subnetId'] <= self.numSubnets]
+        yield from created
+
+    def _addressesByIP(self, ip:str) -> List[Dict[str, Any]]:
+        """Find the addresses with an IP without scanning the generated data."""
+        found:List[Dict[str, Any]] = []
+        try:
+            value = int(ip_address(ip))
+        except ValueError:
+            return found
+        index, offset = divmod(value - self._base, self.block)
+        if 0 <= index < self.numSubnets and 1 <= offset <= self._count(index):
+            addr = self._address(index * self.block + offset)
+            if addr is not None and addr['ip'] == ip:
+                found.append(addr)
+        with self._lock:
+            found.extend(dict(a) for a in self._created.values() if a['ip'] == ip)
+            found.extend(dict(a) for a in self._modified.values() if a is not None and a['ip'] == ip and a not in found)
+        return found
+
+    def _addressesByHostname(self, hostname:str) -> List[Dict[str, Any]]:
+        """Find the addresses with a hostname without scanning the generated data."""
+        found:List[Dict[str, Any]] = []
+        match = re.match(r'host(\d+)\.', hostname)
+        if match:
+            addr = self._address(int(match.group(1)))
+            if addr is not None and addr['hostname'] == hostname:
+                found.append(addr)
+        with self._lock:
+            for a in list(self._created.values()) + [a for a in self._modified.values() if a is not None]:
+                if a['hostname'] == hostname and all(a['id'] != f['id'] for f in found):
+                    found.append(dict(a))
+        return found
+
+    def _sections(self) -> List[Dict[str, Any]]:
+        return [{'id': i, 'name': f"Section {i}", 'description': f"Generated section {i}", 'masterSection': 0,
+                 'permissions': '{"3":"1","2":"2"}', 'strictMode': 1, 'subnetOrdering': 'default', 'order': None,
+                 'editDate': None, 'showSubnet': 1, 'showVLAN': 1, 'showVRF': 0, 'showSupernetOnly': 0, 'DNS': None}
+                for i in range(1, self.numSections + 1)]
+
+    def _vlans(self) -> List[Dict[str, Any]]:
+        return [{'vlanId': i, 'domainId': 1, 'name': f"VLAN{100 + i}", 'number': 100 + i,
+                 'description': f"Generated VLAN {100 + i}", 'editDate': None, 'customer_id': None}
+                for i in range(1, self.numVLANs + 1)]
+
+    def _scanAgents(self) -> List[Dict[str, Any]]:
+        agents = []
+        for i in range(1, self.numScanAgents + 1):
+            agent = {'id': i, 'name': f"agent{i}", 'description': f"Generated scan agent {i}", 'type': 'mysql',
+                     'code': f"{i:032x}", 'last_access': _EPOCH.strftime(_DATE)}
+            agent.update(self._agentOverlay.get(i, {}))
+            agents.append(agent)
+        return agents
+
+    def _nameservers(self) -> List[Dict[str, Any]]:
+        return [{'id': i, 'name': f"DNS {i}", 'namesrv1': f"192.0.2.{2*i};192.0.2.{2*i + 1}",
+                 'description': f"Generated nameservers {i}", 'permissions': '1;2', 'editDate': None}
+                for i in range(1, self.numNameservers + 1)]
+
+    ################################################
+    # API
+
+    @staticmethod
+    def _byId(rows:Iterable[Dict[str, Any]], key:str, value:str, message:str) -> Dict[str, Any]:
+        for row in rows:
+            if str(row[key]) == value:
+                return row
+        raise _NotFound(message)
+
+    @staticmethod
+    def _filter(rows:Iterable[Dict[str, Any]], params:Dict[str, str]) -> Iterator[Dict[str, Any]]:
+        """Apply the filter parameters of phpIPAM to a list of objects."""
+        field = params.get('filter_by')
+        if not field:
+            yield from rows
+            return
+        value = params.get('filter_value', '')
+        match = params.get('filter_match', 'full')
+        if match == 'regex':
+            regex = re.compile(value.strip('/'))
+        first = True
+        for row in rows:
+            if first and field not in row:
+                raise _BadRequest(f"Invalid filter_by value {field}")
+            first = False
+            current = '' if row.get(field) is None else str(row[field])
+            if (match == 'full' and current == value) or (match == 'partial' and value in current) or (match == 'regex' and regex.search(current)):
+                yield row
+
+    def _get(self, segments:List[str], params:Dict[str, str]) -> Tuple[Any, str]:
+        """Answer a GET request.
+        :return: A tuple (data, message if the data is empty). Data may be an iterator to stream it."""
+        controller, args = segments[0], segments[1:]
+        if controller == 'sections':
+            if args:
+                return self._byId(self._sections(), 'id', args[0], 'Section not found'), ''
+            return self._sections(), 'No sections available'
+        if controller == 'subnets':
+            if not args:
+                return (self._subnet(i) for i in range(self.numSubnets)), 'No subnets found'
+            if args[0] == 'search' and len(args) >= 3:
+                found = [self._subnet(i) for i in self._subnetsByNet(args[1], args[2])]
+                return found, 'No subnets found'
+            index = self._index(args[0])
+            if len(args) == 1:
+                return self._subnet(index), ''
+            if args[1] == 'addresses':
+                return self._addressesOf(index + 1), 'No addresses found'
+            raise _BadRequest('Invalid identifier')
+        if controller == 'addresses':
+            if not args:
+                return self._allAddresses(), 'No addresses found'
+            if args[0] == 'search' and len(args) > 1:
+                return self._addressesByIP(args[1]), 'Address not found'
+            if args[0] == 'search_hostname' and len(args) > 1:
+                return self._addressesByHostname(args[1]), 'Hostname not found'
+            if args[0] == 'search_hostbase' and len(args) > 1:
+                prefix = args[1]
+                return (a for a in self._allAddresses() if (a['hostname'] or '').startswith(prefix)), 'Host name not found'
+            addr = self._address(self._number(args[0]))
+            if addr is None:
+                raise _NotFound('Address not found')
+            return addr, ''
+        if controller == 'vlan':
+            if args:
+                return self._byId(self._vlans(), 'vlanId', args[0], 'Vlan not found'), ''
+            return self._vlans(), 'No vlans configured'
+        if controller == 'tools' and args and args[0] == 'scanagents':
+            if len(args) > 1:
+                return self._byId(self._scanAgents(), 'id', args[1], 'No objects found'), ''
+            return self._scanAgents(), 'No objects found'
+        if controller == 'tools' and args and args[0] == 'nameservers':
+            if len(args) > 1:
+                return self._byId(self._nameservers(), 'id', args[1], 'No objects found'), ''
+            return self._nameservers(), 'No objects found'
+        raise _BadRequest('Invalid controller')
+
+    @staticmethod
+    def _number(value:str) -> int:
+        try:
+            return int(value)
+        except ValueError:
+            raise _BadRequest('Invalid identifier')
+
+    def _index(self, subnetId:str) -> int:
+        index = self._number(subnetId) - 1
+        if not 0 <= index < self.numSubnets:
+            raise _NotFound('No subnets found')
+        return index
+
+    def _subnetsByNet(self, base:str, mask:str) -> List[int]:
+        try:
+            value = int(ip_address(base))
+        except ValueError:
+            raise _BadRequest('Invalid subnet')
+        index, offset = divmod(value - self._base, self.block)
+        if offset == 0 and str(mask) == str(self.mask) and 0 <= index < self.numSubnets:
+            return [index]
+        return []
+
+    @staticmethod
+    def _coerce(row:Dict[str, Any], values:Dict[str, Any]) -> Dict[str, Any]:
+        """Convert the values received as text to the type of the fields, as the database of phpIPAM does."""
+        result = {}
+        for key, value in values.items():
+            if isinstance(row.get(key), int) and isinstance(value, str) and re.fullmatch(r'-?\d+', value):
+                value = int(value)
+            elif value == '' and key in ('lastSeen', 'editDate', 'custom_scanfirstdate'):
+                value = None
+            result[key] = value
+        return result
+
+    def _create(self, segments:List[str], data:Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        if segments != ['addresses']:
+            raise _BadRequest('Method not allowed')
+        ip = data.get('ip')
+        if not ip or 'subnetId' not in data:
+            raise _BadRequest('Subnet ID and IP address are mandatory')
+        subnetId = self._number(str(data['subnetId']))
+        if any(a['subnetId'] == subnetId for a in self._addressesByIP(ip)):
+            return 409, {'code': 409, 'success': False, 'message': 'IP address already exists'}
+        with self._lock:
+            addrId = self._nextId
+            self._nextId += 1
+            addr = {'id': addrId, 'subnetId': subnetId, 'ip': ip, 'is_gateway': 0,
+                    'description': None, 'hostname': None, 'mac': None, 'tag': 2, 'note': None, 'lastSeen': None,
+                    'excludePing': 0, 'custom_apiblock': 0, 'custom_apinotremovable': 0}
+            addr.update(self._coerce(addr, {k: v for k, v in data.items() if k not in ('id', 'subnetId', 'ip')}))
+            self._created[addrId] = addr
+        return 201, {'code': 201, 'success': True, 'message': 'Address created', 'id': str(addrId), 'data': ip}
+
+    def _update(self, segments:List[str], values:Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        controller, args = segments[0], segments[1:]
+        if controller == 'addresses' and len(args) == 1:
+            addrId = self._number(args[0])
+            with self._lock:
+                addr = self._address(addrId)
+                if addr is None:
+                    raise _NotFound('Address not found')
+                addr = dict(addr)
+                addr.update(self._coerce(addr, {k: v for k, v in values.items() if k not in ('id', 'subnetId')}))
+                if addrId in self._created:
+                    self._created[addrId] = addr
+                else:
+                    self._modified[addrId] = addr
+            return 200, {'code': 200, 'success': True, 'message': 'Address updated'}
+        if controller == 'subnets' and len(args) == 1:
+            index = self._index(args[0])
+            with self._lock:
+                self._subnetOverlay.setdefault(index + 1, {}).update({k: v for k, v in values.items() if k != 'id'})
+            return 200, {'code': 200, 'success': True, 'message': 'Subnet updated'}
+        if controller == 'tools' and len(args) == 2 and args[0] == 'scanagents':
+            agentId = self._number(args[1])
+            if not 1 <= agentId <= self.numScanAgents:
+                raise _NotFound('No objects found')
+            with self._lock:
+                self._agentOverlay.setdefault(agentId, {}).update({k: v for k, v in values.items() if k != 'id'})
+            return 200, {'code': 200, 'success': True, 'message': 'Object updated'}
+        raise _BadRequest('Method not allowed')
+
+    def _delete(self, segments:List[str]) -> Tuple[int, Dict[str, Any]]:
+        if segments[0] != 'addresses' or len(segments) != 2:
+            raise _BadRequest('Method not allowed')
+        addrId = self._number(segments[1])
+        with self._lock:
+            if self._address(addrId) is None:
+                raise _NotFound('Address not found')
+            if addrId in self._created:
+                del self._created[addrId]
+            else:
+                self._modified[addrId] = None
+        return 200, {'code': 200, 'success': True, 'message': 'Address deleted'}
+
+    ################################################
+    # HTTP
+
+    def _login(self, authorization:str) -> Tuple[int, Dict[str, Any]]:
+        try:
+            user, _, password = base64.b64decode(authorization.split(' ', 1)[1]).decode().partition(':')
+        except Exception:
+            user, password = '', ''
+        if user != self.user or password != self.password:
+            return 500, {'code': 500, 'success': False, 'message': 'Invalid username or password'}
+        with self._lock:
+            token = f"{self._rng.getrandbits(128):032x}"
+            expires = time.time() + self.tokenTTL
+            self._tokens[token] = expires
+        return 200, {'code': 200, 'success': True, 'data': {'token': token, 'expires': datetime.fromtimestamp(expires).strftime(_DATE)}}
+
+    def _authorized(self, token:Optional[str]) -> bool:
+        with self._lock:
+            return token is not None and self._tokens.get(token, 0.0) > time.time()
+
+    def expireTokens(self) -> None:
+        """Invalidate all the tokens, as if they had expired."""
+        with self._lock:
+            self._tokens = {}
+
+    def _delay(self) -> Optional[Tuple[int, Dict[str, Any]]]:
+        """Sleep the injected latency and decide if the request fails."""
+        with self._lock:
+            delay = self.latency + (self._rng.random() * self.jitter if self.jitter else 0.0)
+            fail = self.errorRate > 0 and self._rng.random() < self.errorRate
+        if delay > 0:
+            time.sleep(delay)
+        if fail:
+            return self.errorCode, {'code': self.errorCode, 'success': False, 'message': 'Injected error'}
+        return None
+
+    def handle(self, method:str, path:str, headers:Any, body:bytes) -> Tuple[int, Any]:
+        """Answer a request of the API.
+        :return: A tuple (HTTP status, response). The response is a dictionary or an iterator of the rows of 'data'."""
+        url = urlsplit(path)
+        segments = [unquote(s) for s in url.path.split('/') if s]
+        params = dict(parse_qsl(url.query, keep_blank_values=True))
+        if len(segments) < 3 or segments[0] != 'api':
+            return 400, {'code': 400, 'success': False, 'message': 'Invalid request'}
+        if segments[1] != self.appId:
+            return 400, {'code': 400, 'success': False, 'message': 'Invalid application id'}
+        segments = segments[2:]
+        controller = '/'.join(segments[:2]) if segments[0] == 'tools' else segments[0]
+        with self._lock:
+            self.requests[(method, controller)] += 1
+        injected = self._delay()
+        if injected is not None:
+            return injected
+        if segments[0] == 'user':
+            if method == 'POST':
+                return self._login(headers.get('Authorization', ''))
+            return 400, {'code': 400, 'success': False, 'message': 'Method not allowed'}
+        if not self._authorized(headers.get('token') or headers.get('phpipam-token')):
+            return 401, {'code': 401, 'success': False, 'message': 'Token expired'}
+        try:
+            if method == 'GET':
+                data, message = self._get(segments, params)
+                if isinstance(data, dict):
+                    return 200, {'code': 200, 'success': True, 'data': data}
+                if params.get('filter_by'):
+                    message = 'No results (filter applied)'
+                return 200, (self._filter(data, params), message)
+            values = dict(params)
+            if body:
+                if headers.get('Content-Type', '').startswith('application/json'):
+                    values.update(json.loads(body))
+                else:
+                    values.update(parse_qsl(body.decode(), keep_blank_values=True))
+            if method == 'POST':
+                return self._create(segments, values)
+            if method == 'PATCH':
+                return self._update(segments, values)
+            if method == 'DELETE':
+                return self._delete(segments)
+            return 400, {'code': 400, 'success': False, 'message': 'Method not allowed'}
+        except _NotFound as e:
+            return 404, {'code': 404, 'success': False, 'message': str(e)}
+        except _BadRequest as e:
+            return 400, {'code': 400, 'success': False, 'message': str(e)}
+
+    def start(self) -> str:
+        """Start serving in a background thread.
+        :return: The URL of the service."""
+        fake = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and bodies are written separately: without TCP_NODELAY small responses wait for delayed ACKs
+            disable_nagle_algorithm = True
+
+            def log_message(self, format:str, *args:Any) -> None:
+                mylogger.debug(format % args)
+
+            def _answer(self) -> None:
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                try:
+                    status, response = fake.handle(self.command, self.path, self.headers, body)
+                    if isinstance(response, dict):
+                        self._send(status, json.dumps(response).encode())
+                    else:
+                        self._stream(*response)
+                except _BadRequest as e:
+                    self._send(400, json.dumps({'code': 400, 'success': False, 'message': str(e)}).encode())
+                except Exception as e:
+                    mylogger.error(f"Error in fake phpIPAM service: {str(e)}")
+                    self._send(500, json.dumps({'code': 500, 'success': False, 'message': str(e)}).encode())
+
+            def _send(self, status:int, payload:bytes) -> None:
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _stream(self, rows:Iterator[Dict[str, Any]], message:str) -> None:
+                """Send a list with chunked encoding while it is generated."""
+                first = next(rows, None)
+                if first is None:
+                    # phpIPAM answers empty lists with an error and status 200
+                    self._send(200, json.dumps({'code': 200, 'success': False, 'message': message}).encode())
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                self._chunk('{"code":200,"success":true,"data":[' + json.dumps(first))
+                batch:List[Dict[str, Any]] = []
+                for row in rows:
+                    batch.append(row)
+                    if len(batch) >= _STREAM_BATCH:
+                        # Encode the rows of a batch at once and drop the brackets of the list
+                        self._chunk(',' + json.dumps(batch)[1:-1])
+                        batch = []
+                self._chunk((',' + json.dumps(batch)[1:-1] if batch else '') + '],"time":0.001}')
+                self.wfile.write(b'0\r\n\r\n')
+
+            def _chunk(self, text:str) -> None:
+                data = text.encode()
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+
+            do_GET = do_POST = do_PATCH = do_DELETE = _answer
+
+        class _Server(ThreadingHTTPServer):
+            daemon_threads = True
+
+            def handle_error(self, request:Any, client_address:Any) -> None:
+                # Clients closing their keep-alive connections are not errors
+                if not isinstance(sys.exc_info()[1], ConnectionError):
+                    super().handle_error(request, client_address)
+
+        self._httpd = _Server((self._host, self._port), _Handler)
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self.url
+
+    @property
+    def url(self) -> str:
+        """The URL of the service."""
+        if self._httpd is None:
+            return ''
+        return f"http://{self._httpd.server_address[0]}:{self._httpd.server_address[1]}"
+
+    def stop(self) -> None:
+        """Stop serving."""
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+    def __enter__(self) -> "ipamFakeServer":
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fake phpIPAM API with generated data.')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--subnets', type=int, default=5000)
+    parser.add_argument('--addresses', type=int, default=1000000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds every request is delayed')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Maximum random seconds added to the latency')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Probability of an injected error')
+    parser.add_argument('--error-code', type=int, default=503)
+    parser.add_argument('--app', default='app')
+    parser.add_argument('--user', default='test')
+    parser.add_argument('--password', default='test')
+    args = parser.parse_args()
+    logging.basicConfig(stream=sys.stderr, level=logging.INFO)
+    fake = ipamFakeServer(subnets=args.subnets, addresses=args.addresses, seed=args.seed, latency=args.latency,
+                          jitter=args.jitter, errorRate=args.error_rate, errorCode=args.error_code, host=args.host,
+                          port=args.port, appId=args.app, user=args.user, password=args.password)
+    url = fake.start()
+    print(f'export MYIPAM_URL="{url}"')
+    print(f'export MYIPAM_APPID="{args.app}"')
+    print(f'export MYIPAM_USER="{args.user}"')
+    print(f'export MYIPAM_PASSWD="{args.password}"')
+    print('export MYIPAM_CACERT="NONE"')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        fake.stop()
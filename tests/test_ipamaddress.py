@@ -0,0 +1,78 @@
+#!/usr/bin/python3
+"""This file provides the tests of the protection rules and the change tracking of ipamAddress."""
+
+from ipaddress import IPv4Address
+
+import pytest
+
+from phpypamobjects import ipamAddress, ipamTags
+
+def _address(**fields) -> ipamAddress:
+    row = {'id': 1, 'ip': '10.0.0.1', 'hostname': 'a.example.org', 'description': 'server', 'tag': ipamTags.TAG_used,
+           'is_gateway': 0, 'custom_apiblock': 0, 'lastSeen': None}
+    row.update(fields)
+    return ipamAddress(row)
+
+@pytest.mark.parametrize('fields', [{'custom_apiblock': 1}, {'tag': ipamTags.TAG_reserved}, {'is_gateway': 1}, {'is_gateway': '1'}])
+def test_protected_addresses_reject_writes(fields):
+    addr = _address(**fields)
+    # Writing the current value is not a change, so it is not rejected
+    addr.setHostname('a.example.org')
+    with pytest.raises(PermissionError):
+        addr.setDescription('other')
+    assert not addr.hasChanges()
+    addr.setHostname('forced.example.org', force=True)
+    assert addr.getChanges() == {'hostname': 'forced.example.org'}
+
+def test_scan_fields_of_routers_can_be_written():
+    addr = _address(is_gateway=1)
+    addr.setMAC('02:00:00:00:00:01')
+    addr.updateLastSeen()
+    assert set(addr.getChanges()) == {'mac', 'lastSeen'}
+
+def test_changes_are_tracked():
+    addr = _address()
+    addr.setHostname('a.example.org')
+    assert not addr.hasChanges()
+    addr.setHostname('b.example.org')
+    addr.setDescription('printer')
+    assert addr.getChanges() == {'hostname': 'b.example.org', 'description': 'printer'}
+    # Values set back to the original are not changes
+    addr.setHostname('a.example.org')
+    assert addr.getChanges() == {'description': 'printer'}
+    addr.clearChanges({'description': 'printer'})
+    assert not addr.hasChanges()
+
+def test_values_are_compared_as_text():
+    # The service returns numbers as strings and empty fields as null
+    addr = _address(tag='2', custom_apiblock='0', note=None, custom_tcpports='')
+    assert addr.getFieldInt('tag') == 2 and addr.getFieldInt('note') == 0
+    addr.updateField('tag', 2)
+    addr.setNote('')
+    addr.setTCPports(None)
+    assert not addr.hasChanges()
+    addr.updateField('tag', 8)
+    assert addr.getChanges() == {'tag': 8}
+    # Fields that did not exist are changes even if they are empty
+    addr.setAgentId('')
+    assert addr.getChanges() == {'tag': 8, 'custom_scanagentid': ''}
+
+def test_subnet_changes_are_tracked(fake, ipam):
+    subnets = ipam.getAllSubnets()
+    addr = ipam.findIPsbyNet(subnets[0])[0]
+    addr.setSubnetId(subnets[0].getId())
+    assert not addr.hasChanges()
+    addr.setSubnetId(subnets[1].getId())
+    assert addr.getChanges() == {'subnetId': subnets[1].getId()}
+    fake.requests.clear()
+    ipam.updateAddress(addr)
+    assert fake.requests[('PATCH', 'addresses')] == 1
+    assert not addr.hasChanges()
+
+def test_parsed_ip_follows_the_field():
+    addr = _address()
+    assert addr.getIP() is addr.getIP()
+    assert addr.getIPInt() == int(IPv4Address('10.0.0.1'))
+    addr.setIP(IPv4Address('10.0.0.2'))
+    assert addr.getIP() == IPv4Address('10.0.0.2')
+    assert addr.getVersion() == 4
@@ -0,0 +1,94 @@
+#!/usr/bin/python3
+"""This file provides the tests of the columnar container of addresses ipamAddressTable."""
+
+import math, re
+from datetime import datetime, timedelta
+from ipaddress import IPv4Address, IPv6Address, ip_network
+
+import numpy as np
+import pytest
+
+from phpypamobjects import ipamAddress, ipamAddressTable
+from phpypamobjects.ipamQuery import ipamQuery
+
+NOW = datetime(2024, 6, 1, 12, 0, 0).astimezone()
+
+ROWS = [
+    {'id': 1, 'subnetId': 1, 'ip': '10.0.0.2', 'hostname': 'b.example.org', 'tag': 2, 'state': None, 'lastSeen': '2024-06-01 11:00:00', 'port': 8},
+    {'id': '2', 'subnetId': '1', 'ip': '10.0.0.1', 'hostname': None, 'tag': '3', 'lastSeen': None, 'port': '80'},
+    {'id': 3, 'subnetId': 2, 'ip': '2001:db8::1', 'hostname': 'a.example.org', 'tag': 2, 'lastSeen': '2024-05-31T12:00:00+00:00'},
+    {'id': 4, 'ip': 'invalid', 'hostname': '', 'tag': 'x', 'lastSeen': ''},
+]
+
+@pytest.fixture
+def table():
+    return ipamAddressTable([dict(row) for row in ROWS])
+
+def test_typed_columns(table):
+    assert len(table) == 4
+    assert table.column('id').tolist() == [1, 2, 3, 4]
+    assert table.column('subnetId').tolist() == [1, 1, 2, -1]
+    assert table.column('tag').tolist() == [2, 3, 2, -1]
+    assert table.column('state').tolist() == [-1, -1, -1, -1]
+    assert table.column('ip').tolist() == [IPv4Address('10.0.0.2'), IPv4Address('10.0.0.1'), IPv6Address('2001:db8::1'), None]
+    assert table.column('hostname').tolist() == ['b.example.org', None, 'a.example.org', '']
+    seen = table.column('lastSeen')
+    assert seen[0] == datetime(2024, 6, 1, 11, 0, 0).timestamp()
+    assert seen[2] == datetime.fromisoformat('2024-05-31T12:00:00+00:00').timestamp()
+    assert math.isnan(seen[1]) and math.isnan(seen[3])
+    ages = table.age(NOW)
+    assert ages[0] == 3600 and math.isnan(ages[1])
+
+@pytest.mark.parametrize('field, pattern', [
+    ('hostname', 'b'), ('hostname', ''), ('hostname', '$'), ('hostname', r'.*\.org$'), ('hostname', '(?!a)'),
+    ('ip', r'10\.0\.0\.'), ('tag', '3'), ('port', '8'), ('missing', ''), ('missing', 'x'),
+])
+def test_match_is_the_match_of_searches(table, field, pattern):
+    # Missing and null values are matched as empty strings and numbers as their text, as in findIPsbyField
+    expected = [ipamQuery(field, pattern).matches(row) for row in ROWS]
+    assert table.match(field, pattern).tolist() == expected
+    assert expected == [re.match(pattern, '' if row.get(field) is None else str(row.get(field))) is not None for row in ROWS]
+
+def test_match_of_the_service(fake, ipam):
+    subnet = ipam.getAllSubnets()[0]
+    table = ipam.findIPsbyNet(subnet, asTable=True)
+    for field, pattern in (('hostname', ''), ('mac', '$'), ('description', '.*server'), ('tag', '1')):
+        found = [a.getDictionary() for a in ipam.findIPsbyField(subnet, field, pattern)]
+        assert table.filter(table.match(field, pattern)).getDictionaries() == found
+
+def test_selections(table):
+    assert table.isIn('tag', [3, -1]).tolist() == [False, True, False, True]
+    assert table.isIn('hostname', [None, 'a.example.org']).tolist() == [False, True, True, False]
+    assert table.inNetwork(ip_network('10.0.0.0/31')).tolist() == [False, True, False, False]
+    assert table.inNetwork(ip_network('2001:db8::/32')).tolist() == [False, False, True, False]
+    selected = table.filter(table.match('hostname', r'.*\.org') & (table.column('tag') == 2))
+    assert [a.getId() for a in selected] == [1, 3]
+    assert isinstance(table[0], ipamAddress) and table[-1].getId() == 4
+    assert [a.getId() for a in table[1:3]] == ['2', 3]
+    assert [a.getId() for a in table[np.array([True, False, False, True])]] == [1, 4]
+    # Rows are shared with the addresses created from the table
+    table[0].getDictionary()['hostname'] = 'changed'
+    assert table.getDictionaries()[0]['hostname'] == 'changed'
+
+def test_sort_and_group(table):
+    assert [a.getId() for a in table.sortBy('ip')] == [4, '2', 1, 3]
+    assert [a.getId() for a in table.sortBy('ip', descending=True)] == [3, 1, '2', 4]
+    # Addresses never seen are sorted last
+    assert [a.getId() for a in table.sortBy('lastSeen')] == [3, 1, '2', 4]
+    assert [a.getId() for a in table.sortBy('hostname')] == ['2', 4, 3, 1]
+    groups = table.groupBySubnet()
+    assert {key: [a.getId() for a in group] for key, group in groups.items()} == {-1: [4], 1: [1, '2'], 2: [3]}
+
+def test_concat_and_conversions(table):
+    joined = ipamAddressTable.concat([table[:2], table[2:]])
+    assert joined.getDictionaries() == table.getDictionaries()
+    for name in ('version', 'ipHi', 'ipLo', 'id', 'subnetId', 'tag', 'state'):
+        assert joined.column(name).tolist() == table.column(name).tolist()
+    assert len(ipamAddressTable.concat([])) == 0
+    assert len(ipamAddressTable()) == 0
+    addresses = table.toAddresses()
+    assert ipamAddressTable.fromAddresses(addresses).getDictionaries() == table.getDictionaries()
+    # IPv4 only tables keep the addresses in the low 64 bits
+    assert table[:2].column('ipHi').tolist() == [0, 0]
+    assert ipamAddressTable([{'ip': '10.0.0.1', 'lastSeen': NOW.isoformat()}]).age(NOW)[0] == 0
+    assert ipamAddressTable([{'ip': '10.0.0.1', 'lastSeen': (NOW - timedelta(days=1)).isoformat()}]).age(NOW)[0] == 86400
@@ -0,0 +1,79 @@
+#!/usr/bin/python3
+"""This file provides the tests of the annotation of the base, broadcast and router addresses of subnets against the fake service."""
+
+import logging
+from ipaddress import IPv4Address
+
+from phpypamobjects import ipamTags
+
+def _writes(fake) -> int:
+    return sum(count for (method, controller), count in fake.requests.items() if method in ('POST', 'PATCH', 'DELETE') and controller == 'addresses')
+
+def _pools(ipam):
+    return [sn for sn in ipam.getAllSubnets() if sn.getisPool()]
+
+def test_annotate_subnets(fake, ipam):
+    pools = _pools(ipam)
+    assert pools
+    fake.requests.clear()
+    assert ipam.annotate_subnets(ipam.getAllSubnets(), hasRouter=True, routerHostname='gw.example.org') == []
+    # The base, broadcast and router addresses are not registered in the fake service
+    assert fake.requests[('POST', 'addresses')] == 3 * len(pools)
+    for sn in pools:
+        annotated = {a.getIP(): a for a in ipam.findIPsbyNet(sn)}
+        net = sn.getSubnet()
+        assert annotated[net[0]].getDescription() == 'NETWORK ADDRESS'
+        assert annotated[net.broadcast_address].getDescription() == 'BROADCAST ADDRESS'
+        router = annotated[net[-2]]
+        assert (router.getHostname(), router.getFieldInt('is_gateway'), router.getFieldInt('state')) == ('gw.example.org', 1, ipamTags.TAG_router)
+
+def test_annotated_subnets_are_not_written_again(fake, ipam):
+    ipam.annotate_subnets(ipam.getAllSubnets(), hasRouter=True, routerHostname='gw.example.org')
+    fake.requests.clear()
+    # The service returns the annotations as strings and null, and the routers are protected
+    assert ipam.annotate_subnets(ipam.getAllSubnets(), hasRouter=True, routerHostname='gw.example.org') == []
+    assert _writes(fake) == 0
+    for sn in _pools(ipam):
+        ipam.annotate_subnet(sn, hasRouter=True, routerHostname='gw.example.org')
+    assert _writes(fake) == 0
+
+def test_existing_addresses_are_updated(fake, ipam):
+    sn = _pools(ipam)[0]
+    first = ipam.findIPsbyNet(sn)[0]
+    fake.requests.clear()
+    # The first address of the subnet is the router
+    assert ipam.annotate_subnets([sn], hasRouter=True, routerPos=1) == []
+    assert (fake.requests[('POST', 'addresses')], fake.requests[('PATCH', 'addresses')]) == (2, 1)
+    router = ipam.findIPs(first.getIP())[0]
+    assert (router.getId(), router.getDescription(), router.getFieldInt('is_gateway')) == (first.getId(), 'DEFAULT ROUTER', 1)
+
+def test_protected_addresses_are_reported(fake, ipam, caplog):
+    sn = _pools(ipam)[0]
+    first = ipam.findIPsbyNet(sn)[0]
+    first.setAPIBlock(1)
+    ipam.updateAddress(first)
+    fake.requests.clear()
+    with caplog.at_level(logging.ERROR):
+        errors = ipam.annotate_subnets([sn], hasRouter=True, routerPos=1)
+    assert [(op, str(addr.getIP()), type(error)) for op, addr, error in errors] == [('annotate', str(first.getIP()), PermissionError)]
+    assert 'apiblock=true' in caplog.text
+    assert fake.requests[('PATCH', 'addresses')] == 0
+    assert ipam.findIPs(first.getIP())[0].getDescription() == first.getDescription()
+    # The annotation is written when it is forced
+    assert ipam.annotate_subnets([sn], hasRouter=True, routerPos=1, force=True) == []
+    assert ipam.findIPs(first.getIP())[0].getDescription() == 'DEFAULT ROUTER'
+
+def test_annotate_address(fake, ipam, caplog):
+    sn = _pools(ipam)[0]
+    ip = IPv4Address(sn.getSubnet()[100])
+    ipam.annotate_address(ip, sn, 'RESERVED', tag=ipamTags.TAG_notusable, apinotremovable=1)
+    fake.requests.clear()
+    ipam.annotate_address(ip, sn, 'RESERVED', tag=ipamTags.TAG_notusable, apinotremovable=1)
+    assert _writes(fake) == 0
+    addr = ipam.findIPs(ip)[0]
+    addr.setAPIBlock(1)
+    ipam.updateAddress(addr)
+    with caplog.at_level(logging.ERROR):
+        ipam.annotate_address(ip, sn, 'OTHER')
+    assert f"Address {ip} can't be annotated" in caplog.text
+    assert ipam.findIPs(ip)[0].getDescription() == 'RESERVED'
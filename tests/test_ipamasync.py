@@ -0,0 +1,118 @@
+#!/usr/bin/python3
+"""This file provides the tests of the asyncio client ipamAsyncServer against the fake service."""
+
+import asyncio, time
+
+import pytest
+
+aiohttp = pytest.importorskip('aiohttp')
+
+from phpypamobjects import ipamAsyncServer
+
+def _run(fake, coroutine, **kwargs):
+    """Run a coroutine function with an ipamAsyncServer object connected to the fake service."""
+    async def run():
+        async with ipamAsyncServer(url=fake.url, app_id=fake.appId, user=fake.user, password=fake.password, cacert='NONE', **kwargs) as ipam:
+            return await coroutine(ipam)
+    return asyncio.run(run())
+
+def _dicts(addresses) -> list:
+    return [a.getDictionary() for a in addresses]
+
+def test_queries_are_the_ones_of_ipamServer(fake, ipam):
+    subnet = ipam.getAllSubnets()[1]
+    addr = ipam.findIPsbyNet(subnet)[2]
+
+    async def queries(aipam):
+        return (await aipam.getAllSubnets(), await aipam.findIPsbyNet(subnet), await aipam.findIPs(addr.getIP()),
+                await aipam.findIPsbyHostName(addr.getHostname()), await aipam.findSubnetsbyIPMask(subnet.getSubnet().network_address, 24),
+                await aipam.getAllVLANs(), await aipam.findVLANbyId(9999), await aipam.getAllScanAgents(),
+                await aipam.findFree(subnet, 3))
+
+    subnets, addresses, found, byName, byMask, vlans, missing, agents, free = _run(fake, queries)
+    assert [s.getDictionary() for s in subnets] == [s.getDictionary() for s in ipam.getAllSubnets()]
+    assert _dicts(addresses) == _dicts(ipam.findIPsbyNet(subnet))
+    assert _dicts(found) == _dicts(ipam.findIPs(addr.getIP()))
+    assert _dicts(byName) == _dicts(ipam.findIPsbyHostName(addr.getHostname()))
+    assert [s.getId() for s in byMask] == [subnet.getId()]
+    assert len(vlans) == 50 and missing == []
+    assert [a.getDictionary() for a in agents] == [a.getDictionary() for a in ipam.getAllScanAgents()]
+    assert [a.getIP() for a in free] == [a.getIP() for a in ipam.findFree(subnet, 3)]
+
+@pytest.mark.parametrize('field, pattern', [('hostname', r'host1[0-9]\.'), ('description', 'printer'), ('mac', ''), ('tag', '2')])
+def test_findIPsbyField(fake, ipam, field, pattern):
+    subnet = ipam.getAllSubnets()[0]
+    found = _run(fake, lambda aipam: aipam.findIPsbyField(subnet, field, pattern))
+    assert _dicts(found) == _dicts(ipam.findIPsbyField(subnet, field, pattern))
+
+def test_writes(fake, ipam):
+    subnet = ipam.getAllSubnets()[2]
+
+    async def writes(aipam):
+        new = (await aipam.findFree(subnet, 1))[0]
+        new.setHostname('async.example.org')
+        await aipam.registerIP(new)
+        assert not new.hasChanges()
+        registered = (await aipam.findIPs(new.getIP()))[0]
+        assert registered.getHostname() == 'async.example.org'
+        registered.setDescription('written by a task')
+        await aipam.updateAddress(registered)
+        # Nothing is sent again for addresses without changes
+        await aipam.updateAddress(registered)
+        protected = (await aipam.findIPs(registered.getIP()))[0]
+        protected.setAPIBlock(1)
+        await aipam.updateAddress(protected)
+        with pytest.raises(PermissionError):
+            await aipam.unregisterIP(protected)
+        await aipam.unregisterIP(protected, force=True)
+        return registered
+
+    registered = _run(fake, writes)
+    assert fake.requests[('POST', 'addresses')] == 1 and fake.requests[('PATCH', 'addresses')] == 2
+    assert fake.requests[('DELETE', 'addresses')] == 1
+    assert ipam.findIPs(registered.getIP()) == []
+
+def test_concurrency_is_bounded(fake):
+    async def gather(aipam):
+        subnets = await aipam.getAllSubnets()
+        fake.latency = 0.1
+        t0 = time.perf_counter()
+        lists = await aipam.gather(aipam.findIPsbyNet, subnets * 2)
+        return time.perf_counter() - t0, [len(addresses) for addresses in lists]
+
+    # 8 requests with 2 in flight
+    elapsed, sizes = _run(fake, gather, maxConcurrency=2)
+    assert sizes == [10] * 8
+    assert elapsed >= 0.4
+
+@pytest.mark.filterwarnings('error::DeprecationWarning')
+def test_token_file_is_not_locked_while_logging_in(fake, tmp_path):
+    path = str(tmp_path / 'token.json')
+
+    async def renew(aipam):
+        fake.latency = 0.3
+        task = asyncio.ensure_future(aipam.refreshToken())
+        await asyncio.sleep(0.05)
+        # Other threads and processes can use the store while this one is waiting for the service
+        t0 = time.perf_counter()
+        await asyncio.get_running_loop().run_in_executor(None, _lockStore, aipam._tokens)
+        waited = time.perf_counter() - t0
+        await task
+        fake.latency = 0.0
+        return waited, len(await aipam.getAllSubnets())
+
+    waited, count = _run(fake, renew, tokenCache=path)
+    assert waited < 0.2 and count == 4
+    assert fake.requests[('POST', 'user')] == 2
+
+def _lockStore(store) -> None:
+    with store.locked():
+        pass
+
+def test_not_connected(fake):
+    aipam = ipamAsyncServer(url=fake.url, app_id=fake.appId, user=fake.user, password=fake.password, cacert='NONE')
+    with pytest.raises(Exception, match='not connected'):
+        asyncio.run(aipam.getAllSubnets())
+    aipam = ipamAsyncServer(url=fake.url, app_id=fake.appId, user='unknown', password=fake.password, cacert='NONE')
+    with pytest.raises(Exception, match='Error connecting'):
+        asyncio.run(aipam.connect())
@@ -0,0 +1,86 @@
+#!/usr/bin/python3
+"""This file provides the tests of ipamWriteBatch against the fake service."""
+
+from ipaddress import IPv4Address
+
+import pytest
+from phpypam.core.exceptions import PHPyPAMException
+
+from phpypamobjects import ipamAddress
+
+def test_updates_of_an_address_are_merged(fake, ipam):
+    subnet = ipam.getAllSubnets()[0]
+    first = ipam.findIPsbyNet(subnet)[0]
+    second = ipam.findIPs(first.getIP())[0]
+    with ipam.writeBatch() as batch:
+        first.setHostname('merged.example.org')
+        batch.update(first)
+        second.setDescription('merged')
+        batch.update(second)
+        batch.update(first)
+        assert batch.pending() == 1
+    assert fake.requests[('PATCH', 'addresses')] == 1
+    stored = ipam.findIPs(first.getIP())[0]
+    assert (stored.getHostname(), stored.getDescription()) == ('merged.example.org', 'merged')
+    assert not first.hasChanges() and not second.hasChanges()
+    assert batch.getErrors() == []
+
+def test_updates_without_changes_or_id(fake, ipam):
+    addr = ipam.findIPsbyNet(ipam.getAllSubnets()[0])[0]
+    with ipam.writeBatch() as batch:
+        batch.update(addr)
+        assert batch.pending() == 0
+        new = ipamAddress(ip=IPv4Address('10.0.0.100'))
+        new.setHostname('new.example.org')
+        with pytest.raises(ValueError):
+            batch.update(new)
+    assert fake.requests[('PATCH', 'addresses')] == 0
+
+def test_writes_are_sent_in_phases(fake, ipam):
+    subnet = ipam.getAllSubnets()[1]
+    addresses = ipam.findIPsbyNet(subnet)
+    free = ipam.findFree(subnet, 2)
+    with ipam.writeBatch(maxWorkers=4) as batch:
+        batch.unregister(addresses[0])
+        for a in free:
+            batch.register(a)
+        addresses[1].setHostname('updated.example.org')
+        batch.update(addresses[1])
+    assert [op for op, addr, error in batch.getResults()] == ['unregister', 'register', 'register', 'update']
+    found = {a.getIP(): a for a in ipam.findIPsbyNet(subnet)}
+    assert addresses[0].getIP() not in found
+    assert all(a.getIP() in found for a in free)
+    assert found[addresses[1].getIP()].getHostname() == 'updated.example.org'
+
+def test_errors_are_collected(fake, ipam):
+    subnet = ipam.getAllSubnets()[0]
+    addresses = ipam.findIPsbyNet(subnet)
+    addresses[0].setAPIBlock(1)
+    with ipam.writeBatch() as batch:
+        # The address is already registered in the subnet
+        batch.register(ipamAddress(ip=addresses[1].getIP(), subnet=subnet))
+        batch.unregister(addresses[0])
+    assert [(op, type(error)) for op, addr, error in batch.getErrors()] == [('unregister', PermissionError), ('register', PHPyPAMException)]
+    assert len(ipam.findIPsbyNet(subnet)) == 10
+
+def test_pending_writes_are_flushed_at_the_limit(fake, ipam):
+    addresses = ipam.findIPsbyNet(ipam.getAllSubnets()[2])
+    with ipam.writeBatch(maxPending=3) as batch:
+        for a in addresses[:4]:
+            a.setDescription('backpressure')
+            batch.update(a)
+        assert fake.requests[('PATCH', 'addresses')] == 3
+        assert batch.pending() == 1
+    assert fake.requests[('PATCH', 'addresses')] == 4
+
+def test_nothing_is_sent_when_the_block_fails(fake, ipam):
+    addr = ipam.findIPsbyNet(ipam.getAllSubnets()[0])[0]
+    with pytest.raises(RuntimeError):
+        with ipam.writeBatch() as batch:
+            addr.setHostname('interrupted.example.org')
+            batch.update(addr)
+            raise RuntimeError('interrupted')
+    assert fake.requests[('PATCH', 'addresses')] == 0
+    assert batch.pending() == 1
+    batch.flush()
+    assert ipam.findIPs(addr.getIP())[0].getHostname() == 'interrupted.example.org'
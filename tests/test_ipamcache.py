@@ -0,0 +1,94 @@
+#!/usr/bin/python3
+"""This file provides the tests of ipamCache and of the cached lookups of ipamServer against the fake service."""
+
+import importlib
+
+import pytest
+
+from phpypamobjects import ipamCache
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A manual clock replacing the monotonic time of the cache."""
+    now = [1000.0]
+    monkeypatch.setattr(importlib.import_module('phpypamobjects.ipamCache').time, 'monotonic', lambda: now[0])
+    return now
+
+def test_get_and_put():
+    cache = ipamCache()
+    assert cache.get('a') == (False, None)
+    cache.put('a', 1)
+    cache.put('b', None)
+    assert cache.get('a') == (True, 1)
+    # None is a valid cached value
+    assert cache.get('b') == (True, None)
+    assert cache.getStats() == {'hits': 2, 'misses': 1, 'evictions': 0, 'expirations': 0, 'size': 2}
+
+def test_entries_expire(clock):
+    cache = ipamCache(ttl=10)
+    cache.put('a', 1)
+    clock[0] += 10
+    assert cache.get('a') == (True, 1)
+    clock[0] += 0.5
+    assert cache.get('a') == (False, None)
+    assert cache.getStats()['expirations'] == 1
+    assert cache.getStats()['size'] == 0
+
+def test_least_recently_used_is_evicted():
+    cache = ipamCache(maxSize=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    cache.get('a')
+    cache.put('c', 3)
+    assert cache.get('b') == (False, None)
+    assert cache.get('a') == (True, 1)
+    assert cache.get('c') == (True, 3)
+    assert cache.getStats()['evictions'] == 1
+
+def test_invalidate():
+    cache = ipamCache()
+    cache.put('a', 1)
+    cache.put('b', 2)
+    cache.invalidate('a')
+    assert cache.get('a') == (False, None)
+    assert cache.get('b') == (True, 2)
+    cache.invalidate()
+    assert cache.getStats()['size'] == 0
+
+def test_lookups_are_read_through(fake, ipam):
+    fake.requests.clear()
+    ipam.findVLANbyId(1)
+    ipam.findVLANbyId(1)
+    assert fake.requests[('GET', 'vlan')] == 2
+    ipam.setCache('vlan', ttl=60)
+    first = ipam.findVLANbyId(1)
+    second = ipam.findVLANbyId(1)
+    assert fake.requests[('GET', 'vlan')] == 3
+    assert first[0].getName() == second[0].getName() == 'VLAN101'
+    # Every caller gets its own copy of the cached result
+    first[0].getDictionary()['name'] = 'changed'
+    assert ipam.findVLANbyId(1)[0].getName() == 'VLAN101'
+    assert ipam.getCacheStats()['vlan']['hits'] == 2
+
+def test_not_found_is_cached(fake, ipam):
+    ipam.setCache('vlan')
+    fake.requests.clear()
+    assert ipam.findVLANbyId(9999) == []
+    assert ipam.findVLANbyId(9999) == []
+    assert fake.requests[('GET', 'vlan')] == 1
+
+def test_updates_invalidate_the_cache(fake, ipam):
+    ipam.setCache('subnets')
+    subnet = ipam.getAllSubnets()[0]
+    base, mask = subnet.getBaseaddr(), subnet.getMask()
+    fake.requests.clear()
+    assert ipam.findSubnetsbyIPMask(base, mask)[0].getId() == subnet.getId()
+    ipam.findSubnetsbyIPMask(base, mask)
+    assert fake.requests[('GET', 'subnets')] == 1
+    ipam.updateSubnetLastScan(subnet)
+    found = ipam.findSubnetsbyIPMask(base, mask)
+    assert fake.requests[('GET', 'subnets')] == 2
+    assert found[0].getField('lastScan') == subnet.getField('lastScan')
+    ipam.invalidateCache()
+    ipam.findSubnetsbyIPMask(base, mask)
+    assert fake.requests[('GET', 'subnets')] == 3
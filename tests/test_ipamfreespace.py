@@ -0,0 +1,133 @@
+#!/usr/bin/python3
+"""This file provides the tests of the free space models and of findFree and allocateBulk against the fake service."""
+
+import random
+from ipaddress import IPv4Address, IPv4Network, IPv6Network
+
+import pytest
+
+from phpypamobjects import ipamFreeSpace, ipamFreeSpaceArray, ipamFreePoolIndex, ipamSubnet
+
+NET = IPv4Network('10.0.0.0/24')
+
+def _used(*values:int) -> list:
+    return [int(NET.network_address) + v for v in values]
+
+def test_intervals_between_used_addresses():
+    space = ipamFreeSpace(NET, _used(1, 2, 5, 254))
+    base = int(NET.network_address)
+    assert space.intervals() == [(base + 3, base + 4), (base + 6, base + 253)]
+    assert space.pools() == [(IPv4Address('10.0.0.3'), 2), (IPv4Address('10.0.0.6'), 248)]
+    assert space.countFree() == 250
+    assert space.isFree(IPv4Address('10.0.0.3'))
+    assert not space.isFree(IPv4Address('10.0.0.5'))
+    # Base and broadcast addresses are never free
+    assert not space.isFree(IPv4Address('10.0.0.0'))
+    assert not space.isFree(IPv4Address('10.0.0.255'))
+
+def test_addresses_out_of_range_are_ignored():
+    space = ipamFreeSpace(NET, [IPv4Address('10.0.1.1'), IPv4Address('10.0.0.1'), IPv4Address('10.0.0.1')])
+    assert space.countFree() == 253
+
+def test_fit_algorithms():
+    # Pools of 2 (.3-.4), 1 (.6) and 3 (.8-.10) addresses
+    space = ipamFreeSpace(NET, _used(1, 2, 5, 7) + _used(*range(11, 255)))
+    assert space.find(2, 'FirstFit') == IPv4Address('10.0.0.3')
+    assert space.find(2, 'BestFit') == IPv4Address('10.0.0.3')
+    assert space.find(3, 'BestFit') == IPv4Address('10.0.0.8')
+    assert space.find(1, 'WorstFit') == IPv4Address('10.0.0.8')
+    assert space.find(4, 'FirstFit') is None
+    assert space.find(0) is None
+    assert space.find(2, align=4) == IPv4Address('10.0.0.8')
+    with pytest.raises(ValueError):
+        space.find(1, align=0)
+
+def test_mark_used_and_free_merge_intervals():
+    space = ipamFreeSpace(NET)
+    space.markUsed(IPv4Address('10.0.0.10'), 5)
+    assert space.pools() == [(IPv4Address('10.0.0.1'), 9), (IPv4Address('10.0.0.15'), 240)]
+    # Blocks partially used or out of the range are clipped
+    space.markUsed(IPv4Address('10.0.0.250'), 10)
+    assert space.pools()[-1] == (IPv4Address('10.0.0.15'), 235)
+    for value in range(10, 15):
+        space.markFree(IPv4Address(f'10.0.0.{value}'))
+    assert space.pools() == [(IPv4Address('10.0.0.1'), 249)]
+    # Releasing a free address does nothing
+    space.markFree(IPv4Address('10.0.0.1'))
+    assert space.countFree() == 249
+
+def test_ipv6_subnet():
+    net = IPv6Network('2001:db8::/64')
+    space = ipamFreeSpace(net, [net.network_address + 1, net.network_address + 2])
+    assert space.find(1) == net.network_address + 3
+    assert space.countFree() == 2 ** 64 - 3
+    with pytest.raises(ValueError):
+        ipamFreeSpaceArray(net)
+
+@pytest.mark.parametrize('seed', range(5))
+def test_vectorized_model_matches_intervals(seed):
+    rng = random.Random(seed)
+    net = IPv4Network('10.1.0.0/20')
+    used = rng.sample(range(int(net.network_address), int(net.broadcast_address) + 1), 2000)
+    plain, array = ipamFreeSpace(net, used), ipamFreeSpaceArray(net, used)
+    assert array.intervals() == plain.intervals()
+    assert array.countFree() == plain.countFree()
+    for fitAlg in ('FirstFit', 'BestFit', 'WorstFit'):
+        for num in (1, 2, 3, 5):
+            for align in (1, 4):
+                assert array.findInt(num, fitAlg, align) == plain.findInt(num, fitAlg, align)
+    block = plain.findInt(3, 'WorstFit')
+    plain.markUsed(block, 3)
+    array.markUsed(block, 3)
+    plain.markFree(used[0])
+    array.markFree(used[0])
+    assert array.intervals() == plain.intervals()
+
+def test_model_selection():
+    assert type(ipamFreeSpace.fromUsed(NET, [])) is ipamFreeSpace
+    assert type(ipamFreeSpace.fromUsed(NET, [], vectorized=True)) is ipamFreeSpaceArray
+    assert type(ipamFreeSpace.fromUsed(IPv4Network('10.0.0.0/16'), list(range(ipamFreeSpaceArray.THRESHOLD)))) is ipamFreeSpaceArray
+
+def test_pool_index_expires_models():
+    subnet = ipamSubnet({'id': 1, 'subnet': '10.0.0.0', 'mask': '24', 'editDate': '2024-01-01 00:00:00'})
+    index = ipamFreePoolIndex(ttl=60)
+    space = ipamFreeSpace(NET)
+    index.put(subnet, space)
+    assert index.get(subnet) is space
+    index.markUsed(1, IPv4Address('10.0.0.1'), 2)
+    assert space.find(1) == IPv4Address('10.0.0.3')
+    # A new editDate of the subnet discards the model
+    subnet.getDictionary()['editDate'] = '2024-01-02 00:00:00'
+    assert index.get(subnet) is None
+    index.put(subnet, space)
+    index.invalidate(1)
+    assert index.get(subnet) is None
+    # A TTL of zero disables the index
+    disabled = ipamFreePoolIndex(ttl=0)
+    disabled.put(subnet, space)
+    assert disabled.get(subnet) is None
+
+def test_findFree_uses_the_index(fake, ipam):
+    subnet = ipam.getAllSubnets()[0]
+    fake.requests.clear()
+    block = ipam.findFree(subnet, 4)
+    assert [a.getIP() for a in block] == [IPv4Address(f'10.0.0.{v}') for v in range(11, 15)]
+    assert fake.requests[('GET', 'subnets')] == 1
+    ipam.findFree(subnet, 4, 'WorstFit')
+    assert fake.requests[('GET', 'subnets')] == 1
+    ipam.findFree(subnet, 4, refresh=True)
+    assert fake.requests[('GET', 'subnets')] == 2
+    # Registered addresses are removed from the indexed model
+    ipam.registerIP(block[0])
+    assert ipam.findFree(subnet, 1)[0].getIP() == IPv4Address('10.0.0.12')
+    assert fake.requests[('GET', 'subnets')] == 2
+    assert ipam.findFree(subnet, 300) == []
+
+def test_allocateBulk_plans_disjoint_blocks(fake, ipam):
+    subnets = ipam.getAllSubnets()
+    plans = ipam.allocateBulk([(subnets[0], 2), (subnets[0], 3, 'FirstFit', {'hostname': 'bulk'}), (subnets[1], 300)])
+    assert [a.getIP() for a in plans[0]] == [IPv4Address('10.0.0.11'), IPv4Address('10.0.0.12')]
+    assert [a.getIP() for a in plans[1]] == [IPv4Address(f'10.0.0.{v}') for v in range(13, 16)]
+    assert plans[2] == []
+    assert {a.getHostname() for a in plans[1]} == {'bulk'}
+    assert {a.getIP() for a in ipam.findIPsbyNet(subnets[0])} >= {IPv4Address(f'10.0.0.{v}') for v in range(11, 16)}
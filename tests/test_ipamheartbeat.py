@@ -0,0 +1,88 @@
+#!/usr/bin/python3
+"""This file provides the tests of the aggregation of last seen dates by ipamHeartbeat against the fake service."""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+def _setSeen(addr, age:timedelta) -> None:
+    addr.getDictionary()['lastSeen'] = (datetime.now() - age).strftime('%Y-%m-%d %H:%M:%S')
+
+def test_recent_dates_are_not_written(fake, ipam):
+    sn = ipam.getAllSubnets()[0]
+    addresses = ipam.findIPsbyNet(sn)[:4]
+    _setSeen(addresses[0], timedelta(minutes=5))
+    _setSeen(addresses[1], timedelta(hours=2))
+    addresses[2].getDictionary()['lastSeen'] = None
+    addresses[3].getDictionary()['excludePing'] = 1
+    fake.requests.clear()
+    with ipam.heartbeat(minInterval=3600) as hb:
+        assert [hb.seen(a, sn) for a in addresses] == [False, True, True, False]
+        assert fake.requests[('PATCH', 'addresses')] == 0
+    assert hb.getStats() == {'seen': 2, 'skipped': 2}
+    assert fake.requests[('PATCH', 'addresses')] == 2
+    assert hb.getErrors() == []
+    written = {a.getId(): a for a in ipam.findIPsbyNet(sn)}
+    assert written[addresses[1].getId()].getLastSeen() > datetime.now().astimezone() - timedelta(minutes=1)
+    # A second sweep finds the dates just written
+    fake.requests.clear()
+    with ipam.heartbeat(minInterval=3600) as hb:
+        assert not any(hb.seen(written[a.getId()], sn) for a in addresses[1:3])
+    assert fake.requests[('PATCH', 'addresses')] == 0
+
+def test_zero_interval_always_writes(fake, ipam):
+    sn = ipam.getAllSubnets()[0]
+    addr = ipam.findIPsbyNet(sn)[0]
+    _setSeen(addr, timedelta(seconds=1))
+    with ipam.heartbeat(minInterval=0) as hb:
+        assert hb.seen(addr)
+    assert hb.getStats() == {'seen': 1, 'skipped': 0}
+
+def test_subnet_and_agent_dates_are_written_once(fake, ipam):
+    subnets = ipam.getAllSubnets()[:3]
+    agent = ipam.getAllScanAgents()[0]
+    fake.requests.clear()
+    with ipam.heartbeat(agent=agent) as hb:
+        for sn in subnets[:2]:
+            for addr in ipam.findIPsbyNet(sn)[:3]:
+                hb.seen(addr, sn)
+        hb.scanned(subnets[0])
+        hb.scanned(subnets[2])
+        assert hb.pending() == 3 + 6
+    assert hb.pending() == 0
+    assert fake.requests[('PATCH', 'subnets')] == 3
+    assert fake.requests[('PATCH', 'tools/scanagents')] == 1
+    scanned = {sn.getId(): sn.getField('lastScan') for sn in ipam.getAllSubnets()}
+    assert all(scanned[sn.getId()] == sn.getField('lastScan') for sn in subnets)
+    assert scanned[ipam.getAllSubnets()[3].getId()] != subnets[0].getField('lastScan')
+    assert ipam.getAllScanAgents()[0].getLastAccess() is not None
+    # Nothing is pending after a flush
+    fake.requests.clear()
+    assert hb.flush() == []
+    assert fake.requests[('PATCH', 'subnets')] == 0
+
+def test_protected_addresses_are_reported(fake, ipam):
+    sn = ipam.getAllSubnets()[0]
+    addresses = ipam.findIPsbyNet(sn)[:2]
+    addresses[0].getDictionary()['custom_apiblock'] = 1
+    # Routers are not protected against scans
+    addresses[1].getDictionary()['is_gateway'] = '1'
+    with ipam.heartbeat(minInterval=0) as hb:
+        assert not hb.seen(addresses[0], sn)
+        assert hb.seen(addresses[1], sn)
+    assert [(op, a.getId(), type(e)) for op, a, e in hb.getErrors()] == [('seen', addresses[0].getId(), PermissionError)]
+    assert hb.getStats() == {'seen': 1, 'skipped': 1}
+
+def test_nothing_is_sent_after_an_exception(fake, ipam):
+    sn = ipam.getAllSubnets()[0]
+    addr = ipam.findIPsbyNet(sn)[0]
+    fake.requests.clear()
+    with pytest.raises(RuntimeError):
+        with ipam.heartbeat(minInterval=0, agent=ipam.getAllScanAgents()[0]) as hb:
+            hb.seen(addr, sn)
+            raise RuntimeError('scan interrupted')
+    assert sum(count for (method, controller), count in fake.requests.items() if method == 'PATCH') == 0
+    assert hb.pending() == 2
+    # The pending writes are kept until they are flushed
+    assert hb.flush() == []
+    assert (fake.requests[('PATCH', 'addresses')], fake.requests[('PATCH', 'subnets')], fake.requests[('PATCH', 'tools/scanagents')]) == (1, 1, 1)
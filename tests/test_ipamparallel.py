@@ -0,0 +1,88 @@
+#!/usr/bin/python3
+"""This file provides the tests of the parallel operations of ipamServer against the fake service."""
+
+import threading
+
+import pytest
+from phpypam.core.exceptions import PHPyPAMInvalidSyntax
+
+from ipamfakeserver import ipamFakeServer
+from phpypamobjects import ipamServer, ipamSubnet
+
+@pytest.fixture
+def slow():
+    """A server object connected to a fake service with random latency, so requests complete out of order."""
+    with ipamFakeServer(subnets=12, addresses=36, latency=0.001, jitter=0.02, seed=5) as fake:
+        with ipamServer(url=fake.url, app_id=fake.appId, user=fake.user, password=fake.password, cacert='NONE') as ipam:
+            yield ipam
+
+def _invalid() -> ipamSubnet:
+    return ipamSubnet({'id': 'x', 'subnet': '10.9.9.0', 'mask': '24', 'description': 'Invalid', 'vlanId': 0})
+
+def _session(server:ipamServer, sn:ipamSubnet) -> tuple:
+    return threading.current_thread(), server.pi._session
+
+def test_ordered_and_unordered_results(slow):
+    subnets = slow.getAllSubnets()
+    expected = {sn.getId(): [a.getDictionary() for a in slow.findIPsbyNet(sn)] for sn in subnets}
+    ordered = list(slow.parallelMap('findIPsbyNet', subnets, maxWorkers=4))
+    assert [sn.getId() for sn, _, _ in ordered] == [sn.getId() for sn in subnets]
+    assert {sn.getId(): [a.getDictionary() for a in result] for sn, result, _ in ordered} == expected
+    unordered = list(slow.parallelMap('findIPsbyNet', subnets, maxWorkers=4, ordered=False))
+    assert sorted(sn.getId() for sn, _, _ in unordered) == sorted(sn.getId() for sn in subnets)
+    assert {sn.getId(): [a.getDictionary() for a in result] for sn, result, _ in unordered} == expected
+
+def test_errors_are_returned_per_subnet(slow):
+    subnets = slow.getAllSubnets()
+
+    def _check(server:ipamServer, sn:ipamSubnet, suffix:str, upper:bool = False) -> str:
+        if sn.getId() == subnets[3].getId():
+            raise ValueError('rejected')
+        name = str(sn) + suffix
+        return name.upper() if upper else name
+
+    results = list(slow.parallelMap(_check, subnets, '-checked', maxWorkers=3, upper=True))
+    assert [(sn.getId(), result, type(e).__name__ if e else None) for sn, result, e in results] == [
+        (sn.getId(), None, 'ValueError') if i == 3 else (sn.getId(), (str(sn) + '-checked').upper(), None) for i, sn in enumerate(subnets)]
+    results = list(slow.parallelMap('findIPsbyNet', subnets[:2] + [_invalid()] + subnets[2:], maxWorkers=3))
+    assert [(sn.getId(), type(e).__name__) for sn, _, e in results if e] == [('x', 'PHPyPAMInvalidSyntax')]
+    assert isinstance(results[2][2], PHPyPAMInvalidSyntax) and results[2][1] is None
+    assert all(len(result) == 3 for sn, result, e in results if e is None)
+
+def test_threads_and_sessions_are_reused(slow):
+    subnets = slow.getAllSubnets()
+    used = set()
+    for _ in range(4):
+        used |= {(t, s) for _, (t, s), _ in slow.parallelMap(_session, subnets, maxWorkers=4)}
+        assert len(list(slow.iterAllAddresses(maxWorkers=4))) == 36
+    # Every thread of the pool has one copy with its own session for all the operations
+    assert len({t for t, _ in used}) == len({s for _, s in used}) == len(used) <= 4
+    assert {(t, w.pi._session) for t, w in slow._workers} == used
+    assert all(s is not slow.pi._session for _, s in used)
+    # Stopping the iteration early keeps the pool usable
+    for _ in slow.parallelMap('findIPsbyNet', subnets, maxWorkers=4):
+        break
+    assert len(list(slow.parallelMap('findIPsbyNet', subnets, maxWorkers=4))) == len(subnets)
+
+def test_nested_operations_use_temporary_pools(slow):
+    subnets = slow.getAllSubnets()
+
+    def _nested(server:ipamServer, sn:ipamSubnet) -> list:
+        # A pool task waiting for a pool of the same size must not wait for its own pool
+        return [len(addresses) for _, addresses, _ in server.parallelMap('findIPsbyNet', subnets[:4], maxWorkers=2)]
+
+    results = list(slow.parallelMap(_nested, subnets[:4], maxWorkers=2))
+    assert [(result, e) for _, result, e in results] == [([3, 3, 3, 3], None)] * 4
+    # The copies used by the temporary pools are released with them
+    assert len(slow._workers) <= 2 and all(t.is_alive() for t, _ in slow._workers)
+
+def test_close(fake):
+    ipam = ipamServer(url=fake.url, app_id=fake.appId, user=fake.user, password=fake.password, cacert='NONE')
+    subnets = ipam.getAllSubnets()
+    threads = {t for _, (t, _), _ in ipam.parallelMap(_session, subnets, maxWorkers=4)}
+    ipam.close()
+    assert ipam._executors == {} and ipam._workers == []
+    assert not any(t.is_alive() for t in threads)
+    # A closed object opens new pools and sessions when it is used again
+    assert all(e is None for _, _, e in ipam.parallelMap('findIPsbyNet', subnets, maxWorkers=4))
+    ipam.close()
@@ -0,0 +1,90 @@
+#!/usr/bin/python3
+"""This file provides the tests of the planning of searches (ipamQuery) and of the searches of ipamServer against the fake service."""
+
+import logging, re
+
+import pytest
+
+from phpypamobjects.ipamQuery import ipamQuery
+
+@pytest.mark.parametrize('pattern, prefix, exact', [
+    ('host1', 'host1', False),
+    ('host1$', 'host1', True),
+    (r'^abc\Z', 'abc', True),
+    (r'host1\d*\.', 'host1', False),
+    (r'10\.0\.0\.1$', '10.0.0.1', True),
+    ('ab*', 'a', False),
+    ('ab?c', 'a', False),
+    ('a+b', 'a', False),
+    ('a{2}', '', False),
+    ('.*lab', '', False),
+    ('a|b', '', False),
+    ('', '', False),
+])
+def test_literal_prefix(pattern, prefix, exact):
+    query = ipamQuery('hostname', pattern)
+    assert (query.prefix, query.exact) == (prefix, exact)
+
+def test_searches_from_the_most_selective():
+    assert [s[0] for s in ipamQuery('hostname', r'a\.example\.org$').getSearches()] == ['search_hostname', 'filter_by:hostname', None]
+    assert [s[0] for s in ipamQuery('hostname', 'host').getSearches()] == ['search_hostbase', 'filter_by:hostname', None]
+    assert [s[0] for s in ipamQuery('ip', r'10\.0\.0\.1$').getSearches()] == ['search', 'filter_by:ip', None]
+    assert [s[0] for s in ipamQuery('description', 'srv').getSearches()] == ['filter_by:description', None]
+    assert ipamQuery('description', '.*srv').getSearches() == [(None, 'addresses', None, None)]
+    assert ipamQuery('description', 'srv').getSearches(7) == [
+        ('filter_by:description', 'subnets', '7/addresses', {'filter_by': 'description', 'filter_value': 'srv', 'filter_match': 'partial'}),
+        (None, 'subnets', '7/addresses', None)]
+    # Values sent in the path are quoted
+    assert ipamQuery('hostname', 'a b/c$').getSearches()[0][2] == 'search_hostname/a%20b%2Fc'
+
+def test_null_values_match_as_empty_strings():
+    assert ipamQuery('hostname', '').matches({'hostname': None})
+    assert ipamQuery('hostname', '$').matches({})
+    assert not ipamQuery('hostname', 'a').matches({'hostname': None})
+    assert ipamQuery('tag', '2').matches({'tag': 2})
+
+def _expected(ipam, field, pattern, subnet=None):
+    """Match the pattern on all the addresses, as a search without filters does."""
+    addresses = ipam.findIPsbyNet(subnet) if subnet is not None else ipam.getAllAddresses()
+    return [a.getDictionary() for a in addresses if re.match(pattern, '' if a.getField(field) is None else str(a.getField(field)))]
+
+@pytest.mark.parametrize('field, pattern', [
+    ('hostname', r'host1\d\.'),
+    ('hostname', r'host260\.dmz\.example\.org$'),
+    ('hostname', r'host12\.lab\.example\.org$'),
+    ('ip', r'10\.0\.2\.5$'),
+    ('description', 'print'),
+    ('description', '.*(server|camera)'),
+    ('hostname', ''),
+])
+def test_searchIPs_matches_all_the_addresses(fake, ipam, caplog, field, pattern):
+    expected = _expected(ipam, field, pattern)
+    fake.requests.clear()
+    with caplog.at_level(logging.WARNING):
+        found = ipam.searchIPs(field, pattern)
+    assert [a.getDictionary() for a in found] == expected
+    assert fake.requests[('GET', 'addresses')] == 1
+    # Only searches without a literal prefix download all the addresses
+    assert ('downloads all the addresses' in caplog.text) == (ipamQuery(field, pattern).prefix == '')
+    assert ipam.searchIPs(field, pattern, asTable=True).getDictionaries() == expected
+
+@pytest.mark.parametrize('field, pattern', [
+    ('hostname', r'host1\d\.'),
+    ('description', 'server'),
+    ('description', '.*(server|camera)'),
+    ('mac', ''),
+])
+def test_findIPsbyField_matches_the_subnet(fake, ipam, field, pattern):
+    subnet = ipam.getAllSubnets()[0]
+    expected = _expected(ipam, field, pattern, subnet)
+    assert [a.getDictionary() for a in ipam.findIPsbyField(subnet, field, pattern)] == expected
+    assert ipam.findIPsbyField(subnet, field, pattern, asTable=True).getDictionaries() == expected
+
+def test_rejected_filters_are_not_sent_again(fake, ipam, caplog):
+    fake.requests.clear()
+    with caplog.at_level(logging.WARNING):
+        assert ipam.searchIPs('custom_missing', 'value') == []
+    assert 'rejected by the service' in caplog.text
+    assert fake.requests[('GET', 'addresses')] == 2
+    assert ipam.searchIPs('custom_missing', 'other') == []
+    assert fake.requests[('GET', 'addresses')] == 3
@@ -0,0 +1,107 @@
+#!/usr/bin/python3
+"""This file provides the golden output tests of the subnet listings and reports against the fake service."""
+
+import io, json
+
+import pytest
+
+from ipamfakeserver import ipamFakeServer
+from phpypamobjects import ipamServer, ipamSubnet, ipamReport
+
+def _banner(vlan:str, net:str, description:str, router:str) -> list:
+    return ['#' * 98,
+            f'# vlan: {vlan} red: {net:18} {description:61}#',
+            f'# router: {router:18} mask 24                                                             #',
+            '#' * 98, '']
+
+# Lines of addresses end with the separators of empty descriptions and notes
+PLAIN = '\n'.join(
+    _banner('145', '10.0.0.0/24', 'Subnet 1', '10.0.0.254') + [
+    '10.0.0.1        host1              ',
+    '10.0.0.2        host2             # printer ',
+    '10.0.0.3        host3              ', '', ''] +
+    _banner('  0', '10.0.1.0/24', 'Subnet 2', '10.0.1.254') + [
+    '10.0.1.1        host257            ',
+    '10.0.1.2        host258           # printer ',
+    '10.0.1.3        host259           # server ', '', ''] +
+    _banner('120', '10.0.2.0/24', 'Subnet 3', '10.0.2.254') + [
+    '10.0.2.1        host513           # access point ',
+    '10.0.2.2        host514            ',
+    '10.0.2.3        host515           # camera ', '', '', ''])
+
+CSV = """\
+subnet,vlan,ip,hostname,description,note
+10.0.0.0/24,145,10.0.0.1,host1.example.net,,
+10.0.0.0/24,145,10.0.0.2,host2.lab.example.org,printer,
+10.0.0.0/24,145,10.0.0.3,host3.dmz.example.org,,
+10.0.1.0/24,0,10.0.1.1,host257.example.org,,
+10.0.1.0/24,0,10.0.1.2,host258.dmz.example.org,printer,
+10.0.1.0/24,0,10.0.1.3,host259.example.net,server,
+10.0.2.0/24,120,10.0.2.1,host513.example.org,access point,
+10.0.2.0/24,120,10.0.2.2,host514.dmz.example.org,,
+10.0.2.0/24,120,10.0.2.3,host515.example.org,camera,
+"""
+
+@pytest.fixture
+def small():
+    """A server object connected to a fake service with 3 subnets of 3 addresses each."""
+    with ipamFakeServer(subnets=3, addresses=9) as fake:
+        yield ipamServer(url=fake.url, app_id=fake.appId, user=fake.user, password=fake.password, cacert='NONE')
+
+def _report(ipam, subnets, format:str, **kwargs):
+    out = io.StringIO()
+    errors = ipam.report(out, subnets, format=format, **kwargs)
+    return out.getvalue(), errors
+
+def test_plain_listing(small):
+    subnets = small.getAllSubnets()
+    assert ''.join(small.listSubnetPlain(sn) for sn in subnets) == PLAIN
+    assert _report(small, subnets, 'plain') == (PLAIN, [])
+
+def test_csv_and_jsonl(small):
+    subnets = small.getAllSubnets()
+    assert _report(small, subnets, 'csv') == (CSV, [])
+    text, errors = _report(small, subnets, 'jsonl')
+    assert errors == []
+    header, *lines = CSV.splitlines()
+    expected = [dict(zip(header.split(','), line.split(','))) for line in lines]
+    for row in expected:
+        row['vlan'] = int(row['vlan'])
+    assert [json.loads(line) for line in text.splitlines()] == expected
+    assert text.endswith('}\n')
+
+def test_empty_hostnames_and_notes(small):
+    sn = small.getAllSubnets()[0]
+    addresses = small.findIPsbyNet(sn)
+    addresses[0].setHostname('')
+    addresses[0].setNote('rack 3')
+    addresses[1].setDescription('Autodiscovered on 2024-01-01')
+    addresses[2].setNote('AUTODISCOVER')
+    for a in addresses:
+        small.updateAddress(a)
+    listing = small.listSubnetPlain(sn).splitlines()
+    assert listing[5:8] == ['10.0.0.1        ----------         # rack 3',
+                            '10.0.0.2        host2              ',
+                            '10.0.0.3        host3              ']
+    text, errors = _report(small, [sn], 'csv')
+    assert text.splitlines()[1:] == ['10.0.0.0/24,145,10.0.0.1,,,rack 3',
+                                     '10.0.0.0/24,145,10.0.0.2,host2.lab.example.org,,',
+                                     '10.0.0.0/24,145,10.0.0.3,host3.dmz.example.org,,']
+
+def test_order_and_errors_of_parallel_reports():
+    # With random latency the subnets are fetched out of order, but they are written in order
+    with ipamFakeServer(subnets=12, addresses=36, latency=0.001, jitter=0.02, seed=3) as fake:
+        ipam = ipamServer(url=fake.url, app_id=fake.appId, user=fake.user, password=fake.password, cacert='NONE')
+        subnets = ipam.getAllSubnets()
+        invalid = ipamSubnet({'id': 'x', 'subnet': '10.9.9.0', 'mask': '24', 'description': 'Invalid', 'vlanId': 0})
+        expected = ''.join(ipam.listSubnetPlain(sn) for sn in subnets)
+        for format in ipamReport.FORMATS:
+            sequential = _report(ipam, subnets, format, maxWorkers=1)[0]
+            text, errors = _report(ipam, subnets[:5] + [invalid] + subnets[5:], format, maxWorkers=6)
+            assert text == sequential
+            assert [(sn.getId(), type(e).__name__) for sn, e in errors] == [('x', 'PHPyPAMInvalidSyntax')]
+        assert _report(ipam, subnets, 'plain', maxWorkers=6)[0] == expected
+
+def test_unknown_format(small):
+    with pytest.raises(ValueError):
+        ipamReport(small, format='xml')
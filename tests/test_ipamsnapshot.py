@@ -0,0 +1,72 @@
+#!/usr/bin/python3
+"""This file provides the tests of the snapshot files: round trips of the rows and queries compared with ipamServer."""
+
+import pickle
+from ipaddress import IPv4Address
+
+import pytest
+
+from phpypamobjects import ipamSnapshot
+
+@pytest.fixture(params=[False, True], ids=['read', 'mmap'])
+def snapshot(request, fake, ipam, tmp_path):
+    """A snapshot of the fake service, opened reading the file or mapping it in memory."""
+    path = str(tmp_path / 'ipam.snap')
+    ipam.exportSnapshot(path)
+    snap = ipamSnapshot(path, mmap=request.param)
+    yield snap
+    snap.close()
+
+def test_rows_of_the_service_round_trip(fake, ipam, snapshot):
+    assert snapshot.getCounts() == {'sections': 3, 'subnets': 4, 'addresses': 40, 'vlans': 50, 'scanagents': 3, 'nameservers': 4}
+    assert snapshot.getSource() == ipam.url
+    assert [a.getDictionary() for a in snapshot.getAllAddresses()] == [a.getDictionary() for a in ipam.getAllAddresses()]
+    assert [s.getDictionary() for s in snapshot.getAllSubnets()] == [s.getDictionary() for s in ipam.getAllSubnets()]
+    assert [v.getDictionary() for v in snapshot.getAllVLANs()] == [v.getDictionary() for v in ipam.getAllVLANs()]
+
+def test_values_round_trip(tmp_path):
+    rows = [
+        {'id': 1, 'ip': '10.0.0.1', 'hostname': 'a.example.org', 'port': '007', 'big': 2 ** 62, 'flag': True, 'note': None},
+        {'id': '2', 'ip': '2001:db8::1', 'hostname': 'ñandú.example.org', 'port': '8', 'big': -5, 'flag': False},
+        {'id': 3, 'ip': 'not an address', 'hostname': '', 'port': None, 'big': 2 ** 70, 'extra': {'a': [1, 2]}},
+        {'id': 4, 'ip': None, 'hostname': None},
+    ]
+    path = str(tmp_path / 'values.snap')
+    assert ipamSnapshot.write(path, {'addresses': rows, 'subnets': []}) == {'addresses': 4, 'subnets': 0}
+    for mmap in (False, True):
+        snap = ipamSnapshot(path, mmap=mmap)
+        assert [a.getDictionary() for a in snap.getAllAddresses()] == rows
+        assert list(snap.getAllSubnets()) == []
+        assert [a.getField('id') for a in snap.findIPs(IPv4Address('10.0.0.1'))] == [1]
+        snap.close()
+
+def test_queries_match_the_service(fake, ipam, snapshot):
+    subnets = ipam.getAllSubnets()
+    subnet = subnets[1]
+    addr = ipam.findIPsbyNet(subnet)[3]
+
+    def dicts(objects):
+        return [o.getDictionary() for o in objects]
+
+    assert dicts(snapshot.findIPsbyNet(subnet)) == dicts(ipam.findIPsbyNet(subnet))
+    assert dicts(snapshot.findIPs(addr.getIP())) == dicts(ipam.findIPs(addr.getIP()))
+    assert dicts(snapshot.findIPsbyHostName(addr.getHostname())) == dicts(ipam.findIPsbyHostName(addr.getHostname()))
+    for field, pattern in (('hostname', r'host26\d\.'), ('hostname', ''), ('description', r'.*(server|printer)'), ('mac', r'02:')):
+        assert dicts(snapshot.findIPsbyField(subnet, field, pattern)) == dicts(ipam.findIPsbyField(subnet, field, pattern))
+    assert dicts(snapshot.findSubnetsbyIPMask(subnet.getBaseaddr(), subnet.getMask())) == [subnet.getDictionary()]
+    assert dicts(snapshot.findVLANbyId(3)) == dicts(ipam.findVLANbyId(3))
+    for sn in subnets:
+        assert snapshot.dns_subnet(sn) == ipam.dns_subnet(sn)
+    for fitAlg in ('FirstFit', 'BestFit', 'WorstFit'):
+        assert [a.getIP() for a in snapshot.findFree(subnet, 3, fitAlg)] == [a.getIP() for a in ipam.findFree(subnet, 3, fitAlg)]
+
+def test_snapshots_are_picklable(snapshot):
+    clone = pickle.loads(pickle.dumps(snapshot))
+    assert [a.getDictionary() for a in clone.getAllAddresses()] == [a.getDictionary() for a in snapshot.getAllAddresses()]
+    clone.close()
+
+def test_invalid_file(tmp_path):
+    path = tmp_path / 'invalid.snap'
+    path.write_bytes(b'NOTASNAP' + bytes(8))
+    with pytest.raises(Exception, match='not a phpIPAM snapshot'):
+        ipamSnapshot(str(path))
@@ -0,0 +1,109 @@
+#!/usr/bin/python3
+"""This file provides the tests of the request statistics of ipamStats against the fake service."""
+
+import re
+
+import pytest
+from phpypam.core.exceptions import PHPyPAMEntityNotFoundException
+
+from phpypamobjects.ipamStats import ipamStats, ipamSpan
+
+def test_controllers():
+    assert ipamStats.controllerOf('addresses/search/10.0.0.1') == 'addresses'
+    assert ipamStats.controllerOf('tools/scanagents/1/') == 'tools/scanagents'
+    assert ipamStats.controllerOf('/subnets/?filter_by=x') == 'subnets'
+    assert ipamStats.controllerOf('') == ''
+
+def test_measure_and_snapshot():
+    stats = ipamStats(buckets=(0.5, 0.1))
+    spans = []
+    stats.addHook(spans.append)
+    with stats.measure('GET', 'subnets/1') as span:
+        span.bytesReceived = 100
+    with pytest.raises(PHPyPAMEntityNotFoundException):
+        with stats.measure('GET', 'subnets/2'):
+            raise PHPyPAMEntityNotFoundException('No subnets found')
+    with pytest.raises(ValueError):
+        with stats.measure('PATCH', 'addresses/1/') as span:
+            span.bytesSent = 10
+            raise ValueError('broken')
+    assert [(s.method, s.controller, s.status) for s in spans] == [('GET', 'subnets', 'ok'), ('GET', 'subnets', 'notFound'), ('PATCH', 'addresses', 'error')]
+    assert isinstance(spans[2].error, ValueError)
+    snapshot = stats.snapshot()
+    assert list(snapshot) == ['addresses', 'subnets']
+    get = snapshot['subnets']['GET']
+    assert (get['count'], get['notFound'], get['errors'], get['errorRate'], get['bytesReceived']) == (2, 1, 0, 0.0, 100)
+    # The buckets are sorted and the histogram is cumulative
+    assert [bound for bound, count in get['histogram']] == [0.1, 0.5, float('inf')]
+    assert get['histogram'][-1][1] == 2
+    patch = snapshot['addresses']['PATCH']
+    assert (patch['count'], patch['errors'], patch['errorRate'], patch['bytesSent']) == (1, 1, 1.0, 10)
+    assert patch['latencyMean'] == patch['latencySum'] <= patch['latencyMax'] + 1e-9
+    stats.reset()
+    assert stats.snapshot() == {}
+
+def test_failing_hooks_are_logged(caplog):
+    stats = ipamStats()
+    calls = []
+
+    def failing(span:ipamSpan) -> None:
+        raise RuntimeError('hook failed')
+
+    stats.addHook(failing)
+    stats.addHook(calls.append)
+    with stats.measure('GET', 'vlan'):
+        pass
+    assert len(calls) == 1 and 'hook failed' in caplog.text
+    stats.removeHook(failing)
+    stats.removeHook(calls.append)
+    with stats.measure('GET', 'vlan'):
+        pass
+    assert len(calls) == 1
+    assert stats.snapshot()['vlan']['GET']['count'] == 2
+
+def test_prometheus():
+    stats = ipamStats(buckets=(0.1,))
+    with stats.measure('GET', 'tools/scan"agents') as span:
+        span.bytesSent = 7
+    text = stats.toPrometheus(prefix='test')
+    labels = 'controller="tools/scan\\"agents",method="GET"'
+    assert '# TYPE test_requests_total counter' in text
+    assert f'test_requests_total{{{labels}}} 1' in text
+    assert f'test_sent_bytes_total{{{labels}}} 7' in text
+    assert f'test_request_duration_seconds_bucket{{{labels},le="0.1"}} 1' in text
+    assert f'test_request_duration_seconds_bucket{{{labels},le="+Inf"}} 1' in text
+    assert f'test_request_duration_seconds_count{{{labels}}} 1' in text
+    assert re.search(rf'test_request_duration_seconds_sum{{{re.escape(labels)}}} [0-9.e-]+\n', text)
+    assert text.endswith('\n')
+
+def test_requests_are_recorded(fake, ipam):
+    stats = ipam.getRequestStats()
+    stats.reset()
+    subnet = ipam.getAllSubnets()[0]
+    addr = ipam.findIPsbyNet(subnet)[0]
+    ipam.findIPs(addr.getIP())
+    assert ipam.findVLANbyId(9999) == []
+    addr.setDescription('a description written as a parameter')
+    ipam.updateAddress(addr)
+    snapshot = stats.snapshot()
+    assert snapshot['subnets']['GET']['count'] == 2
+    assert snapshot['addresses']['GET']['count'] == 1
+    assert snapshot['vlan']['GET']['notFound'] == 1
+    # The fields of updates are sent as parameters of the query string
+    patch = snapshot['addresses']['PATCH']
+    assert patch['count'] == 1
+    assert patch['bytesSent'] >= len('description=a+description+written+as+a+parameter')
+    assert patch['bytesReceived'] > 0
+
+def test_retries_after_expired_tokens_are_recorded(fake, ipam):
+    stats = ipam.getRequestStats()
+    spans = []
+    stats.addHook(spans.append)
+    fake.expireTokens()
+    ipam.getAllSubnets()
+    assert [(s.method, s.controller, s.status) for s in spans] == [('GET', 'subnets', 'error'), ('POST', 'user', 'ok'), ('GET', 'subnets', 'ok')]
+    spans.clear()
+    fake.expireTokens()
+    list(ipam.iterIPsbyNet(ipam.getAllSubnets()[0]))
+    assert [(s.method, s.controller, s.status) for s in spans] == [('GET', 'subnets', 'error'), ('POST', 'user', 'ok'),
+                                                                   ('GET', 'subnets', 'ok'), ('GET', 'subnets', 'ok')]
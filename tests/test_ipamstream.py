@@ -0,0 +1,115 @@
+#!/usr/bin/python3
+"""This file provides the tests of the incremental parser of the responses of the service and of the streamed iterators."""
+
+import json, time
+
+import pytest
+from phpypam.core.exceptions import PHPyPAMEntityNotFoundException, PHPyPAMInvalidSyntax
+
+from phpypamobjects.ipamStats import ipamSpan
+from phpypamobjects.ipamTransport import _JSONStream
+
+ROWS = [
+    {'id': 1, 'ip': '10.0.0.1', 'big': 12345678901234567890, 'neg': -42, 'float': -1.5e-10, 'zero': 0, 'flag': True, 'none': None},
+    {'id': 2, 'hostname': 'ñandú.example.org', 'emoji': '\U0001F600', 'text': 'a "quoted" \\ back\nslash\ttab', 'list': [1, [2, {}]]},
+    {'id': 3, 'escaped': 'é€', 'empty': '', 'nested': {'a': {'b': []}}},
+]
+
+def _chunks(text:str, size:int):
+    data = text.encode()
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+def _parse(text:str, size:int):
+    stream = _JSONStream(_chunks(text, size))
+    return list(stream.items()), stream.fields
+
+@pytest.mark.parametrize('size', [1, 2, 3, 5, 7, 64, 100000])
+@pytest.mark.parametrize('ensure_ascii', [False, True])
+def test_rows_split_across_chunks(size, ensure_ascii):
+    # Multi-byte characters, escapes and numbers are split at every position with chunks of one byte
+    text = json.dumps({'code': 200, 'success': True, 'data': ROWS, 'time': 0.25}, ensure_ascii=ensure_ascii)
+    assert _parse(text, size) == (ROWS, {'code': 200, 'success': True, 'time': 0.25})
+
+@pytest.mark.parametrize('size', [1, 4, 100000])
+def test_numbers_at_the_end_of_chunks(size):
+    # Numbers are only complete when the next character arrives
+    text = '{"data":[1,23,-456,7.5e3,8E-2,0],"n":123456}'
+    assert _parse(text, size) == ([1, 23, -456, 7.5e3, 8E-2, 0], {'n': 123456})
+
+@pytest.mark.parametrize('size', [1, 100000])
+def test_single_object(size):
+    text = json.dumps({'code': 200, 'success': True, 'data': ROWS[1], 'time': 0.1}, indent=2, ensure_ascii=False)
+    assert _parse(text, size) == ([ROWS[1]], {'code': 200, 'success': True, 'time': 0.1})
+
+@pytest.mark.parametrize('text', ['{"code":200,"success":true,"data":[]}', '{ "data" : [ ] , "code" : 200 }', '{}'])
+def test_empty_data(text):
+    stream = _JSONStream(_chunks(text, 1))
+    assert list(stream.items()) == []
+
+def test_fields_before_the_data():
+    # Errors are reported before the data, so they are known before decoding any element
+    stream = _JSONStream(_chunks('{"code":401,"success":false,"message":"Token expired"}', 3))
+    assert stream.head() is None
+    assert stream.fields == {'code': 401, 'success': False, 'message': 'Token expired'}
+    stream = _JSONStream(_chunks('{"code":500,"success":false,"data":"not a list","message":"Error"}', 3))
+    assert stream.head() is None
+    assert stream.fields == {'code': 500, 'success': False, 'data': 'not a list', 'message': 'Error'}
+    stream = _JSONStream(iter([b'{"code":200,"success":true,"data":[{"id":1}', b'{"broken']))
+    assert stream.head() == '['
+    assert stream.fields == {'code': 200, 'success': True}
+
+@pytest.mark.parametrize('text', ['', '[1]', '{"data":[1,}', '{"data":[{"id":1}'])
+def test_invalid_responses(text):
+    with pytest.raises(ValueError):
+        _parse(text, 2)
+
+def test_iter_entity_matches_get_entity(fake, ipam):
+    assert list(ipam.pi.iter_entity(controller='addresses')) == ipam.pi.get_entity(controller='addresses')
+    assert list(ipam.pi.iter_entity(controller='subnets', controller_path='1')) == [ipam.pi.get_entity(controller='subnets', controller_path='1')]
+    # Small chunks split the rows
+    assert list(ipam.pi.iter_entity(controller='subnets', chunkSize=7)) == ipam.pi.get_entity(controller='subnets')
+
+def test_iter_entity_errors(fake, ipam):
+    # Errors are raised before yielding anything
+    with pytest.raises(PHPyPAMEntityNotFoundException):
+        next(ipam.pi.iter_entity(controller='addresses', controller_path='search_hostname/missing.example.org'))
+    with pytest.raises(PHPyPAMEntityNotFoundException):
+        next(ipam.pi.iter_entity(controller='subnets', controller_path='999'))
+    with pytest.raises(PHPyPAMInvalidSyntax):
+        next(ipam.pi.iter_entity(controller='subnets', controller_path='1/invalid'))
+    assert list(ipam.iterIPsbyField(ipam.getAllSubnets()[0], 'hostname', 'missing')) == []
+
+def test_token_renewal_while_iterating(fake, ipam):
+    addresses = []
+    for addr in ipam.iterAllAddresses():
+        addresses.append(addr)
+        if len(addresses) % 10 == 5:
+            # The token expires while the addresses of a subnet are being processed
+            fake.expireTokens()
+    assert [a.getDictionary() for a in addresses] == [a.getDictionary() for a in ipam.getAllAddresses()]
+    assert fake.requests[('POST', 'user')] == 5
+    parallel = list(ipam.iterAllAddresses(maxWorkers=3))
+    assert [a.getDictionary() for a in parallel] == [a.getDictionary() for a in addresses]
+
+def test_time_processing_entities_is_not_latency(fake, ipam):
+    stats = ipam.getRequestStats()
+    stats.reset()
+    spans = []
+    stats.addHook(spans.append)
+    for addr in ipam.pi.iter_entity(controller='subnets', controller_path='1/addresses'):
+        time.sleep(0.02)
+    assert [(s.method, s.controller, s.status) for s in spans] == [('GET', 'subnets', 'ok')]
+    assert spans[0].duration < 0.1
+    assert spans[0].bytesReceived > 0
+    # A span paused when it finishes ends when it was paused
+    span = ipamSpan('GET', 'subnets', 'subnets')
+    span.pause()
+    time.sleep(0.05)
+    span.finish()
+    assert span.duration < 0.05
+    span = ipamSpan('GET', 'subnets', 'subnets')
+    span.pause()
+    time.sleep(0.05)
+    span.resume()
+    span.finish()
+    assert span.duration < 0.05
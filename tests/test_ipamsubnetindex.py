@@ -0,0 +1,41 @@
+#!/usr/bin/python3
+"""This file provides the tests of the lookups of ipamSubnetIndex."""
+
+from ipaddress import ip_address, ip_network
+
+import pytest
+
+from phpypamobjects import ipamSubnet, ipamSubnetIndex
+
+def _subnet(id:int, net:str) -> ipamSubnet:
+    network = ip_network(net)
+    return ipamSubnet({'id': id, 'subnet': str(network.network_address), 'mask': str(network.prefixlen), 'description': net})
+
+@pytest.fixture
+def index():
+    return ipamSubnetIndex([_subnet(1, '0.0.0.0/0'), _subnet(2, '10.0.0.0/8'), _subnet(3, '10.1.0.0/16'),
+                            _subnet(4, '10.1.2.0/24'), _subnet(5, '192.168.0.0/24'), _subnet(6, '2001:db8::/32')])
+
+def _ids(subnets):
+    return [s.getId() for s in subnets]
+
+def test_longest_match(index):
+    assert index.longestMatch(ip_address('10.1.2.3')).getId() == 4
+    assert index.longestMatch(ip_address('10.2.0.1')).getId() == 2
+    assert index.longestMatch(ip_address('172.16.0.1')).getId() == 1
+    assert index.longestMatch(ip_address('2001:db8::1')).getId() == 6
+    assert index.longestMatch(ip_address('2001:db9::1')) is None
+
+def test_supernets(index):
+    assert _ids(index.supernets(ip_address('10.1.2.3'))) == [1, 2, 3, 4]
+    assert _ids(index.supernets(ip_network('10.1.2.0/24'))) == [1, 2, 3]
+    assert _ids(index.supernets(_subnet(7, '10.1.0.0/16'))) == [1, 2]
+    # Nothing contains the whole address space
+    assert index.supernets(ip_network('0.0.0.0/0')) == []
+    assert index.supernets(ip_network('::/0')) == []
+
+def test_children(index):
+    assert _ids(index.children(ip_network('10.0.0.0/8'))) == [3, 4]
+    assert _ids(index.children(ip_network('0.0.0.0/0'))) == [2, 3, 4, 5]
+    assert index.children(ip_network('10.1.2.0/24')) == []
+    assert len(index) == 6
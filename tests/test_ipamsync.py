@@ -0,0 +1,48 @@
+#!/usr/bin/python3
+"""This file provides the tests of the incremental replica of ipamSync against the fake service."""
+
+from phpypamobjects import ipamSync
+
+def _events(changes):
+    return sorted((event, (new or old).getId()) for event, new, old in changes)
+
+def test_first_sync_adds_everything(fake, ipam):
+    replica = ipamSync(ipam)
+    changes = replica.sync()
+    assert sum(1 for event, new, old in changes if event == 'subnetAdded') == 4
+    assert sum(1 for event, new, old in changes if event == 'added') == 40
+    assert replica.sync() == []
+    assert replica.getStats()['skipped'] == 4
+
+def test_scans_are_not_subnet_changes(fake, ipam):
+    replica = ipamSync(ipam)
+    replica.sync()
+    subnet = ipam.getAllSubnets()[0]
+    ipam.updateSubnetLastScan(subnet)
+    fake.requests.clear()
+    assert replica.sync() == []
+    # The addresses of the scanned subnet are fetched again
+    assert fake.requests[('GET', 'subnets')] == 2
+    assert replica.getSubnets()[0].getField('lastScan') == subnet.getField('lastScan')
+
+def test_changes_are_reported(fake, ipam):
+    replica = ipamSync(ipam, maxAge=0)
+    replica.sync()
+    subnet = ipam.getAllSubnets()[1]
+    addresses = ipam.findIPsbyNet(subnet)
+    addresses[0].setHostname('changed.example.org')
+    ipam.updateAddress(addresses[0])
+    ipam.unregisterIP(addresses[1])
+    ipam.pi.update_entity(controller='subnets', controller_path=f'{subnet.getId()}', params={'description': 'changed'})
+    assert _events(replica.sync()) == sorted([('changed', addresses[0].getId()), ('removed', addresses[1].getId()),
+                                              ('subnetChanged', subnet.getId())])
+
+def test_replica_is_saved(fake, ipam, tmp_path):
+    path = str(tmp_path / 'replica.json')
+    replica = ipamSync(ipam, path=path)
+    replica.sync()
+    loaded = ipamSync(ipam, path=path)
+    assert [a.getDictionary() for a in loaded.getAddresses()] == [a.getDictionary() for a in replica.getAddresses()]
+    fake.requests.clear()
+    assert loaded.sync() == []
+    assert fake.requests[('GET', 'subnets')] == 1
@@ -0,0 +1,112 @@
+#!/usr/bin/python3
+"""This file provides the tests of the renewal and sharing of authentication tokens against the fake service."""
+
+import asyncio, json, time
+
+import pytest
+
+from ipamfakeserver import ipamFakeServer
+from phpypamobjects import ipamServer
+from phpypamobjects.ipamTransport import ipamTokenStore
+
+def _connect(fake, **kwargs) -> ipamServer:
+    return ipamServer(url=fake.url, app_id=fake.appId, user=fake.user, password=fake.password, cacert='NONE', **kwargs)
+
+def test_expired_token_is_renewed(fake, ipam):
+    assert fake.requests[('POST', 'user')] == 1
+    fake.expireTokens()
+    assert len(ipam.getAllSubnets()) == 4
+    assert fake.requests[('POST', 'user')] == 2
+    # Streamed responses are also retried
+    fake.expireTokens()
+    assert len(list(ipam.iterIPsbyNet(ipam.getAllSubnets()[0]))) == 10
+    assert fake.requests[('POST', 'user')] == 3
+
+def test_writes_are_retried_after_renewal(fake, ipam):
+    addr = ipam.findIPsbyNet(ipam.getAllSubnets()[0])[0]
+    addr.setHostname('renewed.example.org')
+    fake.expireTokens()
+    ipam.updateAddress(addr)
+    assert fake.requests[('PATCH', 'addresses')] == 2
+    assert ipam.findIPs(addr.getIP())[0].getHostname() == 'renewed.example.org'
+
+def test_threads_share_one_renewal(fake, ipam):
+    subnets = ipam.getAllSubnets()
+    fake.expireTokens()
+    results = list(ipam.parallelMap('findIPsbyNet', subnets, maxWorkers=4))
+    assert all(error is None and len(addresses) == 10 for sn, addresses, error in results)
+    assert fake.requests[('POST', 'user')] == 2
+
+def test_token_file_is_shared(fake, tmp_path):
+    path = str(tmp_path / 'token.json')
+    first = _connect(fake, tokenCache=path)
+    second = _connect(fake, tokenCache=path)
+    assert fake.requests[('POST', 'user')] == 1
+    # A token renewed by one client is used by the other without login
+    fake.expireTokens()
+    first.getAllSubnets()
+    second.getAllSubnets()
+    assert fake.requests[('POST', 'user')] == 2
+
+def test_token_file_is_shared_by_configurations(tmp_path):
+    path = str(tmp_path / 'token.json')
+    with ipamFakeServer(subnets=2, addresses=4, user='alice', seed=1) as one, ipamFakeServer(subnets=3, addresses=6, user='bob', appId='other', seed=2) as other:
+        first = _connect(one, tokenCache=path)
+        second = _connect(other, tokenCache=path)
+        # Every configuration logs in with its own token instead of using the token of the other service
+        assert one.requests[('POST', 'user')] == 1 and other.requests[('POST', 'user')] == 1
+        assert len(first.getAllSubnets()) == 2 and len(second.getAllSubnets()) == 3
+        assert one.requests[('POST', 'user')] == 1 and other.requests[('POST', 'user')] == 1
+        # Renewing the token of a configuration keeps the token of the other one
+        one.expireTokens()
+        first.getAllSubnets()
+        second.getAllSubnets()
+        assert one.requests[('POST', 'user')] == 2 and other.requests[('POST', 'user')] == 1
+        assert len(_connect(one, tokenCache=path).getAllSubnets()) == 2
+        assert one.requests[('POST', 'user')] == 2
+        with open(path) as f:
+            assert sorted(json.load(f)) == [f'alice@{one.url}/api/app', f'bob@{other.url}/api/other']
+
+def test_token_store_keys(tmp_path):
+    path = str(tmp_path / 'token.json')
+    first = ipamTokenStore(path, key=ipamTokenStore.keyOf('https://ipam.example.org/', 'app', 'alice'))
+    second = ipamTokenStore(path, key=ipamTokenStore.keyOf('https://ipam.example.org', 'app', 'bob'))
+    assert first.key == 'alice@https://ipam.example.org/api/app'
+    first.save('abc', 0.0)
+    second.reload()
+    assert not second.isValid()
+    second.save('def', 0.0)
+    first.reload()
+    assert first.token == 'abc'
+    # Files written in other formats are replaced
+    with open(path, 'w') as f:
+        json.dump({'token': 'old', 'expires': 0.0}, f)
+    first.reload()
+    assert first.token == 'abc'
+    first.save('ghi', 0.0)
+    with open(path) as f:
+        assert json.load(f) == {first.key: {'token': 'ghi', 'expires': 0.0}}
+
+def test_token_store():
+    store = ipamTokenStore()
+    assert not store.isValid()
+    store.save('abc', time.time() + 100)
+    assert store.isValid()
+    assert not store.isValid(margin=200)
+    # Tokens without expiration date are valid until the service rejects them
+    store.save('abc', 0.0)
+    assert store.isValid(margin=200)
+
+def test_async_token_is_renewed(fake):
+    pytest.importorskip('aiohttp')
+    from phpypamobjects import ipamAsyncServer
+
+    async def run():
+        async with ipamAsyncServer(url=fake.url, app_id=fake.appId, user=fake.user, password=fake.password, cacert='NONE') as ipam:
+            subnets = await ipam.getAllSubnets()
+            fake.expireTokens()
+            lists = await asyncio.gather(*[ipam.findIPsbyNet(sn) for sn in subnets])
+            return [len(addresses) for addresses in lists]
+
+    assert asyncio.run(run()) == [10, 10, 10, 10]
+    assert fake.requests[('POST', 'user')] == 2
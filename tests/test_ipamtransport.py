@@ -0,0 +1,101 @@
+#!/usr/bin/python3
+"""This file provides the tests of the retries, timeouts and SSL contexts of the sessions of ipamApi against the fake service."""
+
+import shutil, ssl, subprocess, time
+
+import pytest
+import requests
+
+from ipamfakeserver import ipamFakeServer
+from phpypamobjects import ipamServer
+
+def _connect(fake, url:str = '', **kwargs) -> ipamServer:
+    return ipamServer(url=url or fake.url, app_id=fake.appId, user=fake.user, password=fake.password, **{'cacert': 'NONE', **kwargs})
+
+def test_gets_are_retried_on_5xx(fake):
+    ipam = _connect(fake, retries=3, backoff=0.1)
+    subnet = ipam.getAllSubnets()[0]
+    fake.requests.clear()
+    fake.errorRate = 1.0
+    t0 = time.perf_counter()
+    with pytest.raises(Exception, match='Injected error'):
+        ipam.findIPsbyNet(subnet)
+    elapsed = time.perf_counter() - t0
+    assert fake.requests[('GET', 'subnets')] == 4
+    # No wait before the first retry, then the backoff doubles: 0.2 + 0.4 seconds
+    assert 0.6 <= elapsed < 2.0
+    # Writes are not idempotent and they are never retried
+    fake.errorRate = 0.0
+    address = ipam.findIPsbyNet(subnet)[0]
+    fake.errorRate = 1.0
+    address.setDescription('not retried')
+    with pytest.raises(Exception, match='Injected error'):
+        ipam.updateAddress(address)
+    assert fake.requests[('PATCH', 'addresses')] == 1
+
+@pytest.mark.parametrize('errorCode', [500, 502, 503, 504])
+def test_transient_errors_are_hidden_by_retries(errorCode):
+    with ipamFakeServer(subnets=4, addresses=40, errorCode=errorCode, seed=7) as fake:
+        ipam = _connect(fake, retries=10, backoff=0.0)
+        expected = [[a.getIP() for a in ipam.findIPsbyNet(sn)] for sn in ipam.getAllSubnets()]
+        fake.requests.clear()
+        fake.errorRate = 0.5
+        for _ in range(3):
+            assert [[a.getIP() for a in ipam.findIPsbyNet(sn)] for sn in ipam.getAllSubnets()] == expected
+        # Every call was answered, but some of them after failed attempts
+        assert fake.requests[('GET', 'subnets')] > 15
+
+def test_no_retries(fake):
+    ipam = _connect(fake, retries=0)
+    fake.requests.clear()
+    fake.errorRate = 1.0
+    with pytest.raises(Exception, match='Injected error'):
+        ipam.getAllSubnets()
+    assert fake.requests[('GET', 'subnets')] == 1
+
+def test_read_timeouts(fake):
+    ipam = _connect(fake, readTimeout=0.1, retries=0)
+    retried = _connect(fake, readTimeout=0.1, retries=2, backoff=0.0)
+    fake.latency = 0.5
+    t0 = time.perf_counter()
+    with pytest.raises(requests.exceptions.ConnectionError):
+        ipam.getAllSubnets()
+    assert time.perf_counter() - t0 < 0.45
+    # Timed out GETs are retried as errors of the connection
+    fake.requests.clear()
+    with pytest.raises(requests.exceptions.ConnectionError):
+        retried.getAllSubnets()
+    assert fake.requests[('GET', 'subnets')] == 3
+    fake.latency = 0.0
+    assert len(retried.getAllSubnets()) == 4
+
+@pytest.mark.filterwarnings('ignore::urllib3.exceptions.InsecureRequestWarning')
+def test_ssl_contexts(tmp_path):
+    assert ipamServer._sslContext('NONE').verify_mode == ssl.CERT_NONE
+    assert not ipamServer._sslContext('NONE').check_hostname
+    if shutil.which('openssl') is None:
+        pytest.skip('openssl is not installed')
+    cert, key = tmp_path / 'cert.pem', tmp_path / 'key.pem'
+    subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1', '-subj', '/CN=127.0.0.1',
+                    '-addext', 'subjectAltName=IP:127.0.0.1', '-keyout', str(key), '-out', str(cert)],
+                   check=True, capture_output=True)
+    context = ipamServer._sslContext(str(cert))
+    assert context.verify_mode == ssl.CERT_REQUIRED and context.check_hostname
+    serverContext = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    serverContext.load_cert_chain(str(cert), str(key))
+    with ipamFakeServer(subnets=4, addresses=40) as fake:
+        # Serve the fake service over TLS
+        fake._httpd.socket = serverContext.wrap_socket(fake._httpd.socket, server_side=True)
+        url = fake.url.replace('http://', 'https://')
+        # The connections of the sessions of the server and of its threads are created with its SSL context
+        ipam = _connect(fake, url=url, cacert=str(cert))
+        assert all(e is None for _, _, e in ipam.parallelMap('findIPsbyNet', ipam.getAllSubnets(), maxWorkers=2))
+        assert ipam.pi._session.get_adapter(url)._sslContext.verify_mode == ssl.CERT_REQUIRED
+        assert len(_connect(fake, url=url).getAllSubnets()) == 4
+        # Servers whose certificate is not signed by the CA are rejected
+        other = tmp_path / 'other.pem'
+        subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1', '-subj', '/CN=other',
+                        '-keyout', str(tmp_path / 'otherkey.pem'), '-out', str(other)], check=True, capture_output=True)
+        with pytest.raises(Exception) as error:
+            _connect(fake, url=url, cacert=str(other))
+        assert isinstance(error.value.__cause__, requests.exceptions.SSLError)